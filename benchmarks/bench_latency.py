@@ -0,0 +1,229 @@
+"""End-to-end latency from a tray window dial change to CamillaDSP applying the new gain.
+
+Drives TrayWindow dials against the in-process FakeCamillaDSP and measures, per
+change, the time from valueChanged to the fake engine holding the new config
+(after PatchConfig in live mode, or after the file save and Reload otherwise).
+This covers the debounce timer, the command executor, YAML writes and the
+websocket round trips.
+
+Run from the repository root (uses the offscreen Qt platform unless one is set):
+    python benchmarks/bench_latency.py [--samples 200] [--delay 0] [--scenario live reload ...]
+"""
+import argparse
+import ctypes
+import itertools
+import logging
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PySide6  # noqa: E402
+from PySide6.QtCore import QEventLoop  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from bench_serialization import make_config  # noqa: E402
+from bench_suite import normalize  # noqa: E402
+from fake_camilladsp import FAIL_ERROR, FakeCamillaDSP  # noqa: E402
+from cameliaeq import settings as settings_module  # noqa: E402
+from cameliaeq.app import create_command_executor  # noqa: E402
+from cameliaeq.camilla_client import close_all_clients  # noqa: E402
+from cameliaeq.camilla_dsp import DEFAULT_FILTERS, save_camilla_dsp_yaml  # noqa: E402
+from cameliaeq.controller import EqController  # noqa: E402
+from cameliaeq.profiles import ProfileStore  # noqa: E402
+from cameliaeq.tray_window import TrayWindow  # noqa: E402
+
+SAMPLE_TIMEOUT = 5.0  # seconds
+# Devices the switch scenario alternates between, starting from the initial "Speakers"
+SWITCH_DEVICES = ("Headphones", "Speakers")
+
+# These PySide6 builds return None and True without a new reference, so every void call or
+# Signal.emit() drops one. Before Python 3.12 these objects are not immortal and a long run
+# aborts with "none_dealloc", unless their reference counts are topped up as they go.
+LEAKY_PYSIDE6_VERSIONS = ("6.12.0",)
+LEAKY_SINGLETONS = sys.version_info < (3, 12) and PySide6.__version__ in LEAKY_PYSIDE6_VERSIONS
+SINGLETON_REFCOUNT_FLOOR = 1 << 20
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    live_mode: bool = True
+    # Drop the websocket before every change, as if CamillaDSP had restarted
+    reconnect: bool = False
+    # Reject every PatchConfig, forcing the save-and-reload fallback
+    reject_patch: bool = False
+    # Intermediate dial positions before the measured one, like dragging the dial
+    drag_steps: int = 0
+    # Switch the playback device back and forth instead of turning dials
+    switch_device: bool = False
+
+
+SCENARIOS = {s.name: s for s in (
+    Scenario("live", "PatchConfig per change"),
+    Scenario("live-drag", "5 quick steps per change, coalesced by the debounce", drag_steps=5),
+    Scenario("reload", "live mode off: YAML save + Reload", live_mode=False),
+    Scenario("reconnect", "live, websocket dropped before every change", reconnect=True),
+    Scenario("patch-fallback", "PatchConfig rejected, falls back to save + Reload", reject_patch=True),
+    Scenario("switch", "device switch: profile + config + settings write, Reload", switch_device=True),
+)}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    # Nearest rank
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def top_up_singletons() -> None:
+    """Give None, True and False back the references a leaky PySide6 build dropped.
+
+    Runs with the GIL held, like every decref of them; costs no memory, unlike holding references.
+    """
+    for singleton in (None, True, False):
+        refcount = ctypes.c_ssize_t.from_address(id(singleton))
+        if refcount.value < SINGLETON_REFCOUNT_FLOOR:
+            refcount.value += SINGLETON_REFCOUNT_FLOOR
+
+
+def pump_events(app: QApplication, done: threading.Event, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not done.is_set():
+        if LEAKY_SINGLETONS:
+            top_up_singletons()
+        app.processEvents(QEventLoop.AllEvents, 5)
+        if done.wait(0.0002):
+            break
+        if time.perf_counter() > deadline:
+            return False
+    return True
+
+
+def run_scenario(app: QApplication, scenario: Scenario, samples: int, delay: float, interval: float,
+                 filters: int, workdir: str) -> tuple:
+    config_path = os.path.join(workdir, f"{scenario.name}.yml")
+    save_camilla_dsp_yaml(config_path, normalize(make_config(filters)))
+    server = FakeCamillaDSP(config_path=config_path, delay=delay).start()
+
+    target = {}
+    applied = threading.Event()
+
+    def on_config_applied(config):
+        try:
+            if scenario.switch_device:
+                done = config["devices"]["playback"]["device"] == target["device"]
+            else:
+                done = config["filters"][target["name"]]["parameters"]["gain"] == target["gain"]
+        except (KeyError, TypeError):
+            return
+        if done and not applied.is_set():
+            target["acked"] = time.perf_counter()
+            applied.set()
+
+    server.on_config_applied = on_config_applied
+    settings = settings_module.Settings(
+        config_path=config_path,
+        port=server.port,
+        playback_device="Speakers",
+        devices=ProfileStore(os.path.join(workdir, f"{scenario.name}-profiles")),
+        live_mode=scenario.live_mode,
+    )
+    controller = EqController(settings)
+    executor = create_command_executor(controller)
+    window = TrayWindow(settings, controller, executor)
+    # Let the initial read settle before measuring
+    pump_events(app, threading.Event(), 0.05)
+
+    latencies = []
+    timeouts = 0
+    bands = itertools.cycle(DEFAULT_FILTERS)
+    devices = itertools.cycle(SWITCH_DEVICES)
+    try:
+        for i in range(samples):
+            if scenario.switch_device:
+                applied.clear()
+                target.update(device=next(devices))
+                start = time.perf_counter()
+                # What TrayWindow.select_device submits
+                executor.submit("device", "playback", (target["device"], window.dial_gains()))
+                if pump_events(app, applied, SAMPLE_TIMEOUT):
+                    latencies.append(target["acked"] - start)
+                else:
+                    timeouts += 1
+                continue
+            name = next(bands)
+            dial = window.knobs[name]
+            value = (dial.value() + 16 + 7 + i % 5) % 33 - 16
+            if scenario.reconnect:
+                server.drop_connections()
+            if scenario.reject_patch:
+                server.fail_next("PatchConfig", mode=FAIL_ERROR)
+            for step in range(scenario.drag_steps, 0, -1):
+                dial.setValue((value + 16 + step) % 33 - 16)
+                app.processEvents()
+            applied.clear()
+            target.update(name=name, gain=float(value))
+            start = time.perf_counter()
+            dial.setValue(value)
+            if pump_events(app, applied, SAMPLE_TIMEOUT):
+                latencies.append(target["acked"] - start)
+            else:
+                timeouts += 1
+            if interval:
+                pump_events(app, threading.Event(), interval)
+    finally:
+        window.flush_pending_persist()
+        executor.stop()
+        window.deleteLater()
+        server.stop()
+        close_all_clients()
+    return latencies, timeouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200, help="changes per scenario")
+    parser.add_argument("--delay", type=float, default=0.0, help="fake CamillaDSP reply delay in ms")
+    parser.add_argument("--interval", type=float, default=20.0, help="pause between changes in ms")
+    parser.add_argument("--filters", type=int, default=3, help="extra filters in the synthetic config")
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    if LEAKY_SINGLETONS:
+        print(f"Warning: PySide6 {PySide6.__version__} drops references to None and True on Python "
+              f"{platform.python_version()}; they are topped up while events are processed, but "
+              f"other code paths may still abort in none_dealloc.", file=sys.stderr)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # Injected failures log warnings; keep the report readable
+    logging.getLogger("cameliaeq").setLevel(logging.ERROR)
+    workdir = tempfile.mkdtemp(prefix="cameliaeq-latency-")
+    # Keep the user's settings.yml out of it
+    settings_module.SETTINGS_PATH = os.path.join(workdir, "settings.yml")
+    settings_module.PROFILES_DIR = os.path.join(workdir, "profiles")
+
+    print(f"{'scenario':<16} {'n':>5} {'lost':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  description")
+    for name in args.scenario:
+        scenario = SCENARIOS[name]
+        latencies, timeouts = run_scenario(app, scenario, args.samples, args.delay / 1000,
+                                           args.interval / 1000, args.filters, workdir)
+        latencies.sort()
+        if latencies:
+            p50, p90, p99 = (percentile(latencies, f) * 1000 for f in (0.5, 0.9, 0.99))
+            print(f"{name:<16} {len(latencies):>5} {timeouts:>5} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} "
+                  f"{latencies[-1] * 1000:>8.2f}  {scenario.description}")
+        else:
+            print(f"{name:<16} {0:>5} {timeouts:>5} {'-':>8} {'-':>8} {'-':>8} {'-':>8}  {scenario.description}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Micro-benchmark of the YAML serialization layer and the config normalization path.
+
+Compares the previous approach (pure-Python safe_load/safe_dump, copies made by
+dumping and re-parsing YAML) with cameliaeq.yaml_io (libyaml loader/dumper when
+available, structural copies) on synthetic configs of growing size.
+
+Run from the repository root:
+    python benchmarks/bench_serialization.py [--filters 3 100 1000] [--repeat 5]
+"""
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cameliaeq.camilla_dsp import (  # noqa: E402
+    DEFAULT_FILTERS,
+    ensure_devices_section,
+    ensure_filters_and_pipelines,
+    ensure_mixers_and_processors,
+)
+from cameliaeq.yaml_io import SafeLoader, copy_config, dump_yaml, load_yaml  # noqa: E402
+
+MIN_SAMPLE_TIME = 0.05  # seconds
+
+
+def make_config(filters: int) -> dict:
+    """A CamillaDSP-like config with the given number of extra Biquad filters, without the EQ bands."""
+    cfg = {
+        "devices": {
+            "samplerate": 44100,
+            "chunksize": 256,
+            "capture": {"type": "CoreAudio", "channels": 2, "device": "BlackHole 2ch"},
+            "playback": {"type": "CoreAudio", "channels": 2, "device": "Speakers"},
+        },
+        "filters": {},
+        "mixers": {
+            "stereo": {
+                "channels": {"in": 2, "out": 2},
+                "mapping": [{"dest": ch, "sources": [{"channel": ch, "gain": 0, "inverted": False}]} for ch in (0, 1)],
+            }
+        },
+        "pipeline": [{"type": "Mixer", "name": "stereo"}],
+    }
+    for i in range(filters):
+        name = f"peq_{i}"
+        cfg["filters"][name] = {
+            "type": "Biquad",
+            "description": f"Band {i}",
+            "parameters": {"type": "Peaking", "freq": 20 + i * 19.5, "q": 1.41, "gain": (i % 13) - 6},
+        }
+        cfg["pipeline"].append({"type": "Filter", "channels": [0, 1], "names": [name], "bypassed": None, "description": None})
+    return cfg
+
+
+def legacy_copy(value):
+    return yaml.safe_load(yaml.safe_dump(value))
+
+
+def normalize_legacy(cfg: dict) -> None:
+    # Same work as ensure_filters_and_pipelines used to do for missing bands
+    for name, defn in DEFAULT_FILTERS.items():
+        cfg["filters"][name] = legacy_copy(defn)
+    ensure_filters_and_pipelines(cfg)
+    ensure_devices_section(cfg, "Speakers")
+    ensure_mixers_and_processors(cfg)
+
+
+def normalize_current(cfg: dict) -> None:
+    ensure_filters_and_pipelines(cfg)
+    ensure_devices_section(cfg, "Speakers")
+    ensure_mixers_and_processors(cfg)
+
+
+def best_of(func, repeat: int) -> float:
+    number = 1
+    # Grow the loop count until one measurement takes long enough to be meaningful,
+    # however fast a single call is: timer noise then stays small relative to the sample
+    while True:
+        t = timeit.timeit(func, number=number)
+        if t >= MIN_SAMPLE_TIME:
+            break
+        number = max(number * 2, int(number * MIN_SAMPLE_TIME / max(t, 1e-9)))
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def run(filter_counts, repeat: int) -> None:
+    print(f"yaml_io loader: {SafeLoader.__name__}")
+    print(f"{'filters':>8} {'operation':<26} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for count in filter_counts:
+        cfg = make_config(count)
+        text = yaml.safe_dump(cfg, sort_keys=False)
+        cases = [
+            ("load", lambda: yaml.safe_load(text), lambda: load_yaml(text)),
+            ("dump", lambda: yaml.safe_dump(cfg, sort_keys=False), lambda: dump_yaml(cfg)),
+            ("snapshot copy", lambda: copy.deepcopy(cfg), lambda: copy_config(cfg)),
+            ("normalize (missing bands)",
+             lambda: normalize_legacy(copy_config(cfg)),
+             lambda: normalize_current(copy_config(cfg))),
+            ("load+normalize+dump",
+             lambda: yaml.safe_dump(_legacy_pipeline(text), sort_keys=False),
+             lambda: dump_yaml(_current_pipeline(text))),
+        ]
+        for label, before, after in cases:
+            b = best_of(before, repeat) * 1000
+            a = best_of(after, repeat) * 1000
+            print(f"{count:>8} {label:<26} {b:>10.3f} {a:>10.3f} {b / a if a else float('inf'):>7.1f}x")
+
+
+def _legacy_pipeline(text: str) -> dict:
+    cfg = yaml.safe_load(text)
+    normalize_legacy(cfg)
+    return cfg
+
+
+def _current_pipeline(text: str) -> dict:
+    cfg = load_yaml(text)
+    normalize_current(cfg)
+    return cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filters", type=int, nargs="+", default=[3, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.filters, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
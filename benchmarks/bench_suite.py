@@ -0,0 +1,283 @@
+"""Benchmark suite for the config normalization and apply hot path, with regression checks.
+
+Times the config helpers of cameliaeq.camilla_dsp on synthetic configs of 3 to
+1000 filters, Settings load/save with 1 to 100 device profiles, the EQ curve
+computation and playback device enumeration, then compares every case with the stored baselines and
+exits with status 1 when one got slower than the tolerance allows. Cases are timed in several
+interleaved rounds and the fastest round counts, and cases that look slower are timed again
+before they count as regressions, so a slow spell of the machine does not fail the run.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py                   # compare with benchmarks/baselines.json
+    python benchmarks/bench_suite.py --save-baseline   # record new baselines on this machine
+    python benchmarks/bench_suite.py --only settings   # cases whose name contains "settings"
+
+Baselines are only meaningful on the machine they were recorded on; record
+them again after changing hardware or Python version.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serialization import best_of, make_config  # noqa: E402
+from cameliaeq import settings as settings_module  # noqa: E402
+from cameliaeq.camilla_config import CamillaConfig  # noqa: E402
+from cameliaeq.camilla_dsp import (  # noqa: E402
+    DEFAULT_FILTERS,
+    ensure_devices_section,
+    ensure_filters_and_pipelines,
+    ensure_mixers_and_processors,
+    load_camilla_dsp_yaml,
+    optimize_pipeline,
+    read_gain,
+    save_camilla_dsp_yaml,
+    write_gain,
+)
+from cameliaeq.devices import list_system_playback_devices  # noqa: E402
+from cameliaeq.frequency_response import BiquadParameters, clear_cache, magnitude_response  # noqa: E402
+from cameliaeq.yaml_io import SafeLoader, copy_config  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+FILTER_COUNTS = (3, 30, 300, 1000)
+PROFILE_COUNTS = (1, 10, 100)
+# Relative slowdown tolerated before a case counts as a regression; allocation-heavy cases
+# differ by up to 40% between two processes on the same machine
+DEFAULT_TOLERANCE = 0.5
+# Cases bound by disk I/O and YAML parsing vary far more between runs; by case name prefix
+CASE_TOLERANCES = {
+    "load_camilla_dsp_yaml": 1.0,
+    "save_camilla_dsp_yaml": 1.0,
+    "CamillaConfig.save": 1.0,
+    "Settings.": 1.0,
+    "list_system_playback_devices": 1.0,
+}
+# Slowdowns below this are timer and scheduler noise, whatever the ratio
+NOISE_FLOOR = 20e-6  # seconds
+DEFAULT_ROUNDS = 3
+
+
+def normalize(cfg: dict) -> dict:
+    ensure_filters_and_pipelines(cfg)
+    ensure_devices_section(cfg, "Speakers")
+    ensure_mixers_and_processors(cfg)
+    return cfg
+
+
+def config_cases(workdir: str):
+    for count in FILTER_COUNTS:
+        raw = make_config(count)
+        cfg = normalize(copy_config(raw))
+        path = os.path.join(workdir, f"camilladsp_{count}.yml")
+        save_camilla_dsp_yaml(path, cfg)
+        gains = iter(range(1 << 62))
+        # Its own copy: optimizing merges the synthetic config's one-filter steps
+        optimized = copy_config(cfg)
+        optimize_pipeline(optimized)
+
+        def write_changed_gain(cfg=cfg, gains=gains):
+            # A different value on every call, so the write is never a no-op
+            write_gain(cfg, "Bass", float(next(gains) % 33 - 16))
+
+        patched_path = os.path.join(workdir, f"camilladsp_{count}_patched.yml")
+        shutil.copyfile(path, patched_path)
+        config = CamillaConfig(patched_path)
+
+        def save_changed_gain(config=config, gains=gains):
+            # Only the gain scalar changes, so the file is patched in place
+            cfg = config.load()
+            write_gain(cfg, "Bass", float(next(gains) % 33 - 16))
+            config.save(cfg)
+
+        yield f"ensure_filters_and_pipelines (fresh)[filters={count}]", lambda raw=raw: ensure_filters_and_pipelines(copy_config(raw))
+        yield f"ensure_filters_and_pipelines[filters={count}]", lambda cfg=cfg: ensure_filters_and_pipelines(cfg)
+        yield f"optimize_pipeline (fresh)[filters={count}]", lambda cfg=cfg: optimize_pipeline(copy_config(cfg))
+        yield f"optimize_pipeline[filters={count}]", lambda cfg=optimized: optimize_pipeline(cfg)
+        yield f"ensure_devices_section[filters={count}]", lambda cfg=cfg: ensure_devices_section(cfg, "Speakers")
+        yield f"ensure_mixers_and_processors[filters={count}]", lambda cfg=cfg: ensure_mixers_and_processors(cfg)
+        yield f"read_gain[filters={count}]", lambda cfg=cfg: [read_gain(cfg, name) for name in DEFAULT_FILTERS]
+        yield f"write_gain[filters={count}]", write_changed_gain
+        yield f"load_camilla_dsp_yaml[filters={count}]", lambda path=path: load_camilla_dsp_yaml(path)
+        yield f"save_camilla_dsp_yaml[filters={count}]", lambda path=path, cfg=cfg: save_camilla_dsp_yaml(path, cfg)
+        yield f"CamillaConfig.save (gain change)[filters={count}]", save_changed_gain
+
+
+def settings_cases(workdir: str):
+    for count in PROFILE_COUNTS:
+        directory = os.path.join(workdir, f"settings_{count}")
+        os.makedirs(directory)
+        settings_module.SETTINGS_PATH = os.path.join(directory, "settings.yml")
+        settings_module.PROFILES_DIR = os.path.join(directory, "profiles")
+        settings = settings_module.Settings(config_path="/tmp/camilladsp.yml", playback_device="Device 0")
+        base = normalize(make_config(30))
+        for i in range(count):
+            cfg = copy_config(base)
+            cfg["devices"]["playback"]["device"] = f"Device {i}"
+            cfg["filters"]["Bass"]["parameters"]["gain"] = float(i % 33 - 16)
+            settings.devices[f"Device {i}"] = cfg
+        settings.save()
+        ports = iter(range(1 << 62))
+        paths = (settings_module.SETTINGS_PATH, settings_module.PROFILES_DIR)
+
+        def save_changed(settings=settings, ports=ports, paths=paths):
+            # Rounds interleave the cases, so the paths of another profile count may be set
+            settings_module.SETTINGS_PATH, settings_module.PROFILES_DIR = paths
+            settings.port = 1024 + next(ports) % 60000
+            settings.save()
+
+        def load_all_profiles(paths=paths):
+            loaded = load_settings(*paths)
+            return [loaded.devices[name] for name in loaded.devices]
+
+        yield f"Settings.load[profiles={count}]", lambda paths=paths: load_settings(*paths)
+        yield f"Settings.load + all profiles[profiles={count}]", load_all_profiles
+        yield f"Settings.save[profiles={count}]", save_changed
+
+
+def load_settings(settings_path: str, profiles_dir: str):
+    settings_module.SETTINGS_PATH = settings_path
+    settings_module.PROFILES_DIR = profiles_dir
+    return settings_module.Settings.load()
+
+
+def response_cases():
+    for bands in (3, 31):
+        chain = tuple(BiquadParameters("Peaking", 20 * 1.25 ** i, float(i % 13 - 6), 4.3) for i in range(bands))
+        gains = iter(range(1 << 62))
+
+        def uncached(chain=chain):
+            clear_cache()
+            magnitude_response(chain, 44100.0)
+
+        def one_band_moved(chain=chain, gains=gains):
+            # What a dial drag costs: one band's response is new, the others come from the cache
+            moved = list(chain)
+            moved[0] = moved[0]._replace(gain=float(next(gains) % 33 - 16) + 0.5)
+            magnitude_response.cache_clear()
+            magnitude_response(tuple(moved), 44100.0)
+
+        yield f"magnitude_response (uncached)[bands={bands}]", uncached
+        yield f"magnitude_response (one band moved)[bands={bands}]", one_band_moved
+
+
+def device_cases():
+    try:
+        from PySide6.QtMultimedia import QMediaDevices  # noqa: F401
+    except Exception as e:
+        print(f"Skipping list_system_playback_devices (Qt): QtMultimedia unavailable ({e})", file=sys.stderr)
+    else:
+        yield "list_system_playback_devices (Qt)", lambda: list_system_playback_devices()
+    yield "list_system_playback_devices (system)", lambda: list_system_playback_devices(use_qt=False)
+
+
+def run(only: str, repeat: int, rounds: int, names: Optional[set] = None) -> dict:
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="cameliaeq-bench-")
+    old_paths = settings_module.SETTINGS_PATH, settings_module.PROFILES_DIR
+    try:
+        selected = []
+        for cases in (config_cases(workdir), settings_cases(workdir), response_cases(), device_cases()):
+            for name, func in cases:
+                if (not only or only.lower() in name.lower()) and (names is None or name in names):
+                    selected.append((name, func))
+        for round_number in range(1, rounds + 1):
+            print(f"Round {round_number} of {rounds}", file=sys.stderr)
+            for name, func in selected:
+                seconds = best_of(func, repeat)
+                results[name] = min(seconds, results.get(name, seconds))
+                print(f"{name:<58} {seconds * 1000:>10.3f} ms", file=sys.stderr)
+    finally:
+        settings_module.SETTINGS_PATH, settings_module.PROFILES_DIR = old_paths
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def machine_info() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "yaml_loader": SafeLoader.__name__,
+    }
+
+
+def case_tolerance(name: str, tolerance: float) -> float:
+    for prefix, case_tolerance in CASE_TOLERANCES.items():
+        if name.startswith(prefix):
+            return max(tolerance, case_tolerance)
+    return tolerance
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"{'case':<58} {'baseline ms':>12} {'now ms':>10} {'change':>8}")
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<58} {'-':>12} {seconds * 1000:>10.3f} {'new':>8}")
+            continue
+        change = seconds / before - 1 if before else 0.0
+        regressed = change > case_tolerance(name, tolerance) and seconds - before > NOISE_FLOOR
+        marker = "  REGRESSION" if regressed else ""
+        print(f"{name:<58} {before * 1000:>12.3f} {seconds * 1000:>10.3f} {change:>+7.0%}{marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINES_PATH, help="baselines JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="relative slowdown allowed before failing (default: %(default)s); "
+                             "disk-bound cases allow at least their own CASE_TOLERANCES")
+    parser.add_argument("--only", default="", help="run only cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="times every case is timed, interleaved with the others (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = run(args.only, args.repeat, args.rounds)
+
+    if args.save_baseline:
+        stored = {"machine": machine_info(), "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                stored["results"] = json.load(f).get("results", {})
+        stored["results"].update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baselines saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baselines at {args.baseline}; run with --save-baseline first")
+        return 2
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    if stored.get("machine") != machine_info():
+        print(f"Warning: baselines were recorded on {stored.get('machine')}, "
+              f"this is {machine_info()}; results are not comparable")
+    regressions = compare(results, stored.get("results", {}), args.tolerance)
+    if regressions:
+        print(f"Timing {len(regressions)} slower case(s) again")
+        again = run(args.only, args.repeat, args.rounds, set(regressions))
+        regressions = compare({name: min(results[name], again[name]) for name in regressions},
+                              stored.get("results", {}), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""In-process stand-in for CamillaDSP's websocket server, for benchmarks and manual testing.
+
+Speaks enough of RFC 6455 (text frames, ping, close) and of the CamillaDSP JSON
+protocol for CameliaEQ: GetVersion, GetState, Reload, GetConfig, GetConfigJson,
+SetConfig, SetConfigJson, PatchConfig, GetConfigFilePath, SetConfigFilePath and
+the level/load queries. Replies can be delayed, and failures injected per command.
+
+    server = FakeCamillaDSP(config_path="camilladsp.yml", delay=0.002)
+    server.start()
+    server.fail_next("PatchConfig")        # next PatchConfig answers "Error"
+    server.fail_next("Reload", mode="disconnect")
+    ...
+    server.stop()
+
+Run it standalone to point the app at it:
+    python benchmarks/fake_camilladsp.py --port 1234 --config camilladsp.yml
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cameliaeq.yaml_io import copy_config, dump_yaml, load_yaml  # noqa: E402
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+# Failure modes for fail_next()
+FAIL_ERROR = "error"  # reply with result "Error"
+FAIL_DISCONNECT = "disconnect"  # drop the connection without replying
+FAIL_TIMEOUT = "timeout"  # never reply, keep the connection open
+VERSION = "3.0.1"
+
+
+def merge_patch(target: dict, patch: dict) -> None:
+    # Same semantics as PatchConfig: nested objects are merged, anything else replaced
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = copy_config(value)
+
+
+class FakeCamillaDSP:
+    """Threaded fake CamillaDSP; every client connection gets its own thread.
+
+    on_config_applied, when set, is called from the connection thread with the new
+    active config after every command that changed it (Reload, Set*, PatchConfig),
+    just before the reply is sent.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[dict] = None,
+                 config_path: Optional[str] = None, delay: float = 0.0):
+        self.host = host
+        self.port = port
+        self.config = copy_config(config) if config is not None else None
+        self.config_path = config_path
+        self.delay = delay
+        # Per-command reply delays, overriding delay
+        self.delays: dict = {}
+        self.state = "Running"
+        # What the level/load queries report
+        self.buffer_level = 512
+        self.processing_load = 3.5
+        self.rate_adjust = 1.0
+        self.on_config_applied: Optional[Callable[[dict], None]] = None
+        self.commands: list = []  # (perf_counter, command, argument), in arrival order
+        self._failures: dict = {}
+        self._lock = threading.Lock()
+        self._sock = None
+        self._connections: set = set()
+        self._thread = None
+
+    def start(self) -> "FakeCamillaDSP":
+        if self.config is None and self.config_path:
+            self.config = self._load_file()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen()
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, name="FakeCamillaDSP", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._sock is not None:
+            sock, self._sock = self._sock, None
+            # close() alone leaves a blocked accept() running, and the port still answering
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        self.drop_connections()
+
+    def drop_connections(self) -> None:
+        """Close every client connection, like a CamillaDSP restart would."""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def fail_next(self, command: str, times: int = 1, mode: str = FAIL_ERROR) -> None:
+        """Make the next `times` requests of command fail; times=-1 fails all of them."""
+        with self._lock:
+            self._failures[command] = [times, mode]
+
+    def clear_failures(self) -> None:
+        with self._lock:
+            self._failures.clear()
+
+    # Protocol
+
+    def _serve(self) -> None:
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+    def _handle_connection(self, conn: socket.socket) -> None:
+        try:
+            self._handshake(conn)
+            while True:
+                opcode, payload = self._read_frame(conn)
+                if opcode == OP_CLOSE:
+                    self._send_frame(conn, OP_CLOSE, payload[:2])
+                    return
+                if opcode == OP_PING:
+                    self._send_frame(conn, OP_PONG, payload)
+                    continue
+                if opcode != OP_TEXT:
+                    continue
+                reply = self._dispatch(payload.decode("utf-8"))
+                if reply == FAIL_DISCONNECT:
+                    return
+                if reply == FAIL_TIMEOUT:
+                    continue
+                self._send_frame(conn, OP_TEXT, json.dumps(reply).encode("utf-8"))
+        except (OSError, ConnectionError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _handshake(self, conn: socket.socket) -> None:
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                raise ConnectionError("closed during handshake")
+            request += chunk
+        key = None
+        for line in request.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"sec-websocket-key":
+                key = value.strip()
+        if key is None:
+            raise ValueError("not a websocket handshake")
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID.encode()).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    @staticmethod
+    def _recv_exact(conn: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            data += chunk
+        return data
+
+    def _read_frame(self, conn: socket.socket):
+        # Client frames are always masked; fragmented messages are reassembled
+        message = b""
+        opcode = None
+        while True:
+            head = self._recv_exact(conn, 2)
+            fin, frame_opcode = head[0] & 0x80, head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", self._recv_exact(conn, 2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", self._recv_exact(conn, 8))[0]
+            mask = self._recv_exact(conn, 4) if head[1] & 0x80 else b"\0\0\0\0"
+            data = self._recv_exact(conn, length)
+            data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+            if frame_opcode >= 0x8:
+                return frame_opcode, data
+            if opcode is None:
+                opcode = frame_opcode
+            message += data
+            if fin:
+                return opcode, message
+
+    @staticmethod
+    def _send_frame(conn: socket.socket, opcode: int, payload: bytes) -> None:
+        length = len(payload)
+        if length < 126:
+            head = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            head = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        conn.sendall(head + payload)
+
+    def _dispatch(self, text: str):
+        message = json.loads(text)
+        if isinstance(message, str):
+            command, argument = message, None
+        elif isinstance(message, dict) and len(message) == 1:
+            command, argument = next(iter(message.items()))
+        else:
+            return {"Invalid": {"error": "Invalid command"}}
+        with self._lock:
+            self.commands.append((time.perf_counter(), command, argument))
+            failure = self._failures.get(command)
+            if failure is not None:
+                failure[0] -= 1
+                if failure[0] == 0:
+                    del self._failures[command]
+        delay = self.delays.get(command, self.delay)
+        if delay:
+            time.sleep(delay)
+        if failure is not None:
+            mode = failure[1]
+            if mode == FAIL_ERROR:
+                return {command: {"result": "Error", "value": "Injected failure"}}
+            return mode
+        handler = getattr(self, "_cmd_" + command, None)
+        if handler is None:
+            return {"Invalid": {"error": f"Unknown command {command}"}}
+        try:
+            value = handler(argument)
+        except Exception as e:
+            return {command: {"result": "Error", "value": str(e)}}
+        body = {"result": "Ok"}
+        if value is not None:
+            body["value"] = value
+        return {command: body}
+
+    def _apply(self, config: dict) -> None:
+        self.config = config
+        if self.on_config_applied is not None:
+            self.on_config_applied(config)
+
+    def _load_file(self) -> dict:
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            config = load_yaml(f)
+        if not isinstance(config, dict):
+            raise ValueError("Invalid config file")
+        return config
+
+    # Commands
+
+    def _cmd_GetVersion(self, argument):
+        return VERSION
+
+    def _cmd_GetState(self, argument):
+        return self.state
+
+    def _cmd_Reload(self, argument):
+        if not self.config_path:
+            raise ValueError("No config file set")
+        self._apply(self._load_file())
+
+    def _cmd_GetConfig(self, argument):
+        return dump_yaml(self.config) if self.config is not None else None
+
+    def _cmd_GetConfigJson(self, argument):
+        return json.dumps(self.config) if self.config is not None else None
+
+    def _cmd_SetConfig(self, argument):
+        self._apply(yaml.safe_load(argument))
+
+    def _cmd_SetConfigJson(self, argument):
+        self._apply(json.loads(argument))
+
+    def _cmd_PatchConfig(self, argument):
+        if self.config is None:
+            raise ValueError("No active config")
+        config = copy_config(self.config)
+        merge_patch(config, argument)
+        self._apply(config)
+
+    def _cmd_GetConfigFilePath(self, argument):
+        return self.config_path
+
+    def _cmd_SetConfigFilePath(self, argument):
+        self.config_path = argument
+
+    def _cmd_GetBufferLevel(self, argument):
+        return self.buffer_level
+
+    def _cmd_GetProcessingLoad(self, argument):
+        return self.processing_load
+
+    def _cmd_GetRateAdjust(self, argument):
+        return self.rate_adjust
+
+    def _cmd_GetCaptureRate(self, argument):
+        return (self.config or {}).get("devices", {}).get("samplerate", 44100)
+
+    def _cmd_GetClippedSamples(self, argument):
+        return 0
+
+    def _cmd_Stop(self, argument):
+        self.state = "Inactive"
+
+    def _cmd_Exit(self, argument):
+        self.state = "Inactive"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--config", help="config file Reload reads")
+    parser.add_argument("--delay", type=float, default=0.0, help="reply delay in seconds")
+    args = parser.parse_args()
+    server = FakeCamillaDSP(port=args.port, config_path=args.config, delay=args.delay).start()
+    print(f"Fake CamillaDSP listening on ws://{server.host}:{server.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,37 @@
-from cameliaeq.app import main
+import sys
+
+BANNER = ("\n"
+          "    CameliaEQ - a CamillaDSP Equalizer GUI\n"
+          "    Copyright (C) 2025 Piotr Ostapczuk (@github: postapczuk)\n"
+          "    \n"
+          "    This program is free software: you can redistribute it and/or modify\n"
+          "    it under the terms of the GNU General Public License as published by\n"
+          "    the Free Software Foundation, either version 3 of the License, or\n"
+          "    (at your option) any later version.\n"
+          "    \n"
+          "    This program is distributed in the hope that it will be useful,\n"
+          "    but WITHOUT ANY WARRANTY; without even the implied warranty of\n"
+          "    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\n"
+          "    GNU General Public License for more details.\n"
+          "    \n"
+          "    You should have received a copy of the GNU General Public License\n"
+          "    along with this program. If not, see <https://www.gnu.org/licenses/>.\n"
+          "    \n"
+          "    This program comes with ABSOLUTELY NO WARRANTY;\n"
+          "    This is free software, and you are welcome to redistribute it\n"
+          "    under certain conditions;\n"
+          )
 
 if __name__ == "__main__":
-    print("\n"
-            "    CameliaEQ - a CamillaDSP Equalizer GUI\n"
-            "    Copyright (C) 2025 Piotr Ostapczuk (@github: postapczuk)\n"
-            "    \n"
-            "    This program is free software: you can redistribute it and/or modify\n"
-            "    it under the terms of the GNU General Public License as published by\n"
-            "    the Free Software Foundation, either version 3 of the License, or\n"
-            "    (at your option) any later version.\n"
-            "    \n"
-            "    This program is distributed in the hope that it will be useful,\n"
-            "    but WITHOUT ANY WARRANTY; without even the implied warranty of\n"
-            "    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\n"
-            "    GNU General Public License for more details.\n"
-            "    \n"
-            "    You should have received a copy of the GNU General Public License\n"
-            "    along with this program. If not, see <https://www.gnu.org/licenses/>.\n"
-            "    \n"
-            "    This program comes with ABSOLUTELY NO WARRANTY;\n"
-            "    This is free software, and you are welcome to redistribute it\n"
-            "    under certain conditions;\n"
-    )
+    # The CLI and the headless daemon must not pay for importing Qt
+    from cameliaeq import cli
+    argv = sys.argv[1:]
+    if cli.handles(argv):
+        if "--headless" in argv:
+            print(BANNER)
+        sys.exit(cli.main(argv))
+    print(BANNER)
+    from cameliaeq.startup_profile import startup_profile
+    with startup_profile.phase("imports"):
+        from cameliaeq.app import main
     main()
@@ -1,45 +1,144 @@
+import logging
 import sys
-import time
-from threading import Event, Thread
+from contextlib import nullcontext
 
 from PySide6 import QtGui
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer, Signal
 from PySide6.QtGui import QIcon, QPixmap, QPainter, QColor
 from PySide6.QtWidgets import QApplication, QMainWindow, QMenu, QSystemTrayIcon
 
-from .camilla_dsp import try_reload_camilla_dsp
-from .devices import list_system_playback_devices
+from .camilla_client import close_all_clients
+from .control_server import ControlServer
+from .controller import EqController
+from .device_monitor import DeviceMonitor
+from .devices import device_registry
+from .executor import CommandExecutor
+from .latency import LatencyTuner
+from .metrics import create_metrics_collector
 from .settings import Settings, APP_NAME
+from .startup_profile import startup_profile
 from .tray_window import TrayWindow
+from .tracing import setup_logging
+
+log = logging.getLogger(__name__)
+
+# Delay between the event loop starting and building the popup in the background
+PREWARM_DELAY_MS = 1500
+
+_fallback_tray_icon = None
+
+
+def with_filters(controller: EqController, handler):
+    """The handler, with the config's biquads and samplerate added to a result that is not None.
+
+    The tray window redraws its curve from them, without taking the controller lock on the Qt thread.
+    """
+    def run(values):
+        with controller.lock:
+            result = handler(values)
+            if result is None:
+                return None
+            return (result, *controller.read_filters())
+    return run
+
+
+def read_state(controller: EqController, values: dict) -> tuple:
+    """Handler of "state": (sequence, (gains, biquads, samplerate) or None).
+
+    The values are sequence numbers, keyed "live" for what CamillaDSP runs and "startup"
+    for the initial values, which fall back to the config file when that is unknown.
+    """
+    phase = startup_profile.phase("state read (CamillaDSP/YAML)") if "startup" in values else nullcontext()
+    with phase, controller.lock:
+        state = controller.read_live_state()
+        if state is None and "startup" in values:
+            # CamillaDSP not reachable (or not running our config): go by the file
+            state = (controller.read_gains(), *controller.read_filters())
+    return max(values.values()), state
+
+
+def create_command_executor(controller: EqController, parent=None) -> CommandExecutor:
+    # File I/O and CamillaDSP round trips run there, off the Qt thread
+    executor = CommandExecutor(parent)
+    executor.register("gains", with_filters(controller, controller.apply_gains))
+    executor.register("persist", controller.persist_gains)
+    executor.register("device", with_filters(controller,
+                                             lambda values: controller.switch_device(*values["playback"])))
+    executor.register("config", with_filters(controller, lambda values: controller.reload_config()))
+    executor.register("reload", lambda values: controller.reload())
+    executor.register("state", lambda values: read_state(controller, values))
+    executor.register("external", with_filters(controller, lambda values: controller.take_external_changes()))
+    return executor
 
 
 class MainApp(QMainWindow):
-    def __init__(self, stop_event):
+    # (gains, biquads, samplerate) after a control API request, emitted from its server thread
+    remote_gains_applied = Signal(object)
+
+    def __init__(self):
         super().__init__()
-        self.stop_event = stop_event
         # Make this host window a tool (though we don't show it)
-        self.settings = Settings.load()
+        with startup_profile.phase("settings load"):
+            self.settings = Settings.load()
         self.setWindowFlags(self.windowFlags() | Qt.Tool | Qt.WindowStaysOnTopHint)
         self.setWindowIcon(QtGui.QIcon("../icon.icns"))
 
         # Tray icon
-        self.tray = QSystemTrayIcon(self)
-        # Try theme icon first; fallback to a simple drawn pixmap to ensure the tray is visible
-        icon = QIcon.fromTheme("audio-volume-high")
-        if icon.isNull():
-            icon = self.create_fallback_tray_icon()
-        self.tray.setIcon(icon)
-        self.tray.setToolTip(APP_NAME)
-        print("Tray icon created")
+        with startup_profile.phase("tray icon"):
+            self.tray = QSystemTrayIcon(self)
+            self.tray.setIcon(self.create_tray_icon())
+            self.tray.setToolTip(APP_NAME)
+            log.debug("Tray icon created")
+
+            self.menu = QMenu()
+            self.tray.setContextMenu(self.menu)
+            self.tray.activated.connect(self.on_tray_activated)
+            self.tray.show()
+            log.debug("Context menu created")
+
+        self.controller = EqController(self.settings)
+        self.executor = create_command_executor(self.controller, self)
+        self.executor.failed.connect(self.on_command_failed)
 
-        self.menu = QMenu()
-        self.tray.setContextMenu(self.menu)
-        self.tray.activated.connect(self.on_tray_activated)
-        self.tray.show()
-        print("Context menu created")
+        # Main small window; built on first use, or in the background once the tray is up
+        self._tray_window = None
 
-        # Main small window
-        self.window = TrayWindow(self.settings)
+        # Local control API (home automation, media keys, the CLI)
+        self.remote_gains_applied.connect(self.on_remote_gains_applied)
+        self.control_server = ControlServer(self.controller, on_applied=self.on_control_applied)
+        self.control_server.start()
+
+        # Retunes CamillaDSP buffers for devices on the auto latency profile
+        self.latency_tuner = LatencyTuner(self.controller)
+        self.latency_tuner.start()
+
+        self.metrics = create_metrics_collector(self.settings)
+        self.metrics.start()
+
+        # Device hot-plug notifications
+        self.was_disconnected = False
+        self.device_monitor = DeviceMonitor(self)
+        self.device_monitor.devicesChanged.connect(self.on_devices_changed)
+        QTimer.singleShot(0, self.on_event_loop_started)
+
+    @property
+    def tray_window(self) -> TrayWindow:
+        if self._tray_window is None:
+            with startup_profile.phase("tray window build"):
+                self._tray_window = TrayWindow(self.settings, self.controller, self.executor, self.metrics)
+            # The report follows once the initial values are read (see TrayWindow.on_command_completed)
+            startup_profile.mark("tray window ready")
+        return self._tray_window
+
+    def on_event_loop_started(self):
+        startup_profile.mark("event loop running")
+        self.on_devices_changed()
+        QTimer.singleShot(PREWARM_DELAY_MS, self.prewarm_tray_window)
+
+    def prewarm_tray_window(self):
+        # Building the popup reads the CamillaDSP YAML; do it while the user is not waiting for it
+        if self._tray_window is None:
+            self.tray_window
 
     def on_tray_activated(self, reason):
         if reason == QSystemTrayIcon.Trigger:
@@ -63,8 +162,8 @@ class MainApp(QMainWindow):
             screen = QApplication.primaryScreen()
         avail = screen.availableGeometry() if screen else None
         margin = 6
-        w = self.window.width()
-        h = self.window.height()
+        w = self.tray_window.width()
+        h = self.tray_window.height()
         if rect and rect.height() > 0:
             x = rect.center().x() - w // 2
             y = rect.bottom() + margin
@@ -81,26 +180,34 @@ class MainApp(QMainWindow):
         if avail:
             x = max(avail.left(), min(x, avail.right() - w))
             y = max(avail.top(), min(y, avail.bottom() - h))
-        self.window.move(x, y)
+        self.tray_window.move(x, y)
 
     def toggle_window(self):
-        if self.window.isVisible():
-            self.window.hide()
+        if self.tray_window.isVisible():
+            self.tray_window.hide()
         else:
             self.position_window_under_tray()
-            self.window.show()
-            self.window.raise_()
-            self.window.fill_in_devices_into_combobox()
-            self.window.activateWindow()
+            self.tray_window.show()
+            self.tray_window.raise_()
+            self.tray_window.fill_in_devices_into_combobox(allow_stale=True)
+            self.tray_window.activateWindow()
 
     def open_settings_window(self):
-        self.window.open_settings()
+        self.tray_window.open_settings()
 
 
-    def create_fallback_tray_icon(self):
+    def create_tray_icon(self):
+        # Try theme icon first; fallback to a simple drawn pixmap to ensure the tray is visible
         icon = QIcon.fromTheme("audio-volume-high")
         if not icon.isNull():
             return icon
+        return self.create_fallback_tray_icon()
+
+    def create_fallback_tray_icon(self):
+        # Painted once per process, not on every call
+        global _fallback_tray_icon
+        if _fallback_tray_icon is not None:
+            return _fallback_tray_icon
         pm = QPixmap(22, 22)
         pm.fill(Qt.transparent)
         p = QPainter(pm)
@@ -109,40 +216,62 @@ class MainApp(QMainWindow):
         p.setPen(Qt.NoPen)
         p.drawEllipse(2, 2, 18, 18)
         p.end()
-        return QIcon(pm)
-
-    def closeEvent(self, event):
-        # Signal the stop event to terminate the worker thread
-        self.stop_event.set()
-        event.accept()  # Continue with the close
-
-
-    def device_watcher(self, stop_event: Event, settings: Settings):
-        was_disconnected: bool = False
-        print("Device watching thread started...")
-        while not stop_event.is_set():
-            tmp_devices_contains_selected = settings.playback_device in list_system_playback_devices()
-            if not tmp_devices_contains_selected and not was_disconnected:
-                print("Device disconnected!")
-                self.tray.showMessage("Device disconnected", "CameliaEQ is waiting for the device.")
-                was_disconnected = True
-            elif tmp_devices_contains_selected and was_disconnected:
-                was_disconnected = False
-                try_reload_camilla_dsp(settings.port)
-                print("Device reconnected!")
-                self.tray.showMessage("Device reconnected", "CameliaEQ reloaded the device to CamillaDSP.")
-            time.sleep(3)
-        print("Device watching thread stopped.")
+        _fallback_tray_icon = QIcon(pm)
+        return _fallback_tray_icon
+
+    def on_devices_changed(self):
+        device_registry.invalidate()
+        with startup_profile.phase("device enumeration"):
+            devices_contains_selected = self.settings.playback_device in device_registry.devices()
+        if self._tray_window is not None and self._tray_window.isVisible():
+            self.tray_window.fill_in_devices_into_combobox(allow_stale=True)
+        if not devices_contains_selected and not self.was_disconnected:
+            log.info("Device disconnected")
+            self.tray.showMessage("Device disconnected", "CameliaEQ is waiting for the device.")
+            self.was_disconnected = True
+        elif devices_contains_selected and self.was_disconnected:
+            self.was_disconnected = False
+            self.request_reload()
+            log.info("Device reconnected")
+            self.tray.showMessage("Device reconnected", "CameliaEQ reloaded the device to CamillaDSP.")
+
+    def request_reload(self):
+        # Write pending live changes first, or the reload would revert them
+        self.flush_pending_persist()
+        self.executor.submit("reload", "port", int(self.settings.port))
+
+    def flush_pending_persist(self):
+        if self._tray_window is not None:
+            self._tray_window.flush_pending_persist()
+
+    def on_control_applied(self, gains: dict):
+        # Server thread: the filters for the curve are read here rather than on the Qt thread
+        self.remote_gains_applied.emit((gains, *self.controller.read_filters()))
+
+    def on_remote_gains_applied(self, state: tuple):
+        # Without a popup there are no dials to update; they are read when it gets built
+        if self._tray_window is not None:
+            self._tray_window.on_remote_gains_applied(*state)
+
+    def on_command_failed(self, kind: str, message: str):
+        # Once built, the popup reports failures itself
+        if self._tray_window is None:
+            self.tray.showMessage(APP_NAME, message, QSystemTrayIcon.Warning)
 
 
 def main():
-    app = QApplication(sys.argv)
+    setup_logging()
+    with startup_profile.phase("Qt init"):
+        app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
-    stop_event = Event()
-    win = MainApp(stop_event=stop_event)
-    device_watching_thread = Thread(target=win.device_watcher, args=(stop_event,win.settings))
-    device_watching_thread.start()
+    win = MainApp()
+    # Live mode writes the YAML lazily; make sure nothing pending is lost on quit
+    app.aboutToQuit.connect(win.flush_pending_persist)
+    app.aboutToQuit.connect(win.executor.stop)
+    app.aboutToQuit.connect(win.control_server.stop)
+    app.aboutToQuit.connect(win.latency_tuner.stop)
+    app.aboutToQuit.connect(win.metrics.stop)
     # Keep the tray running; no main window
     app_exec = app.exec()
-    device_watching_thread.join()
+    close_all_clients()
     sys.exit(app_exec)
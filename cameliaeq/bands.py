@@ -0,0 +1,91 @@
+"""Band layouts: which CamillaDSP filters the EQ controls are bound to.
+
+"3" is the original Bass/Middle/Treble shelf and peak set. The graphic layouts
+are Peaking filters at the ISO center frequencies, each as wide as the spacing
+between centers. "parametric" takes the bands from the config file itself:
+whatever Biquad filters the CameliaEQ pipeline step runs, with any type,
+frequency and Q, get one control each.
+"""
+import math
+
+from .camilla_dsp import DEFAULT_FILTERS, eq_step_names
+
+DEFAULT_LAYOUT = "3"
+PARAMETRIC = "parametric"
+
+GRAPHIC_CENTERS = {
+    "5": (60, 230, 910, 3600, 14000),
+    "10": (31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000),
+    "31": (20, 25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500, 630, 800, 1000,
+           1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000, 10000, 12500, 16000, 20000),
+}
+# Band spacing in octaves
+GRAPHIC_BANDWIDTH = {"5": 2.0, "10": 1.0, "31": 1 / 3}
+
+LAYOUTS = {
+    "3": "3 bands (Bass, Middle, Treble)",
+    "5": "5-band graphic",
+    "10": "10-band graphic",
+    "31": "31-band graphic",
+    PARAMETRIC: "Parametric (bands from the config file)",
+}
+
+
+def band_name(freq: float) -> str:
+    """Filter name of a graphic band, e.g. 31.5Hz or 12.5kHz."""
+    if freq >= 1000:
+        return f"{freq / 1000:g}kHz"
+    return f"{freq:g}Hz"
+
+
+def _q_for_bandwidth(octaves: float) -> float:
+    return round(math.sqrt(2 ** octaves) / (2 ** octaves - 1), 3)
+
+
+def layout_filters(layout: str) -> dict:
+    """Default filter definitions of a layout, by band name in band order."""
+    centers = GRAPHIC_CENTERS.get(layout)
+    if centers is None:
+        # The 3-band set is also where an empty parametric config starts from
+        return DEFAULT_FILTERS
+    q = _q_for_bandwidth(GRAPHIC_BANDWIDTH[layout])
+    return {
+        band_name(freq): {
+            "description": None,
+            "parameters": {"freq": freq, "gain": 0, "q": q, "type": "Peaking"},
+            "type": "Biquad",
+        }
+        for freq in centers
+    }
+
+
+def step_filters(cfg: dict, layout: str) -> dict:
+    """Filter definitions the EQ pipeline step should run, by name in step order.
+
+    For the parametric layout that is whatever the EQ steps already run, from low to high
+    frequency.
+    """
+    if layout == PARAMETRIC and isinstance(cfg, dict):
+        filters = cfg.get("filters") or {}
+        existing = [name for name in eq_step_names(cfg) if isinstance(filters.get(name), dict)]
+        if existing:
+            return {name: filters[name] for name in sorted(existing, key=lambda n: _frequency(filters[n]))}
+    return layout_filters(layout)
+
+
+def _frequency(filter_cfg: dict) -> float:
+    params = filter_cfg.get("parameters")
+    try:
+        return float(params["freq"])
+    except (KeyError, TypeError, ValueError):
+        return math.inf
+
+
+def band_filters(cfg: dict, layout: str) -> dict:
+    """Filter definitions of the bands the controls are bound to: the step's filters that have a gain."""
+    bands = {}
+    for name, f in step_filters(cfg, layout).items():
+        params = f.get("parameters")
+        if f.get("type") == "Biquad" and isinstance(params, dict) and "gain" in params:
+            bands[name] = f
+    return bands
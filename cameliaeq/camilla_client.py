@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+from websocket import create_connection
+
+log = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 1.5  # seconds
+# A connection idle for longer than this is verified with GetVersion before reuse
+HEALTH_CHECK_INTERVAL = 10.0  # seconds
+BACKOFF_INITIAL = 0.5  # seconds
+BACKOFF_MAX = 10.0  # seconds
+
+_NO_ARGUMENT = object()
+
+
+class CamillaDSPError(Exception):
+    pass
+
+
+class CamillaClient:
+    """Long-lived websocket connection to one CamillaDSP instance.
+
+    Requests are serialized and each reply is matched to its command by name.
+    A failed connect arms an exponential backoff window during which requests
+    fail immediately instead of blocking on the connect timeout again.
+    """
+
+    def __init__(self, port: int, host: str = "localhost", timeout: float = CONNECT_TIMEOUT):
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+        self._ws = None
+        self._lock = threading.RLock()
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+        self._last_activity = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    def request(self, command: str, argument=_NO_ARGUMENT):
+        """Send a command and return the "value" of its reply.
+
+        Raises CamillaDSPError when CamillaDSP is unreachable or rejects the command.
+        """
+        if self.port <= 0 or self.port > 65535:
+            raise CamillaDSPError(f"Invalid CamillaDSP port: {self.port}")
+        with self._lock:
+            if self._ws is not None and time.monotonic() - self._last_activity > HEALTH_CHECK_INTERVAL:
+                if not self._is_healthy():
+                    self._disconnect()
+            fresh = False
+            if self._ws is None:
+                self._connect()
+                fresh = True
+            try:
+                return self._exchange(command, argument)
+            except CamillaDSPError:
+                raise
+            except Exception as e:
+                self._disconnect()
+                if fresh:
+                    raise CamillaDSPError(f"{command} failed: {e}") from e
+            # The cached socket went stale (e.g. CamillaDSP restarted); retry once on a new one
+            self._connect()
+            try:
+                return self._exchange(command, argument)
+            except CamillaDSPError:
+                raise
+            except Exception as e:
+                self._disconnect()
+                raise CamillaDSPError(f"{command} failed: {e}") from e
+
+    def health_check(self) -> bool:
+        try:
+            self.request("GetVersion")
+            return True
+        except CamillaDSPError:
+            return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _is_healthy(self) -> bool:
+        try:
+            self._exchange("GetVersion", _NO_ARGUMENT)
+            return True
+        except Exception:
+            return False
+
+    def _connect(self) -> None:
+        now = time.monotonic()
+        if now < self._next_attempt:
+            raise CamillaDSPError(
+                f"CamillaDSP at {self.url} unreachable, next attempt in {self._next_attempt - now:.1f}s"
+            )
+        try:
+            self._ws = create_connection(self.url, timeout=self.timeout)
+        except Exception as e:
+            self._ws = None
+            self._backoff = min(BACKOFF_MAX, self._backoff * 2 or BACKOFF_INITIAL)
+            self._next_attempt = now + self._backoff
+            raise CamillaDSPError(f"Cannot connect to CamillaDSP at {self.url}: {e}") from e
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+        self._last_activity = time.monotonic()
+
+    def _disconnect(self) -> None:
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception as e:
+                log.warning("Websocket not closed: %s", e)
+
+    def _exchange(self, command: str, argument):
+        message = command if argument is _NO_ARGUMENT else {command: argument}
+        self._ws.send(json.dumps(message))
+        while True:
+            raw = self._ws.recv()
+            try:
+                reply = json.loads(raw)
+            except ValueError:
+                continue
+            # Replies look like {"<command>": {"result": "Ok", "value": ...}}; skip other commands' replies
+            if not isinstance(reply, dict):
+                continue
+            if isinstance(reply.get(command), dict):
+                body = reply[command]
+                break
+            if "Invalid" in reply:
+                # Unknown or malformed command: CamillaDSP answers under "Invalid" instead
+                self._last_activity = time.monotonic()
+                invalid = reply["Invalid"]
+                error = invalid.get("error") if isinstance(invalid, dict) else invalid
+                raise CamillaDSPError(f"{command} rejected: {error}")
+        self._last_activity = time.monotonic()
+        if body.get("result") != "Ok":
+            raise CamillaDSPError(f"{command} failed: {body.get('result')}")
+        return body.get("value")
+
+
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(port: int) -> CamillaClient:
+    """Return the shared client for the given port, creating it on first use."""
+    with _clients_lock:
+        client: Optional[CamillaClient] = _clients.get(port)
+        if client is None:
+            client = CamillaClient(port)
+            _clients[port] = client
+        return client
+
+
+def close_all_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+from .camilla_dsp import load_camilla_dsp_document, save_camilla_dsp_text
+from .tracing import span
+from .yaml_io import copy_config, dump_yaml
+from .yaml_patch import YamlDocument, apply_changes
+
+log = logging.getLogger(__name__)
+
+
+class CamillaConfig:
+    """In-memory model of a CamillaDSP YAML config file.
+
+    The parsed config is kept between calls and only re-parsed when the file's
+    mtime, size or inode changes. Callers may mutate the dict returned by load(),
+    but must hand it back to save() afterwards (or call invalidate()), otherwise
+    the model drifts from the file. save() compares against a snapshot of the
+    last persisted state and skips writes that would not change anything.
+
+    The file's text is kept as well: when only scalar values changed (gains, the
+    playback device), save() rewrites just those in place, so the user's comments
+    and formatting survive. Structural changes fall back to dumping the whole config.
+
+    A file rewritten by someone else is picked up by the next load(); what it held
+    before is kept for take_external_change(). save() refuses to overwrite such a
+    change with data derived from the old contents.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Optional[dict] = None
+        # Copy of what is on disk, kept apart from _data which callers mutate in place
+        self._persisted: Optional[dict] = None
+        # Text of the file as last read or written, matching _persisted
+        self._document: Optional[YamlDocument] = None
+        self._signature = None
+        # _persisted from before the file was changed by someone else, until taken
+        self._external_base: Optional[dict] = None
+        self._lock = threading.RLock()
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def load(self) -> Optional[dict]:
+        with self._lock:
+            try:
+                signature = self._stat_signature()
+            except OSError:
+                self._note_external_change()
+                self.invalidate()
+                return None
+            if self._data is None or signature != self._signature:
+                if signature != self._signature:
+                    self._note_external_change()
+                loaded = load_camilla_dsp_document(self.path)
+                if loaded is None:
+                    self.invalidate()
+                    return None
+                data, self._document = loaded
+                self._data = data
+                self._persisted = copy_config(data)
+                self._signature = signature
+            return self._data
+
+    def save(self, data: dict) -> bool:
+        with self._lock:
+            if self._persisted is not None and data == self._persisted and self._is_unchanged_on_disk():
+                self._data = data
+                return True
+            if self._signature is not None and not self._is_unchanged_on_disk():
+                # data was built from what the file held before someone else rewrote it
+                log.warning("%s changed on disk since it was read; not overwriting it", self.path)
+                return False
+            document = None
+            if self._document is not None and self._persisted is not None:
+                with span("yaml.patch"):
+                    document = self._document.patch(self._persisted, data)
+            patched = document is not None
+            if not patched:
+                with span("yaml.dump"):
+                    document = YamlDocument(dump_yaml(data))
+            if not save_camilla_dsp_text(self.path, document.text()):
+                self.invalidate()
+                return False
+            # Our own write: adopt the new state instead of parsing it back
+            try:
+                self._signature = self._stat_signature()
+                self._data = data
+                if patched:
+                    # Only scalars changed or sections were appended; no need to copy the whole config again
+                    apply_changes(self._persisted, document.changes)
+                else:
+                    self._persisted = copy_config(data)
+                self._document = document
+            except OSError:
+                self.invalidate()
+            return True
+
+    def take_external_change(self) -> Optional[tuple]:
+        """(before, after) if someone else rewrote the file since the last call, else None.
+
+        before is the config as this model last read or wrote it, after the file's current content.
+        """
+        with self._lock:
+            after = self.load()
+            before, self._external_base = self._external_base, None
+            if before is None or after is None:
+                return None
+            return before, after
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data = None
+            self._persisted = None
+            self._document = None
+            self._signature = None
+
+    def _note_external_change(self) -> None:
+        if self._external_base is None and self._persisted is not None:
+            self._external_base = self._persisted
+
+    def _is_unchanged_on_disk(self) -> bool:
+        try:
+            return self._stat_signature() == self._signature
+        except OSError:
+            return False
+
+
+_configs: dict = {}
+_configs_lock = threading.Lock()
+
+
+def get_camilla_config(path: str) -> Optional[CamillaConfig]:
+    """Return the shared model for the given config path, or None when no path is set."""
+    if not path:
+        return None
+    with _configs_lock:
+        config = _configs.get(path)
+        if config is None:
+            config = CamillaConfig(path)
+            _configs[path] = config
+        return config
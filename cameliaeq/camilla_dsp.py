@@ -1,29 +1,103 @@
-import json
+import logging
+import os
+import tempfile
 from typing import Optional
 
-import yaml
-from websocket import create_connection
+from .camilla_client import CamillaDSPError, get_client
+from .tracing import span, traced
+from .yaml_io import copy_config, dump_yaml, load_yaml
+from .yaml_patch import YamlDocument
 
+log = logging.getLogger(__name__)
 
+
+@traced("yaml.load")
 def load_camilla_dsp_yaml(path: str) -> Optional[dict]:
     if not path:
         return None
     try:
         with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
+            return load_yaml(f) or {}
+    except Exception:
+        return None
+
+
+@traced("yaml.load")
+def load_camilla_dsp_document(path: str) -> Optional[tuple]:
+    """(data, YamlDocument) of the config file, for saves that only rewrite changed scalars."""
+    if not path:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data, document = YamlDocument.parse(f.read())
+        return data or {}, document
     except Exception:
         return None
 
 
 def save_camilla_dsp_yaml(path: str, data: dict) -> bool:
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            yaml.safe_dump(data, f, sort_keys=False)
+        write_yaml_atomically(path, data)
+        return True
+    except Exception:
+        return False
+
+
+def save_camilla_dsp_text(path: str, text: str) -> bool:
+    try:
+        write_text_atomically(path, text)
         return True
     except Exception:
         return False
 
 
+def write_yaml_atomically(path: str, data: dict) -> None:
+    with span("yaml.dump"):
+        text = dump_yaml(data)
+    write_text_atomically(path, text)
+
+
+@traced("yaml.save")
+def write_text_atomically(path: str, text: str) -> None:
+    """Write text to a temporary file next to path, fsync it and rename it over path.
+
+    Readers such as a reloading CamillaDSP see either the old or the new file, never a torn one.
+    """
+    # Replace the target of a symlinked config, not the link itself
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file as 0600; keep the mode of the file being replaced
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
 # Default filters and pipeline templates
 DEFAULT_FILTERS = {
     "Bass": {
@@ -44,32 +118,65 @@ DEFAULT_FILTERS = {
 }
 
 
-def make_pipeline_entry(name: str) -> dict:
+# Marks the pipeline steps running the EQ bands, one step per band
+EQ_STEP_DESCRIPTION = "CameliaEQ"
+# Marked the step earlier versions moved the bands at 0 dB into; replaced by the band steps
+LEGACY_FLAT_STEP_DESCRIPTION = "CameliaEQ flat bands"
+# Biquad types that leave the signal untouched at 0 dB gain
+FLAT_AT_ZERO_GAIN = ("Peaking", "Lowshelf", "Highshelf")
+
+
+def make_pipeline_entry(name: str, channels: Optional[list] = None) -> dict:
+    """The Filter step of one EQ band; optimize_pipeline bypasses it while the band is at 0 dB."""
     return {
         "bypassed": None,
-        "channels": [0, 1],
-        "description": None,
+        "channels": list(channels) if channels is not None else [0, 1],
+        "description": EQ_STEP_DESCRIPTION,
         "names": [name],
         "type": "Filter",
     }
 
 
-def ensure_filters_and_pipelines(cfg: dict) -> bool:
+def is_eq_step(step) -> bool:
+    if not isinstance(step, dict):
+        return False
+    return step.get("type") == "Filter" and step.get("description") == EQ_STEP_DESCRIPTION
+
+
+def eq_step_names(cfg: dict) -> list:
+    """Filter names of the EQ pipeline steps, bypassed ones included; empty if there are none."""
+    names = []
+    for step in cfg.get("pipeline") or []:
+        if is_eq_step(step) and isinstance(step.get("names"), list):
+            names.extend(n for n in step["names"] if n not in names)
+    return names
+
+
+@traced("normalize.filters")
+def ensure_filters_and_pipelines(cfg: dict, filters: Optional[dict] = None) -> bool:
+    """Make sure the band filters exist and each runs in its own EQ pipeline step, in band order.
+
+    filters maps band names to default filter definitions (DEFAULT_FILTERS if not given).
+    Existing filter parameters are kept, and so are the band steps while they still match
+    the bands: their bypass flags are optimize_pipeline's. Steps of other filters are left alone.
+    """
+    if filters is None:
+        filters = DEFAULT_FILTERS
     changed = False
     # Ensure filters exist
     if "filters" not in cfg or cfg["filters"] is None:
         cfg["filters"] = {}
         changed = True
-    for name, defn in DEFAULT_FILTERS.items():
+    for name, defn in filters.items():
         if name not in cfg["filters"]:
             # Deep copy to avoid accidental mutation
-            cfg["filters"][name] = yaml.safe_load(yaml.safe_dump(defn))
+            cfg["filters"][name] = copy_config(defn)
             changed = True
         else:
             # Ensure key structure exists; do not overwrite existing params
             f = cfg["filters"][name]
             if not isinstance(f, dict):
-                cfg["filters"][name] = yaml.safe_load(yaml.safe_dump(defn))
+                cfg["filters"][name] = copy_config(defn)
                 changed = True
             else:
                 if "type" not in f:
@@ -80,35 +187,134 @@ def ensure_filters_and_pipelines(cfg: dict) -> bool:
                     changed = True
                 params = f.setdefault("parameters", {})
                 # Ensure required parameter keys exist; keep existing gain
-                for k, v in DEFAULT_FILTERS[name]["parameters"].items():
+                for k, v in defn.get("parameters", {}).items():
                     if k not in params:
                         params[k] = v;
                         changed = True
-    # Ensure pipeline contains entries for each filter name (anywhere in list)
     pipeline = cfg.get("pipeline")
     if not isinstance(pipeline, list):
         cfg["pipeline"] = []
         pipeline = cfg["pipeline"]
         changed = True
-    # Collect existing names referenced
-    existing_names = set()
+    band_names = set(filters) | set(DEFAULT_FILTERS)
+    eq_steps = []
+    obsolete = []
+    # One pass: configs with hundreds of steps are read on every gain change
+    for i, step in enumerate(pipeline):
+        if not isinstance(step, dict) or step.get("type") != "Filter":
+            continue
+        description = step.get("description")
+        if description == EQ_STEP_DESCRIPTION:
+            eq_steps.append(i)
+        elif description == LEGACY_FLAT_STEP_DESCRIPTION:
+            obsolete.append(i)
+        elif description is None:
+            # Older versions added one undescribed step per band
+            step_names = step.get("names")
+            if isinstance(step_names, list) and len(step_names) == 1 and step_names[0] in band_names:
+                obsolete.append(i)
+    names = list(filters)
+    if not obsolete and [pipeline[i].get("names") for i in eq_steps] == [[name] for name in names]:
+        for i in eq_steps:
+            if not isinstance(pipeline[i].get("channels"), list):
+                pipeline[i]["channels"] = [0, 1]
+                changed = True
+        return changed
+    # Rebuild the band steps where the first EQ step (or step of an older version) was, or last
+    channels = pipeline[eq_steps[0]].get("channels") if eq_steps else None
+    if not isinstance(channels, list):
+        channels = None
+    removed = set(eq_steps) | set(obsolete)
+    first = min(removed) if removed else len(pipeline)
+    kept = [step for i, step in enumerate(pipeline) if i not in removed]
+    position = first - sum(1 for i in removed if i < first)
+    pipeline[:] = kept[:position] + [make_pipeline_entry(name, channels) for name in names] + kept[position:]
+    return True
+
+
+def _is_flat_filter(filter_cfg) -> bool:
+    if not isinstance(filter_cfg, dict) or filter_cfg.get("type") != "Biquad":
+        return False
+    params = filter_cfg.get("parameters")
+    return isinstance(params, dict) and params.get("type") in FLAT_AT_ZERO_GAIN and params.get("gain") == 0
+
+
+def _valid_step(step, cfg: dict) -> bool:
+    if not isinstance(step, dict):
+        return False
+    kind = step.get("type")
+    if kind == "Filter":
+        names, channels = step.get("names"), step.get("channels")
+        # No channels means all of them
+        return isinstance(names, list) and bool(names) and (channels is None or isinstance(channels, list))
+    if kind in ("Mixer", "Processor"):
+        section = cfg.get("mixers" if kind == "Mixer" else "processors")
+        return isinstance(section, dict) and step.get("name") in section
+    return True
+
+
+def _mergeable(first, second) -> bool:
+    return (
+        isinstance(first, dict) and isinstance(second, dict)
+        and first.get("type") == second.get("type") == "Filter"
+        and not first.get("bypassed") and not second.get("bypassed")
+        and first.get("channels") == second.get("channels")
+        # Keeps the EQ steps apart from the user's own steps
+        and first.get("description") == second.get("description")
+        # and from each other, so each band can be bypassed on its own
+        and not is_eq_step(first)
+    )
+
+
+@traced("normalize.optimize")
+def optimize_pipeline(cfg: dict) -> bool:
+    """Cheapen the pipeline without changing what it does; run it before every save or live push.
+
+    Drops steps CamillaDSP cannot run (Filter steps without names, names of missing filters,
+    Mixer/Processor steps naming nothing) and merges adjacent Filter steps on the same channels.
+    The step of an EQ band at 0 dB is bypassed, so it costs no processing, until its gain
+    changes again; only that step's bypass flag changes, never the shape of the pipeline.
+    Returns True if the pipeline changed.
+    """
+    pipeline = cfg.get("pipeline")
+    if not isinstance(pipeline, list):
+        return False
+    filters = cfg.get("filters") if isinstance(cfg.get("filters"), dict) else {}
+    optimized = []
+    merged = None
     for step in pipeline:
-        try:
-            if isinstance(step, dict) and step.get("type") == "Filter":
-                names = step.get("names")
-                if isinstance(names, list):
-                    for n in names:
-                        existing_names.add(n)
-        except Exception:
+        if isinstance(step, dict) and step.get("type") == "Filter" and isinstance(step.get("names"), list):
+            names = [n for n in step["names"] if n in filters]
+            if names != step["names"]:
+                step = dict(step, names=names)
+        if not _valid_step(step, cfg):
             continue
-    for name in ["Bass", "Middle", "Treble"]:
-        if name not in existing_names:
-            pipeline.append(make_pipeline_entry(name))
-            changed = True
-    return changed
+        if is_eq_step(step):
+            # The bypass flag of the EQ steps is ours to manage
+            bypassed = True if all(_is_flat_filter(filters.get(n)) for n in step["names"]) else None
+            if bool(step.get("bypassed")) != bool(bypassed):
+                step = dict(step, bypassed=bypassed)
+        if optimized and _mergeable(optimized[-1], step):
+            if optimized[-1] is not merged:
+                # Copy once, then extend in place; the original steps are still compared against below
+                merged = optimized[-1] = dict(optimized[-1], names=list(optimized[-1]["names"]))
+            merged["names"].extend(step["names"])
+            continue
+        optimized.append(step)
+
+    if optimized == pipeline:
+        return False
+    pipeline[:] = optimized
+    return True
 
 
-def ensure_devices_section(cfg: dict, selected_device: str) -> bool:
+@traced("normalize.devices")
+def ensure_devices_section(cfg: dict, selected_device: str, buffer: Optional[tuple] = None) -> bool:
+    """Make sure the devices section captures from BlackHole and plays to the selected device.
+
+    buffer is (chunksize, target_level) of the device's latency profile; without it the
+    config's own values are kept. A samplerate is only filled in when missing.
+    """
     changed = False
     created_devices = False
     # Ensure devices dict exists
@@ -118,16 +324,16 @@ def ensure_devices_section(cfg: dict, selected_device: str) -> bool:
         cfg['devices'] = dev
         changed = True
         created_devices = True
-    # Ensure chunksize
-    if dev.get('chunksize') != 256:
-        dev['chunksize'] = 256
+    # Ensure chunksize and target_level
+    chunksize, target_level = buffer or (dev.get('chunksize') or 256, dev.get('target_level') or 256)
+    if dev.get('chunksize') != chunksize:
+        dev['chunksize'] = chunksize
         changed = True
-    # Ensure target_level
-    if dev.get('target_level') != 256:
-        dev['target_level'] = 256
+    if dev.get('target_level') != target_level:
+        dev['target_level'] = target_level
         changed = True
     # Ensure samplerate
-    if dev.get('samplerate') != 44100:
+    if not dev.get('samplerate'):
         dev['samplerate'] = 44100
         changed = True
     # Ensure capture
@@ -177,35 +383,23 @@ def ensure_devices_section(cfg: dict, selected_device: str) -> bool:
     return changed
 
 
+@traced("normalize.mixers")
 def ensure_mixers_and_processors(cfg: dict) -> bool:
-    """Ensure top-level mixers: {} and processors: {} exist and are placed at the end.
+    """Ensure top-level mixers: {} and processors: {} exist; missing ones are added at the end.
 
-    Returns True if any changes were made (added/normalized/reordered).
+    Keys already in the config stay where they are: CamillaDSP does not care about their
+    order, and moving them would turn the next save into a full dump that loses the user's
+    comments and layout. Returns True if any changes were made.
     """
     changed = False
     if not isinstance(cfg, dict):
         return False
-    # Normalize values
-    mixers = cfg.get("mixers")
-    if not isinstance(mixers, dict):
+    if not isinstance(cfg.get("mixers"), dict):
         cfg["mixers"] = {}
         changed = True
-    processors = cfg.get("processors")
-    if not isinstance(processors, dict):
+    if not isinstance(cfg.get("processors"), dict):
         cfg["processors"] = {}
         changed = True
-    # Reorder to ensure mixers and processors are the last keys
-    try:
-        items = list(cfg.items())
-        items = [(k, v) for k, v in items if k not in ("mixers", "processors")]
-        items.append(("mixers", cfg["mixers"]))
-        items.append(("processors", cfg["processors"]))
-        if list(cfg.items()) != items:
-            cfg.clear()
-            cfg.update(items)
-            changed = True
-    except Exception:
-        pass
     return changed
 
 
@@ -213,18 +407,24 @@ def read_gain(cfg: dict, filter_name: str) -> Optional[float]:
     try:
         return cfg["filters"][filter_name]["parameters"]["gain"]
     except Exception as e:
-        print(e)
+        log.debug("No gain for %s: %r", filter_name, e)
         return None
 
 
 def write_gain(cfg: dict, filter_name: str, gain: float) -> bool:
+    """Set the gain of a filter, creating the filter if needed.
+
+    Returns True only if the config was actually modified.
+    """
     try:
+        changed = False
         if "filters" not in cfg or cfg["filters"] is None:
             cfg["filters"] = {}
+            changed = True
         if filter_name not in cfg["filters"]:
             # Create full default if we have one; fallback to minimal structure
             if filter_name in DEFAULT_FILTERS:
-                cfg["filters"][filter_name] = yaml.safe_load(yaml.safe_dump(DEFAULT_FILTERS[filter_name]))
+                cfg["filters"][filter_name] = copy_config(DEFAULT_FILTERS[filter_name])
             else:
                 cfg["filters"][filter_name] = {
                     "type": "Biquad",
@@ -237,43 +437,76 @@ def write_gain(cfg: dict, filter_name: str, gain: float) -> bool:
                         "gain": 0,
                     },
                 }
+            changed = True
         params = cfg["filters"][filter_name].setdefault("parameters", {})
         if filter_name in DEFAULT_FILTERS:
             for k, v in DEFAULT_FILTERS[filter_name]["parameters"].items():
-                params.setdefault(k, v)
-        params["gain"] = gain
-        return True
+                if k not in params:
+                    params[k] = v
+                    changed = True
+        if params.get("gain") != gain:
+            params["gain"] = gain
+            changed = True
+        return changed
     except Exception:
         return False
 
 
+def pipeline_biquads(cfg: dict) -> dict:
+    """Parameters of the Biquad filters run by the pipeline, by name in pipeline order.
+
+    Filters of bypassed steps are left out, except the EQ band steps optimize_pipeline bypasses
+    for being at 0 dB: they still shape the curve once their gain changes. Without any Filter
+    step, all Biquad filters are returned.
+    """
+    filters = cfg.get("filters") or {}
+    names = []
+    for step in cfg.get("pipeline") or []:
+        if not isinstance(step, dict) or step.get("type") != "Filter":
+            continue
+        # The bypass flag of the EQ steps is optimize_pipeline's (set while their band is flat)
+        if not step.get("bypassed") or is_eq_step(step):
+            names.extend(n for n in step.get("names") or [] if n not in names)
+    if not names:
+        names = list(filters)
+    biquads = {}
+    for name in names:
+        f = filters.get(name)
+        if isinstance(f, dict) and f.get("type") == "Biquad" and isinstance(f.get("parameters"), dict):
+            biquads[name] = copy_config(f["parameters"])
+    return biquads
+
+
+def make_gain_patch(gains: dict, pipeline: Optional[list] = None) -> dict:
+    """Build a PatchConfig payload that only touches the gains of the given filters.
+
+    The pipeline is replaced as a whole when given, since PatchConfig does not merge lists.
+    """
+    patch = {"filters": {name: {"parameters": {"gain": gain}} for name, gain in gains.items()}}
+    if pipeline is not None:
+        patch["pipeline"] = pipeline
+    return patch
+
+
 # CamillaDSP reload
-def try_reload_camilla_dsp(port: int):
-    print("Reload camilla dsp...")
-    if port <= 0 or port > 65535:
-        print("Failed")
-        return
+def try_reload_camilla_dsp(port: int) -> bool:
     try:
-        ws = create_connection(f"ws://localhost:{port}", timeout=1.5)
-        try:
-            ws.send(json.dumps("Reload"))
-            try:
-                resp = ws.recv()
-                print("CamillaDSP configuration: " + resp)
-                print("Succeeded")
-            except Exception as e:
-                print("Failed")
-                print(e)
-                pass
-        finally:
-            try:
-                ws.close()
-            except Exception as e:
-                print("Websocket not closed!")
-                print(e)
-                pass
-        return
-    except Exception as ex:
-        print("Failed")
-        print(ex)
-        return
+        with span("camilladsp.reload"):
+            get_client(port).request("Reload")
+        log.info("CamillaDSP reloaded")
+        return True
+    except CamillaDSPError as e:
+        log.warning("CamillaDSP reload failed: %s", e)
+        return False
+
+
+# Live update of the running config, without touching the file on disk
+def try_patch_camilla_dsp(port: int, patch: dict) -> bool:
+    log.debug("Patch CamillaDSP: %s", patch)
+    try:
+        with span("camilladsp.patch"):
+            get_client(port).request("PatchConfig", patch)
+        return True
+    except CamillaDSPError as e:
+        log.warning("CamillaDSP patch failed: %s", e)
+        return False
@@ -0,0 +1,210 @@
+"""Command line interface and headless daemon.
+
+Nothing in here imports Qt, so one-shot commands start in milliseconds and the
+daemon runs on machines without a desktop session.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+
+from .camilla_client import close_all_clients
+from .control_server import ControlServer, send_control_request
+from .controller import CommandError, EqController, validate_gains
+from .devices import DeviceRegistry
+from .latency import LatencyTuner
+from .metrics import create_metrics_collector
+from .settings import Settings
+from .tracing import setup_logging
+
+log = logging.getLogger(__name__)
+
+COMMANDS = ("set-gain", "switch-device", "reload", "status", "trace")
+# Linux: ALSA adds/removes nodes here on hot-plug, so a cheap stat tells when to enumerate devices again
+SOUND_DEVICE_DIR = "/dev/snd"
+STAT_INTERVAL = 1.0  # seconds
+POLL_INTERVAL = 3.0  # seconds
+
+
+def handles(argv: list) -> bool:
+    """True when the arguments are meant for the CLI rather than for the tray app."""
+    return bool(argv) and (argv[0] in COMMANDS or argv[0] in ("--headless", "-h", "--help"))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cameliaeq", description="CameliaEQ - a CamillaDSP Equalizer")
+    parser.add_argument("--headless", action="store_true", help="run as a daemon, without the tray icon")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    set_gain = commands.add_parser("set-gain", help="set band gains, e.g. set-gain Bass 4 Treble -2")
+    set_gain.add_argument("pairs", nargs="+", metavar="BAND DB")
+    switch_device = commands.add_parser("switch-device", help="switch the playback device")
+    switch_device.add_argument("device")
+    commands.add_parser("reload", help="make CamillaDSP reload its config file")
+    commands.add_parser("status", help="print settings, gains and CamillaDSP state as JSON")
+    trace = commands.add_parser("trace", help="print timings of the running app or daemon")
+    trace.add_argument("--chrome", metavar="FILE", help="write a Chrome trace (chrome://tracing, Perfetto) instead")
+    return parser
+
+
+def parse_gains(parser: argparse.ArgumentParser, pairs: list) -> dict:
+    # Band names depend on the configured layout; whoever applies the gains checks them
+    if len(pairs) % 2:
+        parser.error("set-gain expects BAND DB pairs")
+    return dict(zip(pairs[::2], pairs[1::2]))
+
+
+def set_gains(controller: EqController, requested: dict) -> bool:
+    """Apply and save the gains; False when they were saved but CamillaDSP did not reload them."""
+    cfg_path = controller.settings.config_path
+    if not cfg_path or not os.path.exists(cfg_path):
+        raise CommandError("Please set a valid CamillaDSP config file in Settings.")
+    gains = controller.read_gains()
+    if not gains:
+        # Band names come from the config, so there is nothing to check them against
+        raise CommandError(f"Failed to load CamillaDSP config {cfg_path}")
+    gains.update(validate_gains(requested, list(gains)))
+    result = controller.apply_gains(gains)
+    # A one-shot command cannot write the file lazily later on, so persist right away
+    if result == "live":
+        controller.persist_gains(gains)
+    return result != "reload failed"
+
+
+def send_to_running_app(request: dict):
+    """Hand the request to a running app or daemon, so the CLI never races it on the config file.
+
+    Returns the response, or None when nothing is listening. Raises CommandError when
+    something is listening but did not answer properly.
+    """
+    response = send_control_request(request)
+    if response is None:
+        log.info("Control API unavailable, using the config file directly")
+    return response
+
+
+def device_dir_marker():
+    try:
+        st = os.stat(SOUND_DEVICE_DIR)
+        return st.st_mtime_ns, st.st_ino
+    except OSError:
+        return None
+
+
+def run_daemon(settings: Settings) -> int:
+    controller = EqController(settings)
+    registry = DeviceRegistry(use_qt=False)
+    stop_event = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: stop_event.set())
+
+    log.info("Headless daemon started")
+    try:
+        controller.reload_config()
+    except CommandError as e:
+        log.error("%s", e)
+    control_server = ControlServer(controller)
+    control_server.start()
+    latency_tuner = LatencyTuner(controller)
+    latency_tuner.start()
+    metrics = create_metrics_collector(settings)
+    metrics.start()
+    was_disconnected = False
+    last_marker = None
+    while not stop_event.is_set():
+        marker = device_dir_marker()
+        # Without the ALSA device directory there is nothing cheap to watch: enumerate every time
+        if marker is None or marker != last_marker:
+            last_marker = marker
+            registry.invalidate()
+            devices_contains_selected = settings.playback_device in registry.devices()
+            if not devices_contains_selected and not was_disconnected:
+                log.info("Device disconnected")
+                was_disconnected = True
+            elif devices_contains_selected and was_disconnected:
+                was_disconnected = False
+                controller.reload()
+                log.info("Device reconnected")
+        stop_event.wait(STAT_INTERVAL if marker is not None else POLL_INTERVAL)
+    metrics.stop()
+    latency_tuner.stop()
+    control_server.stop()
+    log.info("Headless daemon stopped")
+    return 0
+
+
+def main(argv: list) -> int:
+    setup_logging()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.headless and args.command:
+        parser.error("--headless cannot be combined with a command")
+    if not args.headless and not args.command:
+        parser.print_help()
+        return 2
+    if args.headless:
+        try:
+            return run_daemon(Settings.load())
+        finally:
+            close_all_clients()
+    gains = parse_gains(parser, args.pairs) if args.command == "set-gain" else None
+    out = sys.stdout
+    # Progress messages go to stderr, so stdout only carries the command's result
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.command == "set-gain":
+            request = {"gains": gains}
+        elif args.command == "switch-device":
+            request = {"device": args.device}
+        elif args.command == "reload":
+            request = {"reload": True}
+        elif args.command == "trace":
+            request = {"trace": "chrome" if args.chrome else "summary"}
+        else:
+            request = {}
+        try:
+            response = send_to_running_app(request)
+        except CommandError as e:
+            print(f"Error: {e}")
+            return 1
+        if response is not None:
+            if not response.get("ok"):
+                print(f"Error: {response.get('error')}")
+                return 1
+            if response.get("result") == "reload failed":
+                print("Error: gains saved, but CamillaDSP reload failed")
+                return 1
+            if args.command == "status":
+                json.dump(response.get("state"), out, indent=2)
+                out.write("\n")
+            elif args.command == "trace" and args.chrome:
+                with open(args.chrome, "w", encoding="utf-8") as f:
+                    json.dump(response.get("trace"), f)
+            elif args.command == "trace":
+                out.write(response.get("trace") + "\n")
+            return 0
+        if args.command == "trace":
+            # Spans live in the memory of the running process
+            print("Error: no running app or daemon to take timings from")
+            return 1
+        try:
+            controller = EqController(Settings.load())
+            if args.command == "set-gain":
+                if not set_gains(controller, gains):
+                    print("Error: gains saved, but CamillaDSP reload failed")
+                    return 1
+            elif args.command == "switch-device":
+                controller.switch_device(args.device, controller.read_gains())
+            elif args.command == "reload":
+                return 0 if controller.reload() else 1
+            elif args.command == "status":
+                json.dump(controller.status(), out, indent=2)
+                out.write("\n")
+            return 0
+        except CommandError as e:
+            print(f"Error: {e}")
+            return 1
+        finally:
+            close_all_clients()
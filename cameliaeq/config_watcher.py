@@ -0,0 +1,60 @@
+import logging
+import os
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QTimer, Signal
+
+log = logging.getLogger(__name__)
+
+
+class ConfigWatcher(QObject):
+    """Emits changed (on the Qt thread) when the CamillaDSP config file may have been rewritten.
+
+    The file's directory is watched along with the file: editors, CamillaGUI and CameliaEQ
+    itself replace the file by renaming a new one over it, after which the watch on the
+    old inode is gone. Bursts of events (a save is usually several) are merged. Our own
+    writes trigger it too; the receiver tells them apart by the file's mtime, size and inode.
+    """
+
+    changed = Signal()
+
+    def __init__(self, parent=None, debounce_ms: int = 300):
+        super().__init__(parent)
+        self.path = ""
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce_ms)
+        self._debounce.timeout.connect(self.changed.emit)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_event)
+        self._watcher.directoryChanged.connect(self._on_directory_event)
+
+    def set_path(self, path: str) -> None:
+        path = os.path.realpath(path) if path else ""
+        if path == self.path:
+            return
+        watched = self._watcher.files() + self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+        self.path = path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if os.path.isdir(directory):
+            self._watcher.addPath(directory)
+        self._watch_file()
+        log.debug("Watching %s", path)
+
+    def _watch_file(self) -> None:
+        if self.path not in self._watcher.files() and os.path.isfile(self.path):
+            self._watcher.addPath(self.path)
+
+    def _on_directory_event(self, directory: str) -> None:
+        # Something in the directory changed; only a new or replaced config file matters
+        if os.path.isfile(self.path) and self.path not in self._watcher.files():
+            self._watcher.addPath(self.path)
+            self._debounce.start()
+
+    def _on_event(self, path: str) -> None:
+        # A file replaced by rename drops out of the watch list; watch its successor
+        self._watch_file()
+        self._debounce.start()
@@ -0,0 +1,265 @@
+"""Local control API: JSON requests over a Unix domain socket.
+
+Each request is one JSON object on a single line, answered by one JSON line:
+
+    {"gains": {"Bass": 4, "Treble": -2}, "device": "USB Audio DAC"}
+    -> {"ok": true, "result": "live", "state": {...}}
+
+All keys ("device", "gains", "reload") are optional and applied in that order; an
+empty object just returns the current state. Band names and gains are checked before
+anything is applied. Should a later step still fail (say the reload), the earlier ones
+stay applied: the reply then has "ok": false along with the "result" and "state" so far.
+"trace": "summary" or "chrome" adds the timing spans recorded so far to the response
+(see tracing). The whole batch is applied under the controller lock, through the same
+path as the tray window dials, so clients never race the app on the config file.
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Callable, Optional
+
+from .controller import CommandError, EqController, validate_gains
+from .settings import user_config_dir
+from .tracing import chrome_trace, summary
+
+log = logging.getLogger(__name__)
+
+SOCKET_NAME = "cameliaeq.sock"
+# Same as the tray window: in live mode the YAML is written this long after the last change
+PERSIST_DELAY = 2.0  # seconds
+CLIENT_TIMEOUT = 5.0  # seconds
+MAX_REQUEST_SIZE = 64 * 1024  # bytes
+
+
+def control_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join(user_config_dir(), SOCKET_NAME)
+
+
+class ControlServer:
+    """Serves control requests for a running app or daemon on a background thread.
+
+    on_applied is called (from the server thread) with the resulting gains after
+    every request that changed something, so a UI can follow remote changes.
+    """
+
+    def __init__(self, controller: EqController, on_applied: Optional[Callable[[dict], None]] = None,
+                 path: Optional[str] = None):
+        self.controller = controller
+        self.on_applied = on_applied
+        self.path = path or control_socket_path()
+        self._server = None
+        self._thread = None
+        self._persist_timer = None
+        self._persist_lock = threading.Lock()
+
+    def start(self) -> bool:
+        if self._is_in_use():
+            log.warning("Control socket %s is used by another instance; control API disabled", self.path)
+            return False
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        server = socketserver.ThreadingUnixStreamServer(self.path, _RequestHandler, bind_and_activate=False)
+        server.daemon_threads = True
+        server.control = self
+        try:
+            # Only the current user may drive the EQ
+            old_umask = os.umask(0o177)
+            try:
+                server.server_bind()
+            finally:
+                os.umask(old_umask)
+            server.server_activate()
+        except OSError as e:
+            server.server_close()
+            log.warning("Control API not started: %s", e)
+            return False
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, name="CameliaEQ-control", daemon=True)
+        self._thread.start()
+        log.info("Control API listening on %s", self.path)
+        return True
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.flush_pending_persist()
+
+    def flush_pending_persist(self) -> None:
+        if self.cancel_pending_persist():
+            self._persist()
+
+    def cancel_pending_persist(self) -> bool:
+        with self._persist_lock:
+            timer, self._persist_timer = self._persist_timer, None
+        if timer is None:
+            return False
+        timer.cancel()
+        return True
+
+    def handle(self, request: dict) -> dict:
+        if not isinstance(request, dict):
+            raise CommandError("Request must be a JSON object")
+        gains = request.get("gains") or {}
+        device = request.get("device")
+        if not isinstance(gains, dict):
+            raise CommandError("gains must be an object of band name to dB")
+        if device is not None and not isinstance(device, str):
+            raise CommandError("device must be a string")
+        reload = bool(request.get("reload"))
+        trace = request.get("trace")
+        if trace not in (None, "summary", "chrome"):
+            raise CommandError('trace must be "summary" or "chrome"')
+
+        controller = self.controller
+        result = None
+        error = None
+        with controller.lock:
+            if gains:
+                gains = validate_gains(gains, controller.band_names())
+            try:
+                if device is not None and device != controller.settings.playback_device:
+                    # The switch stores the current gains in the outgoing device's profile itself
+                    self.cancel_pending_persist()
+                    current = controller.current_gains or controller.read_gains()
+                    controller.switch_device(device, dict(current))
+                    result = "device"
+                if gains:
+                    target = dict(controller.current_gains or controller.read_gains())
+                    target.update(gains)
+                    result = controller.apply_gains(target)
+                    if result == "live":
+                        self._schedule_persist()
+                if reload:
+                    # Whatever is only live-patched would be lost by reloading the file
+                    self.flush_pending_persist()
+                    if not controller.reload():
+                        raise CommandError("CamillaDSP reload failed")
+                    if result in (None, "reload failed"):
+                        result = "reloaded"
+            except CommandError as e:
+                if result is None:
+                    raise
+                # Partial success: the earlier steps are not rolled back
+                error = str(e)
+            state = controller.status()
+            applied = dict(controller.current_gains)
+        if result is not None and self.on_applied is not None:
+            self.on_applied(applied)
+        response = {"ok": error is None, "result": result, "state": state}
+        if error is not None:
+            response["error"] = error
+        if trace is not None:
+            response["trace"] = summary() if trace == "summary" else chrome_trace()
+        return response
+
+    def _schedule_persist(self) -> None:
+        with self._persist_lock:
+            if self._persist_timer is not None:
+                self._persist_timer.cancel()
+            self._persist_timer = threading.Timer(PERSIST_DELAY, self._on_persist_timer)
+            self._persist_timer.daemon = True
+            self._persist_timer.start()
+
+    def _on_persist_timer(self) -> None:
+        with self._persist_lock:
+            self._persist_timer = None
+        self._persist()
+
+    def _persist(self) -> None:
+        try:
+            with self.controller.lock:
+                self.controller.persist_gains(dict(self.controller.current_gains))
+        except CommandError as e:
+            log.error("Control API persist failed: %s", e)
+
+    def _is_in_use(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+            return True
+        except OSError:
+            # Stale socket left by a crashed instance
+            return False
+        finally:
+            probe.close()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    timeout = CLIENT_TIMEOUT
+
+    def handle(self):
+        control: ControlServer = self.server.control
+        while True:
+            try:
+                line = self.rfile.readline(MAX_REQUEST_SIZE)
+            except OSError:
+                return
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                response = control.handle(json.loads(line))
+            except ValueError as e:
+                response = {"ok": False, "error": f"Invalid JSON: {e}"}
+            except CommandError as e:
+                response = {"ok": False, "error": str(e)}
+            except Exception as e:
+                log.warning("Control request failed: %s", e)
+                response = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            except OSError:
+                return
+
+
+def send_control_request(request: dict, path: Optional[str] = None) -> Optional[dict]:
+    """Send one request to a running app; returns None when no app is listening.
+
+    Raises CommandError when an app is listening but gives no usable answer: it may
+    still apply the request, so the caller must not fall back to writing the file itself.
+    """
+    path = path or control_socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CLIENT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Stale socket left by a crashed instance
+        sock.close()
+        return None
+    except OSError as e:
+        sock.close()
+        raise CommandError(f"Cannot reach the running app: {e}")
+    try:
+        with sock, sock.makefile("rwb") as f:
+            f.write((json.dumps(request) + "\n").encode("utf-8"))
+            f.flush()
+            line = f.readline()
+    except OSError as e:
+        raise CommandError(f"No reply from the running app: {e}")
+    if not line:
+        raise CommandError("Control API closed the connection")
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise CommandError(f"Invalid reply from the running app: {e}")
@@ -0,0 +1,500 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from .bands import band_filters, step_filters
+from .camilla_client import CamillaDSPError, get_client
+from .camilla_config import get_camilla_config
+from .camilla_dsp import (
+    ensure_filters_and_pipelines,
+    ensure_devices_section,
+    ensure_mixers_and_processors,
+    read_gain,
+    write_gain,
+    DEFAULT_FILTERS,
+    make_gain_patch,
+    optimize_pipeline,
+    pipeline_biquads,
+    try_reload_camilla_dsp,
+    try_patch_camilla_dsp,
+)
+from .latency import DEFAULT_PROFILE, buffer_settings
+from .settings import Settings
+from .tracing import span, traced
+from .yaml_io import copy_config
+
+log = logging.getLogger(__name__)
+
+GAIN_RANGE = (-16, 16)  # dB, same as the tray window dials
+DEFAULT_SAMPLERATE = 44100
+# A device switch slower than this is logged as a warning
+SWITCH_BUDGET_MS = 100
+
+
+class CommandError(Exception):
+    pass
+
+
+def validate_gains(gains: dict, band_names=DEFAULT_FILTERS) -> dict:
+    """Check band names and gain values coming from outside the app; returns the gains as floats."""
+    bands = {name.lower(): name for name in band_names}
+    validated = {}
+    for band, value in gains.items():
+        name = bands.get(str(band).lower())
+        if name is None:
+            raise CommandError(f"Unknown band {band!r}, expected one of: {', '.join(band_names)}")
+        try:
+            gain = float(value)
+        except (TypeError, ValueError):
+            raise CommandError(f"Invalid gain {value!r} for {name}")
+        if not GAIN_RANGE[0] <= gain <= GAIN_RANGE[1]:
+            raise CommandError(f"Gain for {name} must be between {GAIN_RANGE[0]} and {GAIN_RANGE[1]} dB")
+        validated[name] = gain
+    return validated
+
+
+def _same_file(first: str, second: str) -> bool:
+    if not first or not second:
+        return False
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return os.path.realpath(first) == os.path.realpath(second)
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class EqController:
+    """Applies gain and device changes to the CamillaDSP config file and the running CamillaDSP.
+
+    Free of Qt, so it serves the tray window (from its executor thread) as well as the
+    headless daemon and the command line. Calls are serialized by a lock.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        # Gains last pushed to CamillaDSP in live mode
+        self.live_gains = {}
+        # Pipeline CamillaDSP runs after the last live push; None means the one in the file
+        self.live_pipeline = None
+        # Gains last applied or read, including ones not written to the file yet
+        self.current_gains = {}
+        # Gains another program changed in the config file, until taken by the UI
+        self.external_gains = {}
+        self.external_reshaped = False
+        # Band -> gain the controls showed before such a change; applying it again would undo the change
+        self.stale_gains = {}
+        # Duration of the last switch_device, None before the first one
+        self.last_switch_ms = None
+        self.lock = threading.RLock()
+
+    @traced("controller.read_gains")
+    @_locked
+    def read_gains(self) -> dict:
+        # CamillaDSP gets (re)loaded from the file afterwards, so nothing is live-patched anymore
+        self.live_gains = {}
+        self.live_pipeline = None
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = config.load() if config else None
+        selected_device = self.settings.playback_device
+        all_saved_devices = self.settings.devices
+        # All gains are read afresh, external changes included
+        if config:
+            config.take_external_change()
+        self.external_gains = {}
+        self.external_reshaped = False
+        self.stale_gains = {}
+
+        if not camilla_dsp_cfg:
+            return {}
+        # Ensure required structures; save if changed
+        changed = False
+        if camilla_dsp_cfg.get("title") != "CameliaEQ":
+            changed = True
+            camilla_dsp_cfg["title"] = "CameliaEQ"
+        if ensure_devices_section(camilla_dsp_cfg, selected_device, self.buffer_settings(selected_device)):
+            changed = True
+            if selected_device in all_saved_devices:
+                all_saved_devices.patch(selected_device, camilla_dsp_cfg)
+        if ensure_filters_and_pipelines(camilla_dsp_cfg, step_filters(camilla_dsp_cfg, self.settings.bands)):
+            changed = True
+        if ensure_mixers_and_processors(camilla_dsp_cfg):
+            changed = True
+        if optimize_pipeline(camilla_dsp_cfg):
+            changed = True
+        if changed:
+            config.save(camilla_dsp_cfg)
+        gains = self._file_gains(camilla_dsp_cfg)
+        self.current_gains = dict(gains)
+        return gains
+
+    def _file_gains(self, camilla_dsp_cfg: dict) -> dict:
+        gains = {}
+        for name, defn in band_filters(camilla_dsp_cfg, self.settings.bands).items():
+            gain = read_gain(camilla_dsp_cfg, name)
+            if gain is None:
+                gain = defn["parameters"]["gain"]
+            gains[name] = gain
+        return gains
+
+    @traced("controller.take_external_changes")
+    @_locked
+    def take_external_changes(self):
+        """(gains, reshaped) another program wrote to the config file since the last call, or None.
+
+        gains only holds the bands whose gain changed, unless reshaped: then bands were
+        added or removed, and gains holds all of them.
+        """
+        self._sync_external_changes()
+        gains, self.external_gains = self.external_gains, {}
+        reshaped, self.external_reshaped = self.external_reshaped, False
+        # The controls show the new gains from now on
+        self.stale_gains = {}
+        if not gains:
+            return None
+        return gains, reshaped
+
+    def _sync_external_changes(self) -> None:
+        """Adopt the gains another program changed in the config file since it was last read or written here.
+
+        The file wins: unsaved changes to the same bands are dropped (with a warning), and
+        the new gains are pushed to CamillaDSP in live mode so that it matches the file.
+        """
+        config = get_camilla_config(self.settings.config_path)
+        change = config.take_external_change() if config else None
+        if change is None:
+            return
+        before, after = (self._file_gains(cfg) for cfg in change)
+        if list(before) != list(after):
+            self.external_gains = dict(after)
+            self.external_reshaped = True
+            self.current_gains = dict(after)
+            return
+        changed = {name: gain for name, gain in after.items() if before[name] != gain}
+        if not changed:
+            return
+        conflicts = [name for name in changed if self.current_gains.get(name, before[name]) != before[name]]
+        if conflicts:
+            log.warning("Another program changed %s in the config file; those unsaved changes are dropped",
+                        ", ".join(conflicts))
+        else:
+            log.info("Config file changed by another program: %s", changed)
+        for name in changed:
+            self.stale_gains[name] = self.current_gains.get(name, before[name])
+        self.current_gains.update(changed)
+        self.external_gains.update(changed)
+        if self.settings.live_mode:
+            self.push_gains_live(changed)
+
+    def _drop_stale_gains(self, gains: dict) -> dict:
+        if not self.stale_gains:
+            return gains
+        return {name: gain for name, gain in gains.items() if self.stale_gains.get(name) != gain}
+
+    @traced("controller.read_live_state")
+    @_locked
+    def read_live_state(self):
+        """(gains, biquads, samplerate) of the config CamillaDSP is actually running.
+
+        Read over the websocket, without parsing or writing the file. None when CamillaDSP
+        cannot be reached, runs another config file or lacks some of the bands; callers then
+        fall back to read_gains and read_filters.
+        """
+        client = get_client(int(self.settings.port))
+        try:
+            path = client.request("GetConfigFilePath")
+            raw = client.request("GetConfigJson")
+        except CamillaDSPError:
+            return None
+        if not path or not raw or not _same_file(path, self.settings.config_path):
+            return None
+        try:
+            camilla_dsp_cfg = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(camilla_dsp_cfg, dict):
+            return None
+        gains = {}
+        for name in band_filters(camilla_dsp_cfg, self.settings.bands):
+            gain = read_gain(camilla_dsp_cfg, name)
+            if gain is None:
+                # Not normalized yet: read_gains will fix up the file
+                return None
+            gains[name] = gain
+        if not gains:
+            return None
+        self.current_gains = dict(gains)
+        # This is what runs, whether it came from the file or from earlier live patches
+        self.live_gains = dict(gains)
+        pipeline = camilla_dsp_cfg.get("pipeline")
+        self.live_pipeline = pipeline if isinstance(pipeline, list) else None
+        samplerate = (camilla_dsp_cfg.get("devices") or {}).get("samplerate") or DEFAULT_SAMPLERATE
+        return gains, pipeline_biquads(camilla_dsp_cfg), samplerate
+
+    @_locked
+    def band_names(self) -> list:
+        """Names of the bands the controls are bound to, in band order."""
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = config.load() if config else None
+        return list(band_filters(camilla_dsp_cfg or {}, self.settings.bands))
+
+    @_locked
+    def read_filters(self) -> tuple:
+        """Biquad parameters the pipeline runs (see pipeline_biquads) and the samplerate, from the file."""
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = config.load() if config else None
+        if not camilla_dsp_cfg:
+            return {}, DEFAULT_SAMPLERATE
+        samplerate = (camilla_dsp_cfg.get("devices") or {}).get("samplerate") or DEFAULT_SAMPLERATE
+        return pipeline_biquads(camilla_dsp_cfg), samplerate
+
+    @traced("controller.apply_gains")
+    @_locked
+    def apply_gains(self, gains: dict) -> str:
+        self._sync_external_changes()
+        gains = self._drop_stale_gains(gains)
+        if not gains:
+            return "unchanged"
+        self.current_gains.update(gains)
+        if self.settings.live_mode and self.push_gains_live(gains):
+            return "live"
+        self.persist_gains(gains)
+        port = int(self.settings.port)
+        if not try_reload_camilla_dsp(port):
+            # Saved, but CamillaDSP still runs the old gains
+            return "reload failed"
+        return "reloaded"
+
+    @_locked
+    def push_gains_live(self, gains: dict) -> bool:
+        """Patch only the changed gains into the running CamillaDSP; the YAML is written later.
+
+        Returns False when the patch could not be applied, so the caller falls back to a reload.
+        """
+        changed = {name: gain for name, gain in gains.items() if self.live_gains.get(name) != gain}
+        if not changed:
+            return True
+        pipeline = self.live_pipeline_for(changed)
+        if not try_patch_camilla_dsp(int(self.settings.port), make_gain_patch(changed, pipeline)):
+            self.live_gains = {}
+            self.live_pipeline = None
+            return False
+        self.live_gains.update(gains)
+        if pipeline is not None:
+            self.live_pipeline = pipeline
+        return True
+
+    def live_pipeline_for(self, gains: dict):
+        """The optimized pipeline for the running config with these gains, or None if it stays the same.
+
+        A band crossing 0 dB toggles the bypass flag of its step, which a gain patch alone would miss.
+        """
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = config.load() if config else None
+        if not camilla_dsp_cfg or not isinstance(camilla_dsp_cfg.get("pipeline"), list):
+            return None
+        if self.live_pipeline is None:
+            self.live_pipeline = copy_config(camilla_dsp_cfg["pipeline"])
+        draft = {
+            "filters": copy_config(camilla_dsp_cfg.get("filters") or {}),
+            "mixers": camilla_dsp_cfg.get("mixers"),
+            "processors": camilla_dsp_cfg.get("processors"),
+            "pipeline": copy_config(self.live_pipeline),
+        }
+        for name, gain in self.live_gains.items():
+            write_gain(draft, name, gain)
+        for name, gain in gains.items():
+            write_gain(draft, name, gain)
+        if not optimize_pipeline(draft):
+            return None
+        return draft["pipeline"]
+
+    @traced("controller.persist_gains")
+    @_locked
+    def persist_gains(self, gains: dict) -> None:
+        cfg_path = self.settings.config_path
+
+        if not cfg_path or not os.path.exists(cfg_path):
+            raise CommandError("Please set a valid CamillaDSP config file in Settings.")
+        config = get_camilla_config(cfg_path)
+        camilla_dsp_cfg = config.load()
+        if camilla_dsp_cfg is None:
+            raise CommandError("Failed to load YAML config.")
+        self._sync_external_changes()
+        gains = self._drop_stale_gains(gains)
+        # Stale values can only come from controls that had not caught up yet
+        self.stale_gains = {}
+
+        changed = False
+        if ensure_filters_and_pipelines(camilla_dsp_cfg, step_filters(camilla_dsp_cfg, self.settings.bands)):
+            changed = True
+        if ensure_mixers_and_processors(camilla_dsp_cfg):
+            changed = True
+        for name, gain in gains.items():
+            ok = write_gain(camilla_dsp_cfg, name, gain)
+            changed = changed or ok
+        if optimize_pipeline(camilla_dsp_cfg):
+            changed = True
+        if changed:
+            if not config.save(camilla_dsp_cfg):
+                raise CommandError("Failed to save YAML config.")
+            self.settings.devices[self.settings.playback_device] = camilla_dsp_cfg
+            self.settings.save()
+
+    @traced("controller.switch_device")
+    @_locked
+    def switch_device(self, selected_device: str, gains: dict) -> dict:
+        """Switch the playback device as one transaction: one config write, one settings write, one reload.
+
+        The outgoing device's profile keeps the given gains (what the controls show). The file
+        becomes the incoming device's profile, or the current config aimed at the new device
+        when it has none yet. Returns the gains of the new config.
+        """
+        start = time.perf_counter()
+        all_devices = self.settings.devices
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = None
+        if config and os.path.exists(self.settings.config_path):
+            camilla_dsp_cfg = config.load()
+        if camilla_dsp_cfg is not None:
+            self._sync_external_changes()
+            with span("switch.outgoing"):
+                for name, gain in self._drop_stale_gains(gains).items():
+                    write_gain(camilla_dsp_cfg, name, gain)
+                optimize_pipeline(camilla_dsp_cfg)
+                all_devices[self.settings.playback_device] = camilla_dsp_cfg
+            if selected_device in all_devices:
+                all_devices.patch(selected_device, camilla_dsp_cfg)
+        elif config and selected_device in all_devices:
+            camilla_dsp_cfg = all_devices[selected_device]
+        if camilla_dsp_cfg is None:
+            # Nothing to write, but the choice is still remembered
+            self.settings.playback_device = selected_device
+            self.settings.save()
+            raise CommandError("Please set a valid CamillaDSP config file in Settings.")
+
+        with span("switch.target"):
+            camilla_dsp_cfg["title"] = "CameliaEQ"
+            ensure_devices_section(camilla_dsp_cfg, selected_device, self.buffer_settings(selected_device))
+            ensure_filters_and_pipelines(camilla_dsp_cfg, step_filters(camilla_dsp_cfg, self.settings.bands))
+            ensure_mixers_and_processors(camilla_dsp_cfg)
+            optimize_pipeline(camilla_dsp_cfg)
+        if not config.save(camilla_dsp_cfg):
+            raise CommandError("Failed to save YAML config.")
+        all_devices[selected_device] = camilla_dsp_cfg
+        self.settings.playback_device = selected_device
+        self.settings.save()
+
+        gains = self._file_gains(camilla_dsp_cfg)
+        self.current_gains = dict(gains)
+        self.external_gains = {}
+        self.external_reshaped = False
+        self.stale_gains = {}
+        # The reload below puts CamillaDSP on the file, dropping anything live-patched
+        self.live_gains = {}
+        self.live_pipeline = None
+        with span("switch.reload"):
+            try_reload_camilla_dsp(int(self.settings.port))
+        self.last_switch_ms = (time.perf_counter() - start) * 1000
+        if self.last_switch_ms > SWITCH_BUDGET_MS:
+            log.warning("Switching to %s took %.0f ms (budget %d ms)", selected_device, self.last_switch_ms,
+                        SWITCH_BUDGET_MS)
+        else:
+            log.info("Switched to %s in %.1f ms", selected_device, self.last_switch_ms)
+        return gains
+
+    def latency_profile(self, device=None) -> str:
+        """Latency profile name of a playback device, the selected one by default."""
+        if device is None:
+            device = self.settings.playback_device
+        return self.settings.latency.get(device, DEFAULT_PROFILE)
+
+    def buffer_settings(self, device: str):
+        return buffer_settings(self.latency_profile(device))
+
+    @_locked
+    def buffer_size(self):
+        """(chunksize, target_level) of the config file, None without a readable config."""
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = config.load() if config else None
+        devices = camilla_dsp_cfg.get("devices") if camilla_dsp_cfg else None
+        if not isinstance(devices, dict) or not devices.get("chunksize"):
+            return None
+        # CamillaDSP's own default for a missing target_level
+        return devices["chunksize"], devices.get("target_level") or devices["chunksize"]
+
+    @_locked
+    def set_buffer_size(self, chunksize: int, target_level: int) -> bool:
+        """Write new buffer sizes for the selected device and reload CamillaDSP to use them."""
+        config = get_camilla_config(self.settings.config_path)
+        if not config or not config.load():
+            return False
+        # The reload drops whatever was only pushed live
+        if self.live_gains:
+            self.persist_gains(dict(self.live_gains))
+        camilla_dsp_cfg = config.load()
+        device = self.settings.playback_device
+        if not ensure_devices_section(camilla_dsp_cfg, device, (chunksize, target_level)):
+            return True
+        if not config.save(camilla_dsp_cfg):
+            return False
+        if device:
+            self.settings.devices[device] = camilla_dsp_cfg
+        return self.reload()
+
+    @_locked
+    def reload(self) -> bool:
+        self.live_gains = {}
+        self.live_pipeline = None
+        return try_reload_camilla_dsp(int(self.settings.port))
+
+    @traced("controller.reload_config")
+    @_locked
+    def reload_config(self) -> dict:
+        # If a config file is selected, ensure devices section exists/updated
+        config = get_camilla_config(self.settings.config_path)
+        if config:
+            cfg = config.load() or {}
+            device = self.settings.playback_device
+            changed = ensure_devices_section(cfg, device, self.buffer_settings(device))
+            if changed:
+                config.save(cfg)
+        gains = self.read_gains()
+        try_reload_camilla_dsp(int(self.settings.port))
+        return gains
+
+    @_locked
+    def status(self) -> dict:
+        """Current settings and gains, read without normalizing or writing anything."""
+        config = get_camilla_config(self.settings.config_path)
+        camilla_dsp_cfg = (config.load() if config else None) or {}
+        filters = camilla_dsp_cfg.get("filters")
+        gains = {}
+        for name in band_filters(camilla_dsp_cfg, self.settings.bands):
+            filter_cfg = filters.get(name) if isinstance(filters, dict) else None
+            params = filter_cfg.get("parameters") if isinstance(filter_cfg, dict) else None
+            gains[name] = params.get("gain") if isinstance(params, dict) else None
+        try:
+            state = get_client(int(self.settings.port)).request("GetState")
+        except CamillaDSPError:
+            state = None
+        return {
+            "config_path": self.settings.config_path,
+            "port": self.settings.port,
+            "playback_device": self.settings.playback_device,
+            "live_mode": self.settings.live_mode,
+            "latency": self.latency_profile(),
+            "last_switch_ms": self.last_switch_ms,
+            "bands": self.settings.bands,
+            "gains": gains,
+            "camilladsp_state": state,
+        }
@@ -0,0 +1,54 @@
+import logging
+import os
+import sys
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QTimer, Signal
+
+log = logging.getLogger(__name__)
+
+# ALSA creates and removes its device nodes here as cards come and go (udev).
+# /proc/asound does not deliver inotify events, so watching it would be pointless.
+LINUX_SOUND_DEVICE_DIRS = ("/dev/snd",)
+
+
+class DeviceMonitor(QObject):
+    """Emits devicesChanged (on the Qt thread) when playback devices may have changed.
+
+    Event sources are QMediaDevices.audioOutputsChanged and, on Linux, inotify on the
+    ALSA device directory. Polling is only used when neither of them is available.
+    Bursts of events (a card usually brings several device nodes) are merged.
+    """
+
+    devicesChanged = Signal()
+
+    def __init__(self, parent=None, debounce_ms: int = 100, poll_interval_ms: int = 3000):
+        super().__init__(parent)
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce_ms)
+        self._debounce.timeout.connect(self.devicesChanged.emit)
+
+        self._media_devices = None
+        self._watcher = None
+        self._poll_timer = None
+        try:
+            from PySide6.QtMultimedia import QMediaDevices
+            self._media_devices = QMediaDevices(self)
+            self._media_devices.audioOutputsChanged.connect(self._on_event)
+        except Exception as e:
+            log.info("QMediaDevices notifications unavailable: %s", e)
+            self._media_devices = None
+        if sys.platform.startswith("linux"):
+            paths = [p for p in LINUX_SOUND_DEVICE_DIRS if os.path.isdir(p)]
+            if paths:
+                self._watcher = QFileSystemWatcher(paths, self)
+                self._watcher.directoryChanged.connect(self._on_event)
+        if self._media_devices is None and self._watcher is None:
+            log.info("No device change notifications available, polling instead")
+            self._poll_timer = QTimer(self)
+            self._poll_timer.setInterval(poll_interval_ms)
+            self._poll_timer.timeout.connect(self.devicesChanged.emit)
+            self._poll_timer.start()
+
+    def _on_event(self, *args):
+        self._debounce.start()
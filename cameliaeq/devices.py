@@ -1,12 +1,23 @@
 import sys
+import threading
+import time
+
+from .tracing import span
+
+# Safety net only: device change events invalidate the cache right away
+DEVICE_CACHE_TTL = 60.0  # seconds
 
-from PySide6.QtMultimedia import QMediaDevices
 
 # System devices helper
-def list_system_playback_devices() -> list:
+def list_system_playback_devices(use_qt: bool = True) -> list:
+    """List playback device names.
+
+    Without use_qt, QtMultimedia is not imported and only the system commands are used.
+    """
     devices: list[str] = []
     try:
-        try:
+        if use_qt:
+            from PySide6.QtMultimedia import QMediaDevices
             devs = QMediaDevices.audioOutputs()
             for d in devs:
                 name = getattr(d, 'description', None)
@@ -16,8 +27,6 @@ def list_system_playback_devices() -> list:
                     name = getattr(d, 'deviceName', lambda: None)()
                 if name and name not in devices:
                     devices.append(str(name))
-        except Exception:
-            pass
     except Exception:
         pass
     # macOS: try CoreAudio via system command 'SwitchAudioSource' if present
@@ -52,3 +61,58 @@ def list_system_playback_devices() -> list:
     # Filter out devices with 'BlackHole' prefix
     devices = [d for d in devices if not str(d).startswith('BlackHole')]
     return devices
+
+
+class DeviceRegistry:
+    """Cached list of playback devices.
+
+    The list is enumerated again only when invalidated by a device change event or
+    once it is older than the TTL. generation is bumped whenever the list differs,
+    so consumers can skip work when nothing changed.
+    """
+
+    def __init__(self, ttl: float = DEVICE_CACHE_TTL, use_qt: bool = True):
+        self.ttl = ttl
+        self.use_qt = use_qt
+        self._devices: list[str] = []
+        self._generation = 0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def devices(self, allow_stale: bool = False) -> list:
+        """Return the cached devices, enumerating them first if needed.
+
+        With allow_stale, an expired or invalidated list is returned as is; the system is
+        only queried when nothing was ever enumerated.
+        """
+        with self._lock:
+            fetched_at = self._fetched_at
+        if fetched_at is None and self._generation == 0:
+            self.refresh()
+        elif not allow_stale and (fetched_at is None or time.monotonic() - fetched_at > self.ttl):
+            self.refresh()
+        with self._lock:
+            return list(self._devices)
+
+    def refresh(self) -> bool:
+        """Enumerate the devices now; returns True if the list changed."""
+        with span("devices.enumerate"):
+            devices = list_system_playback_devices(self.use_qt)
+        with self._lock:
+            self._fetched_at = time.monotonic()
+            if devices == self._devices and self._generation:
+                return False
+            self._devices = devices
+            self._generation += 1
+            return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fetched_at = None
+
+
+device_registry = DeviceRegistry()
@@ -0,0 +1,73 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable
+
+from PySide6.QtCore import QObject, Signal
+
+from .tracing import span
+
+log = logging.getLogger(__name__)
+
+
+class CommandExecutor(QObject):
+    """Runs commands on a background thread so the Qt thread never blocks on I/O.
+
+    Each kind has a handler receiving a dict with the latest value submitted for every key.
+    Commands run in the order they were submitted; a command is only coalesced with the
+    one at the tail of the queue when that is of the same kind, so values queued while a
+    handler is busy are merged and only the newest one per key is applied, but nothing
+    ever jumps ahead of an earlier command of another kind (a dial change made after a
+    device switch runs after it). Results and errors are delivered back on the Qt thread
+    through the completed/failed signals.
+    """
+
+    completed = Signal(str, object)
+    failed = Signal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._handlers: dict[str, Callable[[dict], object]] = {}
+        # [kind, {key: value}] in submission order
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="CameliaEQ-executor", daemon=True)
+        self._thread.start()
+
+    def register(self, kind: str, handler: Callable[[dict], object]) -> None:
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, key, value=None) -> None:
+        with self._cond:
+            if self._stopped:
+                return
+            if self._pending and self._pending[-1][0] == kind:
+                self._pending[-1][1][key] = value
+            else:
+                self._pending.append([kind, {key: value}])
+            self._cond.notify()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Run whatever is still queued, then stop the worker thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                kind, values = self._pending.popleft()
+            try:
+                with span(f"command.{kind}"):
+                    result = self._handlers[kind](values)
+            except Exception as e:
+                log.error("Command %s failed: %s", kind, e)
+                self.failed.emit(kind, str(e))
+                continue
+            self.completed.emit(kind, result)
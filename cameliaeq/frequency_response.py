@@ -0,0 +1,169 @@
+"""Magnitude response of CamillaDSP Biquad filters, evaluated with NumPy.
+
+Coefficients follow the RBJ Audio EQ Cookbook, which CamillaDSP uses as well.
+Responses are evaluated for all filters at once over a log-spaced frequency grid
+and cached per filter parameter tuple, so moving one dial only recomputes one band.
+"""
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+DEFAULT_POINTS = 256
+MIN_FREQUENCY = 20.0  # Hz
+MAX_FREQUENCY = 20000.0  # Hz
+# Per-filter responses kept; 33 dial positions x 31 bands fit with room to spare
+FILTER_CACHE_SIZE = 4096
+
+
+class BiquadParameters(NamedTuple):
+    type: str
+    freq: float
+    gain: float = 0.0
+    q: Optional[float] = None
+    # Shelf steepness in dB/octave, used instead of q when set
+    slope: Optional[float] = None
+    # Peaking/notch/bandpass width in octaves, used instead of q when set
+    bandwidth: Optional[float] = None
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def biquad_parameters(parameters: dict) -> Optional[BiquadParameters]:
+    """Hashable parameters of a Biquad filter's "parameters" mapping, or None if unsupported."""
+    try:
+        params = BiquadParameters(
+            type=str(parameters["type"]),
+            freq=float(parameters["freq"]),
+            gain=float(parameters.get("gain") or 0.0),
+            q=_optional_float(parameters.get("q")),
+            slope=_optional_float(parameters.get("slope")),
+            bandwidth=_optional_float(parameters.get("bandwidth")),
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    return params if params.type in _COEFFICIENTS and params.freq > 0 else None
+
+
+def biquad_coefficients(params: BiquadParameters, samplerate: float) -> tuple:
+    """Normalized (b0, b1, b2, a1, a2) of one filter."""
+    w0 = 2 * math.pi * min(params.freq, samplerate * 0.4999) / samplerate
+    cos_w0, sin_w0 = math.cos(w0), math.sin(w0)
+    amplitude = 10 ** (params.gain / 40)
+    if params.bandwidth is not None:
+        alpha = sin_w0 * math.sinh(math.log(2) / 2 * params.bandwidth * w0 / sin_w0)
+    elif params.slope is not None and params.type in ("Lowshelf", "Highshelf"):
+        # CamillaDSP gives the shelf slope in dB/octave; the cookbook's S=1 is 12 dB/octave
+        s = max(params.slope, 1e-3) / 12
+        alpha = sin_w0 / 2 * math.sqrt(max((amplitude + 1 / amplitude) * (1 / s - 1) + 2, 0.0))
+    else:
+        alpha = sin_w0 / (2 * (params.q or 0.7071))
+    b0, b1, b2, a0, a1, a2 = _COEFFICIENTS[params.type](amplitude, cos_w0, alpha)
+    return b0 / a0, b1 / a0, b2 / a0, a1 / a0, a2 / a0
+
+
+def _peaking(a, c, alpha):
+    return 1 + alpha * a, -2 * c, 1 - alpha * a, 1 + alpha / a, -2 * c, 1 - alpha / a
+
+
+def _lowshelf(a, c, alpha):
+    k = 2 * math.sqrt(a) * alpha
+    return (a * ((a + 1) - (a - 1) * c + k), 2 * a * ((a - 1) - (a + 1) * c), a * ((a + 1) - (a - 1) * c - k),
+            (a + 1) + (a - 1) * c + k, -2 * ((a - 1) + (a + 1) * c), (a + 1) + (a - 1) * c - k)
+
+
+def _highshelf(a, c, alpha):
+    k = 2 * math.sqrt(a) * alpha
+    return (a * ((a + 1) + (a - 1) * c + k), -2 * a * ((a - 1) + (a + 1) * c), a * ((a + 1) + (a - 1) * c - k),
+            (a + 1) - (a - 1) * c + k, 2 * ((a - 1) - (a + 1) * c), (a + 1) - (a - 1) * c - k)
+
+
+_COEFFICIENTS = {
+    "Peaking": _peaking,
+    "Lowshelf": _lowshelf,
+    "Highshelf": _highshelf,
+    "Lowpass": lambda a, c, alpha: ((1 - c) / 2, 1 - c, (1 - c) / 2, 1 + alpha, -2 * c, 1 - alpha),
+    "Highpass": lambda a, c, alpha: ((1 + c) / 2, -(1 + c), (1 + c) / 2, 1 + alpha, -2 * c, 1 - alpha),
+    "Notch": lambda a, c, alpha: (1, -2 * c, 1, 1 + alpha, -2 * c, 1 - alpha),
+    "Bandpass": lambda a, c, alpha: (alpha, 0, -alpha, 1 + alpha, -2 * c, 1 - alpha),
+    "Allpass": lambda a, c, alpha: (1 - alpha, -2 * c, 1 + alpha, 1 + alpha, -2 * c, 1 - alpha),
+}
+
+
+@lru_cache(maxsize=8)
+def frequency_grid(samplerate: float, points: int = DEFAULT_POINTS) -> tuple:
+    """Log-spaced frequencies up to Nyquist (at most 20 kHz), with e^-jw and e^-2jw at each."""
+    top = min(MAX_FREQUENCY, samplerate / 2 * 0.999)
+    frequencies = np.geomspace(MIN_FREQUENCY, top, points)
+    z1 = np.exp(-2j * np.pi * frequencies / samplerate)
+    z2 = z1 * z1
+    for array in (frequencies, z1, z2):
+        array.flags.writeable = False
+    return frequencies, z1, z2
+
+
+def _evaluate(filters: list, samplerate: float, points: int) -> np.ndarray:
+    """Responses in dB, one row per filter, computed in one pass over the grid."""
+    _, z1, z2 = frequency_grid(samplerate, points)
+    b0, b1, b2, a1, a2 = (column[:, None] for column in
+                          np.array([biquad_coefficients(f, samplerate) for f in filters]).T)
+    numerator = b0 + b1 * z1 + b2 * z2
+    denominator = 1 + a1 * z1 + a2 * z2
+    power = (numerator.real ** 2 + numerator.imag ** 2) / (denominator.real ** 2 + denominator.imag ** 2)
+    return 10 * np.log10(np.maximum(power, 1e-20))
+
+
+_filter_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_filter_cache_lock = threading.Lock()
+
+
+def filter_responses(filters: Iterable[BiquadParameters], samplerate: float,
+                     points: int = DEFAULT_POINTS) -> list:
+    """Response in dB of every filter; only filters not seen before are evaluated."""
+    filters = list(filters)
+    responses = [None] * len(filters)
+    missing = []
+    with _filter_cache_lock:
+        for i, params in enumerate(filters):
+            cached = _filter_cache.get((params, samplerate, points))
+            if cached is None:
+                missing.append(i)
+            else:
+                _filter_cache.move_to_end((params, samplerate, points))
+                responses[i] = cached
+    if missing:
+        computed = _evaluate([filters[i] for i in missing], samplerate, points)
+        computed.flags.writeable = False
+        with _filter_cache_lock:
+            for i, row in zip(missing, computed):
+                responses[i] = row
+                _filter_cache[(filters[i], samplerate, points)] = row
+            while len(_filter_cache) > FILTER_CACHE_SIZE:
+                _filter_cache.popitem(last=False)
+    return responses
+
+
+@lru_cache(maxsize=64)
+def magnitude_response(filters: tuple, samplerate: float, points: int = DEFAULT_POINTS) -> tuple:
+    """Frequencies and combined magnitude in dB of a chain of filters (a tuple of BiquadParameters).
+
+    The returned arrays are shared between callers and read-only.
+    """
+    frequencies = frequency_grid(samplerate, points)[0]
+    if not filters:
+        total = np.zeros(points)
+    else:
+        total = np.sum(filter_responses(filters, samplerate, points), axis=0)
+    total.flags.writeable = False
+    return frequencies, total
+
+
+def clear_cache() -> None:
+    magnitude_response.cache_clear()
+    with _filter_cache_lock:
+        _filter_cache.clear()
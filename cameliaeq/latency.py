@@ -0,0 +1,159 @@
+"""Latency profiles: CamillaDSP buffer sizes per playback device, fixed or tuned while running.
+
+chunksize is how many frames CamillaDSP processes at a time and target_level how full it
+keeps the playback buffer. Bigger values cost latency but use less CPU and survive
+scheduling hiccups; a USB DAC is fine with small buffers where a Bluetooth headset needs
+large ones. Unless a profile is picked for the device, its config's values are left
+alone. The auto profile starts from whatever the device's config has and lets
+LatencyTuner move chunksize a step at a time while CamillaDSP runs; target_level is
+left as configured.
+"""
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from .camilla_client import CamillaDSPError, get_client
+
+log = logging.getLogger(__name__)
+
+
+class LatencyProfile(NamedTuple):
+    label: str
+    # None: the config's own values, left alone or to the auto-tuner
+    chunksize: Optional[int]
+    target_level: Optional[int]
+
+
+AUTO = "auto"
+# Devices nobody picked a profile for keep the buffer sizes written in their config
+DEFAULT_PROFILE = "config"
+LATENCY_PROFILES = {
+    DEFAULT_PROFILE: LatencyProfile("As in the config", None, None),
+    "low-latency": LatencyProfile("Low latency", 128, 128),
+    "balanced": LatencyProfile("Balanced", 256, 256),
+    "power-saving": LatencyProfile("Power saving", 1024, 2048),
+    AUTO: LatencyProfile("Auto-tune", None, None),
+}
+
+# Chunk sizes the tuner steps through
+CHUNKSIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+POLL_INTERVAL = 2.0  # seconds
+# Samples looked at before deciding, and polls skipped after a change while buffers refill
+WINDOW = 5
+COOLDOWN = 3
+# Lowest buffer level, relative to target_level, below which chunksize goes up, and the much
+# higher one it must stay above to go down; the gap keeps the tuner from flapping between two sizes
+UPSIZE_LEVEL = 0.25
+DOWNSIZE_LEVEL = 0.75
+# Processing load in percent; small chunks cost more per-chunk overhead, so a step down
+# roughly doubles it and LOW_LOAD must stay well below half of HIGH_LOAD
+HIGH_LOAD = 70.0
+LOW_LOAD = 30.0
+# Largest deviation of the rate adjust from 1 for the clocks to count as settled
+STABLE_DRIFT = 0.002
+# Each change reloads CamillaDSP (an audible gap): a step up, against underruns, may follow
+# the last change after MIN_CHANGE_INTERVAL, a step down only after DOWNSIZE_INTERVAL
+MIN_CHANGE_INTERVAL = 10.0  # seconds
+DOWNSIZE_INTERVAL = 60.0  # seconds
+
+
+def buffer_settings(profile: str) -> Optional[tuple]:
+    """(chunksize, target_level) of a profile, or None when the config's own values are kept."""
+    latency = LATENCY_PROFILES.get(profile) or LATENCY_PROFILES[DEFAULT_PROFILE]
+    if latency.chunksize is None:
+        return None
+    return latency.chunksize, latency.target_level
+
+
+class BufferSample(NamedTuple):
+    buffer_level: float  # frames
+    load: float  # percent
+    rate_adjust: float
+
+
+def next_chunksize(chunksize: int, target_level: int, samples: list) -> int:
+    """Chunksize the samples call for: a step up near an underrun, a step down when all is calm."""
+    if chunksize in CHUNKSIZES:
+        index = CHUNKSIZES.index(chunksize)
+    else:
+        index = min(range(len(CHUNKSIZES)), key=lambda i: abs(CHUNKSIZES[i] - chunksize))
+    lowest = min(s.buffer_level for s in samples)
+    load = max(s.load for s in samples)
+    drift = max(abs(s.rate_adjust - 1.0) for s in samples)
+    # The buffer is kept at target_level, so that is what the margins are measured against
+    if lowest < target_level * UPSIZE_LEVEL or load > HIGH_LOAD:
+        return CHUNKSIZES[min(index + 1, len(CHUNKSIZES) - 1)]
+    if lowest >= target_level * DOWNSIZE_LEVEL and load < LOW_LOAD and drift < STABLE_DRIFT:
+        return CHUNKSIZES[max(index - 1, 0)]
+    return CHUNKSIZES[index]
+
+
+class LatencyTuner:
+    """Polls CamillaDSP on a background thread and retunes chunksize for devices on the auto profile.
+
+    Idle (apart from a settings check per poll) while the current device uses a fixed profile.
+    """
+
+    def __init__(self, controller, interval: float = POLL_INTERVAL):
+        self.controller = controller
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._samples = []
+        self._cooldown = 0
+        # Counts as a change: nothing is stepped down right after startup
+        self._last_change = time.monotonic()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="CameliaEQ-latency", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self) -> None:
+        if self.controller.latency_profile() != AUTO:
+            self._samples.clear()
+            return
+        if self._cooldown:
+            self._cooldown -= 1
+            return
+        client = get_client(int(self.controller.settings.port))
+        try:
+            sample = BufferSample(
+                buffer_level=float(client.request("GetBufferLevel")),
+                load=float(client.request("GetProcessingLoad")),
+                rate_adjust=float(client.request("GetRateAdjust")),
+            )
+        except (CamillaDSPError, TypeError, ValueError):
+            # Not running (or not playing): nothing to tune
+            self._samples.clear()
+            return
+        self._samples.append(sample)
+        if len(self._samples) < WINDOW:
+            return
+        samples, self._samples = self._samples, []
+        buffer = self.controller.buffer_size()
+        if buffer is None:
+            return
+        chunksize, target_level = buffer
+        tuned = next_chunksize(chunksize, target_level, samples)
+        if tuned == chunksize:
+            return
+        interval = MIN_CHANGE_INTERVAL if tuned > chunksize else DOWNSIZE_INTERVAL
+        if time.monotonic() - self._last_change < interval:
+            return
+        log.info("Latency auto-tune: chunksize %d -> %d", chunksize, tuned)
+        # Only chunksize is tuned; target_level stays what the device's config says
+        self.controller.set_buffer_size(tuned, target_level)
+        self._last_change = time.monotonic()
+        self._cooldown = COOLDOWN
@@ -0,0 +1,226 @@
+"""CamillaDSP runtime metrics: polled on a background thread, kept in a ring buffer, exported for Prometheus.
+
+Samples go into fixed-size arrays, so a long-running daemon never grows. Export is
+either a textfile for node_exporter's textfile collector, rewritten atomically after
+every poll, or a /metrics endpoint on localhost, or both.
+"""
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .camilla_client import CamillaClient, CamillaDSPError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0  # seconds
+# 10 minutes at the default interval
+DEFAULT_CAPACITY = 300
+# Polled values, in ring buffer column order
+METRICS = ("processing_load", "buffer_level", "clipped_samples", "capture_rate")
+COMMANDS = ("GetProcessingLoad", "GetBufferLevel", "GetClippedSamples", "GetCaptureRate")
+# CamillaDSP processing states; "Offline" when it cannot be reached
+STATES = ("Offline", "Running", "Paused", "Inactive", "Starting", "Stalled")
+METRICS_PATH = "/metrics"
+
+
+class MetricsRing:
+    """Most recent samples of every metric, in preallocated arrays; NaN marks a missing value."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = array("d", [math.nan]) * capacity
+        self.columns = {name: array("d", [math.nan]) * capacity for name in METRICS}
+        self.states = array("b", [0]) * capacity
+        self.count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, values: dict, state: str) -> None:
+        with self._lock:
+            i = self._next
+            self.timestamps[i] = timestamp
+            for name, column in self.columns.items():
+                value = values.get(name)
+                column[i] = math.nan if value is None else value
+            self.states[i] = STATES.index(state) if state in STATES else 0
+            self._next = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def series(self, name: str) -> list:
+        """Values of one metric, oldest first."""
+        with self._lock:
+            column = self.columns[name]
+            start = (self._next - self.count) % self.capacity
+            if start + self.count <= self.capacity:
+                return column[start:start + self.count].tolist()
+            return column[start:].tolist() + column[:self._next].tolist()
+
+    def latest(self) -> Optional[tuple]:
+        """(timestamp, values, state) of the newest sample, None before the first one."""
+        with self._lock:
+            if not self.count:
+                return None
+            i = (self._next - 1) % self.capacity
+            values = {name: column[i] for name, column in self.columns.items()}
+            return self.timestamps[i], values, STATES[self.states[i]]
+
+
+class MetricsCollector:
+    """Polls CamillaDSP over its own websocket connection, so polls never queue behind gain changes."""
+
+    def __init__(self, port: int, interval: float = DEFAULT_INTERVAL, capacity: int = DEFAULT_CAPACITY,
+                 textfile: str = "", http_port: int = 0):
+        self.client = CamillaClient(port)
+        self.interval = interval
+        self.ring = MetricsRing(capacity)
+        self.textfile = textfile
+        self.http_port = http_port
+        self.polls = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="CameliaEQ-metrics", daemon=True)
+        self._thread.start()
+        if self.http_port:
+            self._start_server()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.client.close()
+
+    def set_port(self, port: int) -> None:
+        if port != self.client.port:
+            self.client.close()
+            self.client = CamillaClient(port)
+
+    def _run(self) -> None:
+        while True:
+            self.poll()
+            if self._stop.wait(self.interval):
+                return
+
+    def poll(self) -> None:
+        values = {}
+        state = "Offline"
+        self.polls += 1
+        try:
+            state = str(self.client.request("GetState"))
+            for name, command in zip(METRICS, COMMANDS):
+                values[name] = float(self.client.request(command))
+        except (CamillaDSPError, TypeError, ValueError):
+            # Whatever was read before the failure is kept
+            self.failures += 1
+        self.ring.append(time.time(), values, state)
+        if self.textfile:
+            try:
+                self.write_textfile(self.textfile)
+            except OSError as e:
+                log.warning("Metrics textfile not written: %s", e)
+
+    def prometheus_text(self) -> str:
+        lines = []
+
+        def gauge(name, help_text, value, kind="gauge", labels=""):
+            lines.append(f"# HELP cameliaeq_{name} {help_text}")
+            lines.append(f"# TYPE cameliaeq_{name} {kind}")
+            lines.append(f"cameliaeq_{name}{labels} {_format(value)}")
+
+        latest = self.ring.latest()
+        gauge("metrics_polls_total", "CamillaDSP polls made.", self.polls, "counter")
+        gauge("metrics_poll_failures_total", "CamillaDSP polls that failed.", self.failures, "counter")
+        if latest is None:
+            return "\n".join(lines) + "\n"
+        timestamp, values, state = latest
+        gauge("camilladsp_up", "1 if CamillaDSP answered the last poll.", 0 if state == "Offline" else 1)
+        lines.append("# HELP cameliaeq_camilladsp_state CamillaDSP processing state.")
+        lines.append("# TYPE cameliaeq_camilladsp_state gauge")
+        for name in STATES[1:]:
+            lines.append(f'cameliaeq_camilladsp_state{{state="{name}"}} {int(name == state)}')
+        gauge("camilladsp_processing_load_percent", "Processing load at the last poll.", values["processing_load"])
+        # Spikes between two scrapes would otherwise go unseen
+        loads = [v for v in self.ring.series("processing_load") if not math.isnan(v)]
+        gauge("camilladsp_processing_load_max_percent", "Highest processing load in the ring buffer.",
+              max(loads) if loads else math.nan)
+        levels = [v for v in self.ring.series("buffer_level") if not math.isnan(v)]
+        gauge("camilladsp_buffer_level_frames", "Playback buffer level at the last poll.", values["buffer_level"])
+        gauge("camilladsp_buffer_level_min_frames", "Lowest buffer level in the ring buffer; near 0 means xruns.",
+              min(levels) if levels else math.nan)
+        gauge("camilladsp_clipped_samples_total", "Samples clipped since CamillaDSP started.",
+              values["clipped_samples"], "counter")
+        gauge("camilladsp_capture_rate_hz", "Measured capture sample rate.", values["capture_rate"])
+        gauge("metrics_last_poll_timestamp_seconds", "Time of the last poll.", timestamp)
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        # node_exporter must never read a half-written file
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".cameliaeq.", suffix=".prom.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _start_server(self) -> None:
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != METRICS_PATH:
+                    self.send_error(404)
+                    return
+                body = collector.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            # Localhost only: the endpoint has no authentication
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.http_port), Handler)
+        except OSError as e:
+            log.warning("Metrics endpoint not started: %s", e)
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="CameliaEQ-metrics-http", daemon=True).start()
+        log.info("Metrics endpoint listening on http://127.0.0.1:%d%s", self._server.server_address[1], METRICS_PATH)
+
+
+def create_metrics_collector(settings) -> MetricsCollector:
+    return MetricsCollector(int(settings.port), interval=float(settings.metrics_interval or DEFAULT_INTERVAL),
+                            textfile=settings.metrics_textfile, http_port=int(settings.metrics_port or 0))
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        return repr(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    return str(value)
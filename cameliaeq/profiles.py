@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+from collections.abc import MutableMapping
+from typing import Optional
+from urllib.parse import quote, unquote
+
+from .camilla_dsp import write_yaml_atomically
+from .yaml_io import copy_config, load_yaml
+
+log = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".yml"
+# Shared config all profiles are stored against; dot files never collide with device names
+BASE_FILE = ".base" + PROFILE_SUFFIX
+# Marks a profile file holding a delta; files without it are full configs from older versions
+DELTA_KEY = "__delta__"
+# Inside a delta: keys of the base that the profile does not have
+DELETED_KEY = "__deleted__"
+# Inside a delta: the changed items of a list as long as the base's, by index
+ITEMS_KEY = "__items__"
+
+
+def make_delta(base: dict, target: dict) -> dict:
+    """Return the minimal patch turning base into target.
+
+    Nested dicts are diffed recursively, and so are lists of the same length (such as
+    the pipeline with a band step bypassed), under ITEMS_KEY; any other differing value
+    is carried whole. Keys missing from target are listed under DELETED_KEY.
+    """
+    delta = {}
+    for key, value in target.items():
+        if key not in base:
+            delta[key] = copy_config(value)
+            continue
+        sub = _value_delta(base[key], value)
+        if sub is not None:
+            delta[key] = sub
+    deleted = [key for key in base if key not in target]
+    if deleted:
+        delta[DELETED_KEY] = deleted
+    return delta
+
+
+def _value_delta(base, value):
+    """Delta of a single value, None when it did not change."""
+    if isinstance(value, dict) and isinstance(base, dict):
+        return make_delta(base, value) or None
+    if isinstance(value, list) and isinstance(base, list) and len(value) == len(base):
+        items = {}
+        for i, (before, after) in enumerate(zip(base, value)):
+            sub = _value_delta(before, after)
+            if sub is not None:
+                items[i] = sub
+        return {ITEMS_KEY: items} if items else None
+    if value != base or type(value) is not type(base):
+        return copy_config(value)
+    return None
+
+
+def apply_delta(cfg: dict, delta: dict) -> dict:
+    """Patch cfg in place with a delta from make_delta, touching only the keys it names."""
+    for key in delta.get(DELETED_KEY, ()):
+        cfg.pop(key, None)
+    for key, value in delta.items():
+        if key == DELETED_KEY:
+            continue
+        cfg[key] = _apply_value_delta(cfg.get(key), value)
+    return cfg
+
+
+def _apply_value_delta(current, value):
+    if isinstance(value, dict) and ITEMS_KEY in value and isinstance(current, list):
+        for i, item in value[ITEMS_KEY].items():
+            # A base edited by hand may have lost the item
+            if 0 <= i < len(current):
+                current[i] = _apply_value_delta(current[i], item)
+        return current
+    if isinstance(value, dict) and isinstance(current, dict):
+        return apply_delta(current, value)
+    return copy_config(value)
+
+
+class ProfileStore(MutableMapping):
+    """Per-device CamillaDSP configs, stored as deltas against one shared base config.
+
+    Each playback device gets its own file holding only what differs from the base,
+    which in practice is the playback device and a few gains. Full configs are
+    materialized on access, so callers get a fresh dict they are free to mutate.
+    Storing a profile writes only that device's file, and is skipped when its delta
+    did not change. Files are read lazily, on first access.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._base: Optional[dict] = None
+        # device name -> delta, or None while the file has not been read yet
+        self._deltas: Optional[dict] = None
+        # Devices whose file still holds a full config, from before profiles were stored as deltas
+        self._legacy: set = set()
+
+    def _path(self, name: str) -> str:
+        # Device names may contain slashes, colons etc.; keep them reversible in the file name
+        file_name = quote(name, safe=" ()[]+,-")
+        if file_name.startswith("."):
+            file_name = "%2E" + file_name[1:]
+        return os.path.join(self.directory, file_name + PROFILE_SUFFIX)
+
+    def _read(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return load_yaml(f) or {}
+
+    def _load_base(self) -> Optional[dict]:
+        if self._base is None:
+            try:
+                self._base = self._read(os.path.join(self.directory, BASE_FILE))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log.warning("Profile base load failure: %s", e)
+        return self._base
+
+    def _index(self) -> dict:
+        if self._deltas is None:
+            deltas = {}
+            try:
+                for entry in os.listdir(self.directory):
+                    if entry.endswith(PROFILE_SUFFIX) and not entry.startswith("."):
+                        deltas[unquote(entry[: -len(PROFILE_SUFFIX)])] = None
+            except OSError:
+                pass
+            self._deltas = deltas
+        return self._deltas
+
+    def _delta(self, name: str) -> dict:
+        deltas = self._index()
+        if name not in deltas:
+            raise KeyError(name)
+        if deltas[name] is None:
+            try:
+                data = self._read(self._path(name))
+            except Exception as e:
+                log.warning("Profile %s load failure: %s", name, e)
+                raise KeyError(name) from e
+            if DELTA_KEY in data:
+                deltas[name] = data[DELTA_KEY] or {}
+            else:
+                # A full config written by an older version; it gets stored as a delta on the next save
+                deltas[name] = make_delta(self._load_base() or {}, data)
+                self._legacy.add(name)
+        return deltas[name]
+
+    def __getitem__(self, name: str) -> dict:
+        with self._lock:
+            delta = self._delta(name)
+            return apply_delta(copy_config(self._load_base() or {}), delta)
+
+    def __setitem__(self, name: str, cfg: dict) -> None:
+        if not isinstance(name, str) or not name.strip():
+            # Empty names would produce invalid entries; there is nothing to attach them to anyway
+            return
+        with self._lock:
+            deltas = self._index()
+            base = self._load_base()
+            if base is None:
+                # The first profile ever stored becomes the base everything else is diffed against
+                os.makedirs(self.directory, exist_ok=True)
+                base = copy_config(cfg)
+                write_yaml_atomically(os.path.join(self.directory, BASE_FILE), base)
+                self._base = base
+            delta = make_delta(base, cfg)
+            if name in deltas:
+                try:
+                    # A legacy full-config file is rewritten even when its values match
+                    if self._delta(name) == delta and name not in self._legacy:
+                        return
+                except KeyError:
+                    pass
+            os.makedirs(self.directory, exist_ok=True)
+            write_yaml_atomically(self._path(name), {DELTA_KEY: delta})
+            deltas[name] = delta
+            self._legacy.discard(name)
+            log.info("Profile saved: %s", name)
+
+    def patch(self, name: str, cfg: dict) -> dict:
+        """Turn cfg into the stored profile of name in place, touching only what differs.
+
+        Returns the delta that was applied, empty when cfg already matched the profile.
+        """
+        delta = make_delta(cfg, self[name])
+        apply_delta(cfg, delta)
+        return delta
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            deltas = self._index()
+            if name not in deltas:
+                raise KeyError(name)
+            del deltas[name]
+            self._legacy.discard(name)
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, name) -> bool:
+        with self._lock:
+            return name in self._index()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._index()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+    def __repr__(self) -> str:
+        return f"ProfileStore({self.directory!r}, {len(self)} profiles)"
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+from PySide6.QtCore import QPointF, Qt
+from PySide6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PySide6.QtWidgets import QWidget
+
+# Vertical range of the plot
+DB_RANGE = 18.0
+GRID_FREQUENCIES = (100, 1000, 10000)
+
+
+class ResponseCurve(QWidget):
+    """Plot of the EQ magnitude response on a log frequency axis."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(70)
+        self._frequencies = None
+        self._db = None
+        self._polygon = None
+
+    def set_curve(self, frequencies: np.ndarray, db: np.ndarray) -> None:
+        if frequencies is self._frequencies and db is self._db:
+            return
+        self._frequencies = frequencies
+        self._db = db
+        self._polygon = None
+        # Repaints are coalesced by Qt, so dragging a dial never paints more than once per frame
+        self.update()
+
+    def resizeEvent(self, event):
+        self._polygon = None
+        super().resizeEvent(event)
+
+    def _x(self, frequencies):
+        low, high = math.log10(self._frequencies[0]), math.log10(self._frequencies[-1])
+        return (np.log10(frequencies) - low) / (high - low) * (self.width() - 1)
+
+    def _y(self, db):
+        return (1 - (np.clip(db, -DB_RANGE, DB_RANGE) + DB_RANGE) / (2 * DB_RANGE)) * (self.height() - 1)
+
+    def _curve_polygon(self) -> QPolygonF:
+        if self._polygon is None:
+            xs = self._x(self._frequencies)
+            ys = self._y(self._db)
+            self._polygon = QPolygonF([QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())])
+        return self._polygon
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.fillRect(self.rect(), self.palette().base())
+        if self._frequencies is None:
+            return
+        grid_pen = QPen(self.palette().mid().color())
+        grid_pen.setStyle(Qt.DotLine)
+        painter.setPen(grid_pen)
+        zero = float(self._y(0.0))
+        painter.drawLine(QPointF(0, zero), QPointF(self.width(), zero))
+        for frequency in GRID_FREQUENCIES:
+            if self._frequencies[0] < frequency < self._frequencies[-1]:
+                x = float(self._x(frequency))
+                painter.drawLine(QPointF(x, 0), QPointF(x, self.height()))
+        painter.setPen(QPen(QColor(70, 130, 180), 2))  # steel blue, like the tray icon
+        painter.drawPolyline(self._curve_polygon())
@@ -1,20 +1,14 @@
+import logging
 import os
 import sys
 from dataclasses import dataclass, field
 
-import yaml
-from PySide6.QtCore import Qt
-from PySide6.QtWidgets import (
-    QWidget,
-    QFormLayout,
-    QLineEdit,
-    QPushButton,
-    QGridLayout,
-    QFileDialog,
-    QSpinBox,
-)
+from .bands import DEFAULT_LAYOUT
+from .camilla_dsp import write_yaml_atomically
+from .profiles import ProfileStore
+from .yaml_io import copy_config, load_yaml
 
-from .camilla_dsp import load_camilla_dsp_yaml, save_camilla_dsp_yaml, ensure_devices_section, try_reload_camilla_dsp
+log = logging.getLogger(__name__)
 
 
 def user_config_dir() -> str:
@@ -34,6 +28,8 @@ def user_config_dir() -> str:
 
 APP_NAME = "CameliaEQ"
 SETTINGS_PATH = os.path.join(user_config_dir(), "settings.yml")
+# One CamillaDSP config per playback device
+PROFILES_DIR = os.path.join(user_config_dir(), "profiles")
 
 
 @dataclass
@@ -41,85 +37,66 @@ class Settings:
     config_path: str = ""
     port: int = 1234
     playback_device: str = ""
-    devices: dict = field(default_factory=dict)
+    devices: ProfileStore = field(default_factory=lambda: ProfileStore(PROFILES_DIR))
+    # Push gain changes straight to the running CamillaDSP and write the YAML lazily
+    live_mode: bool = True
+    # Band layout the controls are bound to, a key of bands.LAYOUTS
+    bands: str = DEFAULT_LAYOUT
+    # Latency profile of each playback device, a key of latency.LATENCY_PROFILES
+    latency: dict = field(default_factory=dict)
+    # CamillaDSP metrics: poll interval in seconds, Prometheus textfile path and localhost
+    # /metrics port; an empty path or port 0 turns that export off
+    metrics_interval: float = 2.0
+    metrics_textfile: str = ""
+    metrics_port: int = 0
+    # Last state written to (or read from) settings.yml, used to skip no-op saves
+    _persisted: dict = field(default=None, init=False, repr=False, compare=False)
 
     @classmethod
     def load(cls) -> "Settings":
         try:
             if os.path.exists(SETTINGS_PATH):
                 with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
-                    data = yaml.safe_load(f) or {}
-                settings = cls(**{k: data.get(k, v) for k, v in {"config_path": "", "port": 1234, "playback_device": "", "devices": {}}.items()})
-                print(f"Settings loaded: \n{settings}")
+                    data = load_yaml(f) or {}
+                settings = cls(**{k: data.get(k, v) for k, v in {"config_path": "", "port": 1234, "playback_device": "", "live_mode": True, "bands": DEFAULT_LAYOUT, "metrics_interval": 2.0, "metrics_textfile": "", "metrics_port": 0}.items()})
+                # YAML reads "bands: 10" as a number
+                settings.bands = str(settings.bands)
+                latency = data.get("latency")
+                if isinstance(latency, dict):
+                    settings.latency = {str(k): str(v) for k, v in latency.items()}
+                settings._persisted = copy_config(data)
+                log.info("Settings loaded: %s", settings)
+                settings.migrate_devices(data.get("devices"))
                 return settings
         except Exception as e:
             pass
-            print("Settings load failure:", e)
+            log.warning("Settings load failure: %s", e)
         return cls()
 
-    def save(self) -> None:
-        # Sanitize devices: drop empty-string keys to avoid invalid YAML entries like "? ''"
-        devices = {k: v for k, v in (self.devices or {}).items() if isinstance(k, str) and k.strip()}
-        with open(SETTINGS_PATH, "w", encoding="utf-8") as f:
-            settings = {
-                "config_path": self.config_path,
-                "port": self.port,
-                "playback_device": self.playback_device,
-                "devices": devices,
-            }
-            yaml.safe_dump(settings, f, sort_keys=False)
-            print(f"Settings saved: \n{settings}")
-
-
-class SettingsWindow(QWidget):
-    def __init__(self, settings: Settings, on_save):
-        super().__init__()
-        self.settings = settings
-        # Make settings a tool window and always on top
-        self.setWindowFlags(self.windowFlags() | Qt.Tool | Qt.WindowStaysOnTopHint)
-        self.setWindowTitle(f"{APP_NAME} Settings")
-        self.on_save = on_save
-        layout = QFormLayout()
-
-        self.path_edit = QLineEdit(self.settings.config_path)
-        self.browse_btn = QPushButton("Browse…")
-        self.browse_btn.clicked.connect(self.browse)
-
-        path_row = QWidget()
-        path_row_layout = QGridLayout(path_row)
-        path_row_layout.setContentsMargins(0, 0, 0, 0)
-        path_row_layout.addWidget(self.path_edit, 0, 0)
-        path_row_layout.addWidget(self.browse_btn, 0, 1)
-
-        layout.addRow("CamillaDSP config file", path_row)
+    def migrate_devices(self, devices) -> None:
+        """Move per-device configs that older versions kept in settings.yml into the profile store."""
+        if not isinstance(devices, dict) or not devices:
+            return
+        for name, cfg in devices.items():
+            if isinstance(name, str) and name.strip() and name not in self.devices:
+                self.devices[name] = cfg
+        self.save()
 
-        self.port_spin = QSpinBox()
-        self.port_spin.setRange(1, 65535)
-        self.port_spin.setValue(self.settings.port)
-        layout.addRow("CamillaDSP port", self.port_spin)
-
-        self.save_btn = QPushButton("Save")
-        self.save_btn.clicked.connect(self.save)
-        layout.addRow(self.save_btn)
-
-        self.setLayout(layout)
-        self.setFixedSize(self.sizeHint())
-
-    def browse(self):
-        file, _ = QFileDialog.getOpenFileName(self, "Select CamillaDSP YAML config", "", "YAML Files (*.yaml *.yml)")
-        if file:
-            self.path_edit.setText(file)
-
-    def save(self):
-        self.settings.config_path = self.path_edit.text()
-        self.settings.port = int(self.port_spin.value())
-        self.settings.save()
-        # If a config file is selected, ensure devices section exists/updated
-        if self.settings.config_path:
-            cfg = load_camilla_dsp_yaml(self.settings.config_path) or {}
-            changed = ensure_devices_section(cfg, self.settings.playback_device)
-            if changed:
-                save_camilla_dsp_yaml(self.settings.config_path, cfg)
-        self.on_save()
-        try_reload_camilla_dsp(self.settings.port)
-        self.close()
+    def save(self) -> None:
+        # Device profiles are stored on their own by ProfileStore; settings.yml keeps the small stuff
+        settings = {
+            "config_path": self.config_path,
+            "port": self.port,
+            "playback_device": self.playback_device,
+            "live_mode": self.live_mode,
+            "bands": self.bands,
+            "latency": dict(self.latency),
+            "metrics_interval": self.metrics_interval,
+            "metrics_textfile": self.metrics_textfile,
+            "metrics_port": self.metrics_port,
+        }
+        if settings == self._persisted:
+            return
+        write_yaml_atomically(SETTINGS_PATH, settings)
+        self._persisted = copy_config(settings)
+        log.info("Settings saved: %s", settings)
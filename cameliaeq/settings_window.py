@@ -0,0 +1,88 @@
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (
+    QWidget,
+    QFormLayout,
+    QLineEdit,
+    QPushButton,
+    QGridLayout,
+    QFileDialog,
+    QSpinBox,
+    QCheckBox,
+    QComboBox,
+)
+
+from .bands import LAYOUTS
+from .latency import DEFAULT_PROFILE, LATENCY_PROFILES
+from .settings import Settings, APP_NAME
+
+
+class SettingsWindow(QWidget):
+    def __init__(self, settings: Settings, on_save):
+        super().__init__()
+        self.settings = settings
+        # Make settings a tool window and always on top
+        self.setWindowFlags(self.windowFlags() | Qt.Tool | Qt.WindowStaysOnTopHint)
+        self.setWindowTitle(f"{APP_NAME} Settings")
+        self.on_save = on_save
+        layout = QFormLayout()
+
+        self.path_edit = QLineEdit(self.settings.config_path)
+        self.browse_btn = QPushButton("Browse…")
+        self.browse_btn.clicked.connect(self.browse)
+
+        path_row = QWidget()
+        path_row_layout = QGridLayout(path_row)
+        path_row_layout.setContentsMargins(0, 0, 0, 0)
+        path_row_layout.addWidget(self.path_edit, 0, 0)
+        path_row_layout.addWidget(self.browse_btn, 0, 1)
+
+        layout.addRow("CamillaDSP config file", path_row)
+
+        self.port_spin = QSpinBox()
+        self.port_spin.setRange(1, 65535)
+        self.port_spin.setValue(self.settings.port)
+        layout.addRow("CamillaDSP port", self.port_spin)
+
+        self.live_check = QCheckBox("Apply knob changes live, without reloading")
+        self.live_check.setChecked(self.settings.live_mode)
+        layout.addRow(self.live_check)
+
+        self.bands_combo = QComboBox()
+        for key, label in LAYOUTS.items():
+            self.bands_combo.addItem(label, key)
+        self.bands_combo.setCurrentIndex(max(0, self.bands_combo.findData(self.settings.bands)))
+        layout.addRow("EQ bands", self.bands_combo)
+
+        # Buffer sizes are kept per playback device
+        self.latency_combo = QComboBox()
+        for key, profile in LATENCY_PROFILES.items():
+            self.latency_combo.addItem(profile.label, key)
+        device = self.settings.playback_device
+        current = self.settings.latency.get(device, DEFAULT_PROFILE)
+        self.latency_combo.setCurrentIndex(max(0, self.latency_combo.findData(current)))
+        self.latency_combo.setEnabled(bool(device))
+        layout.addRow(f"Latency for {device}" if device else "Latency", self.latency_combo)
+
+        self.save_btn = QPushButton("Save")
+        self.save_btn.clicked.connect(self.save)
+        layout.addRow(self.save_btn)
+
+        self.setLayout(layout)
+        self.setFixedSize(self.sizeHint())
+
+    def browse(self):
+        file, _ = QFileDialog.getOpenFileName(self, "Select CamillaDSP YAML config", "", "YAML Files (*.yaml *.yml)")
+        if file:
+            self.path_edit.setText(file)
+
+    def save(self):
+        self.settings.config_path = self.path_edit.text()
+        self.settings.port = int(self.port_spin.value())
+        self.settings.live_mode = self.live_check.isChecked()
+        self.settings.bands = self.bands_combo.currentData()
+        if self.settings.playback_device:
+            self.settings.latency[self.settings.playback_device] = self.latency_combo.currentData()
+        self.settings.save()
+        # The config file is normalized and CamillaDSP reloaded by on_save, off the Qt thread
+        self.on_save()
+        self.close()
@@ -0,0 +1,43 @@
+import math
+
+from PySide6.QtCore import QPointF, Qt
+from PySide6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PySide6.QtWidgets import QWidget
+
+# Loads at or above this are drawn in red
+HIGH_LOAD = 70.0
+
+
+class Sparkline(QWidget):
+    """Tiny plot of recent CamillaDSP processing load, with the latest readings as text."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(24)
+        self._values = []
+        self._text = "CamillaDSP: no data"
+
+    def set_values(self, values: list, text: str) -> None:
+        if values == self._values and text == self._text:
+            return
+        self._values = values
+        self._text = text
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        width, height = self.width(), self.height()
+        known = [v for v in self._values if not math.isnan(v)]
+        if len(known) > 1:
+            top = max(max(known), 10.0)  # percent; keep idle noise flat
+            step = width / max(len(self._values) - 1, 1)
+            polygon = QPolygonF()
+            for i, value in enumerate(self._values):
+                if not math.isnan(value):
+                    polygon.append(QPointF(i * step, height - 1 - value / top * (height - 2)))
+            color = QColor(200, 60, 60) if known[-1] >= HIGH_LOAD else QColor(70, 130, 180)
+            painter.setPen(QPen(color, 1.5))
+            painter.drawPolyline(polygon)
+        painter.setPen(self.palette().text().color())
+        painter.drawText(self.rect().adjusted(2, 0, -2, 0), Qt.AlignRight | Qt.AlignVCenter, self._text)
@@ -0,0 +1,49 @@
+"""Startup timing report, enabled with --profile-startup.
+
+Phases are timed with the phase() context manager and printed once the tray
+window has read its initial values. When profiling is off, phase() does nothing but yield.
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+FLAG = "--profile-startup"
+
+
+class StartupProfile:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases = []
+        self.marks = []
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled or self.reported:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark(self, name: str) -> None:
+        """Record a point in time, relative to startup (e.g. "tray visible")."""
+        if self.enabled and not self.reported:
+            self.marks.append((name, time.perf_counter() - self.started))
+
+    def report(self) -> None:
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        lines = ["Startup profile:"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<28} {seconds * 1000:8.1f} ms")
+        for name, seconds in self.marks:
+            lines.append(f"  {'@ ' + name:<28} {seconds * 1000:8.1f} ms since start")
+        print("\n".join(lines))
+
+
+startup_profile = StartupProfile(enabled=FLAG in sys.argv[1:])
@@ -0,0 +1,121 @@
+"""Timing spans and queued logging.
+
+Spans time the slow paths (YAML load/save, config normalization, CamillaDSP round
+trips, device enumeration) into a ring buffer; a summary table or a Chrome trace
+(chrome://tracing, Perfetto) of it is available at any time through the control API:
+
+    python -m cameliaeq trace
+    python -m cameliaeq trace --chrome trace.json
+
+Log records are handed to a queue and written by a listener thread, so the Qt thread
+never waits on stderr. Set CAMELIAEQ_LOG=debug to see every dial tick.
+"""
+import atexit
+import functools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Spans kept; older ones are dropped
+SPAN_CAPACITY = 4096
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+LOG_LEVEL_ENV = "CAMELIAEQ_LOG"
+
+# (name, start in ns since the epoch of perf_counter_ns, duration in ns, thread id)
+_spans = deque(maxlen=SPAN_CAPACITY)
+_listener = None
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block under name."""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        # deque.append is atomic, no lock needed
+        _spans.append((name, start, time.perf_counter_ns() - start, threading.get_ident()))
+
+
+def traced(name: str):
+    """Decorator form of span()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def spans() -> list:
+    return list(_spans)
+
+
+def clear_spans() -> None:
+    _spans.clear()
+
+
+def summary() -> str:
+    """Per-span count, mean, 90th percentile and max in ms, slowest total first."""
+    durations = {}
+    for name, _, duration, _ in spans():
+        durations.setdefault(name, []).append(duration / 1e6)
+    rows = []
+    for name, values in durations.items():
+        values.sort()
+        p90 = values[min(len(values) - 1, int(0.9 * len(values)))]
+        rows.append((sum(values), name, len(values), sum(values) / len(values), p90, values[-1]))
+    rows.sort(reverse=True)
+    lines = [f"{'span':<32} {'n':>6} {'mean ms':>9} {'p90 ms':>9} {'max ms':>9} {'total ms':>10}"]
+    for total, name, count, mean, p90, longest in rows:
+        lines.append(f"{name:<32} {count:>6} {mean:>9.3f} {p90:>9.3f} {longest:>9.3f} {total:>10.1f}")
+    return "\n".join(lines)
+
+
+def chrome_trace() -> dict:
+    """The spans as a Chrome trace event document ("X" complete events, microseconds)."""
+    pid = os.getpid()
+    events = [
+        {"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": tid}
+        for name, start, duration, tid in spans()
+    ]
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    for tid in {event["tid"] for event in events}:
+        if tid in thread_names:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": thread_names[tid]}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def setup_logging(level=None) -> None:
+    """Send the app's log records through a queue to stderr; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV, "INFO").upper()
+    logger = logging.getLogger("cameliaeq")
+    logger.setLevel(level)
+    logger.propagate = False
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, stream)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write out whatever is still queued."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,4 +1,4 @@
-import os
+import logging
 
 from PySide6 import QtCore
 from PySide6.QtCore import QTimer, Qt
@@ -9,31 +9,47 @@ from PySide6.QtWidgets import (
     QGridLayout,
     QLabel,
     QDial,
+    QSlider,
     QPushButton,
     QApplication,
     QMessageBox,
     QComboBox,
 )
 
-from .camilla_dsp import (
-    load_camilla_dsp_yaml,
-    save_camilla_dsp_yaml,
-    ensure_filters_and_pipelines,
-    ensure_devices_section,
-    ensure_mixers_and_processors,
-    read_gain,
-    write_gain,
-    DEFAULT_FILTERS,
-    try_reload_camilla_dsp,
-)
-from .devices import list_system_playback_devices
-from .settings import Settings, SettingsWindow, APP_NAME
+from .bands import layout_filters
+from .config_watcher import ConfigWatcher
+from .controller import DEFAULT_SAMPLERATE, EqController
+from .devices import device_registry
+from .executor import CommandExecutor
+from .frequency_response import biquad_parameters, magnitude_response
+from .metrics import MetricsCollector
+from .response_curve import ResponseCurve
+from .settings import Settings, APP_NAME
+from .settings_window import SettingsWindow
+from .sparkline import Sparkline
+from .startup_profile import startup_profile
+
+log = logging.getLogger(__name__)
+
+# More bands than this get vertical sliders instead of dials
+MAX_DIALS = 5
+MAX_COLUMNS = 16
 
 
 class TrayWindow(QWidget):
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, controller: EqController, executor: CommandExecutor,
+                 metrics: MetricsCollector = None):
         super().__init__()
         self.settings = settings
+        self.controller = controller
+        self.metrics = metrics
+
+        # File I/O and CamillaDSP round trips run there, off the Qt thread
+        self.executor = executor
+        self.executor.completed.connect(self.on_command_completed)
+        self.executor.failed.connect(self.on_command_failed)
+        # Counts dial changes; a state read requested before the latest one is out of date
+        self.edit_sequence = 0
 
         self.setWindowTitle(APP_NAME)
         # Keep the small window always on top and as a tool window; fix size
@@ -41,54 +57,108 @@ class TrayWindow(QWidget):
 
         self.resize(320, 220)
 
+        # EQ curve, redrawn while the dials move
+        self.curve = ResponseCurve()
+        self.curve_filters = {}
+        self.curve_samplerate = DEFAULT_SAMPLERATE
+
         main_layout = QVBoxLayout()
+        main_layout.addWidget(self.curve)
+        # Recent CamillaDSP load, refreshed from the metrics ring buffer while the window is shown
+        self.sparkline = None
+        if metrics is not None:
+            self.sparkline = Sparkline()
+            main_layout.addWidget(self.sparkline)
         main_layout.addWidget(self.prepare_knobs_group())
         main_layout.addWidget(self.prepare_settings_group())
 
         self.setLayout(main_layout)
         self.setFixedSize(self.sizeHint())
 
-        # Debounce timer for apply
+        # Debounce timer for apply; short, since the executor coalesces queued gains anyway
         self.apply_timer = QTimer(self)
         self.apply_timer.setSingleShot(True)
-        self.apply_timer.setInterval(400)  # ms
+        self.apply_timer.setInterval(10)  # ms
         self.apply_timer.timeout.connect(self.apply_knobs_to_camilla_dsp)
 
-        print("Initial values loaded from camilla dsp config yaml")
+        # Live mode: lazy timer persisting the pushed gains to YAML
+        self.persist_timer = QTimer(self)
+        self.persist_timer.setSingleShot(True)
+        self.persist_timer.setInterval(2000)  # ms
+        self.persist_timer.timeout.connect(self.request_persist)
+
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(1000)  # ms
+        self.metrics_timer.timeout.connect(self.update_sparkline)
+
+        # Edits of the config file by hand or by other tools, picked up without polling
+        self.config_watcher = ConfigWatcher(self)
+        self.config_watcher.changed.connect(lambda: self.executor.submit("external", "config"))
+        self.config_watcher.set_path(self.settings.config_path)
+
+        log.info("Initial values loaded")
 
     def prepare_knobs_group(self):
-        # Knobs group
+        # Knobs group; the controls are created by ensure_knobs once the bands are known
         knobs_group = QGroupBox()
-        grid = QGridLayout()
+        self.knobs_grid = QGridLayout()
         self.knobs = {}
         self.value_labels = {}
-        for idx, name in enumerate(["Bass", "Middle", "Treble"]):
+        knobs_group.setLayout(self.knobs_grid)
+        self.ensure_knobs(list(layout_filters(self.settings.bands)))
+        self.knobs_group = knobs_group
+        return knobs_group
+
+    def ensure_knobs(self, names: list):
+        """Rebuild the controls when the band names changed; a few bands get dials, many get sliders."""
+        if list(self.knobs) == names:
+            return
+        while self.knobs_grid.count():
+            widget = self.knobs_grid.takeAt(0).widget()
+            if widget is not None:
+                widget.deleteLater()
+        self.knobs = {}
+        self.value_labels = {}
+        use_dials = len(names) <= MAX_DIALS
+        for idx, name in enumerate(names):
             label = QLabel(name)
-            dial = QDial()
-            dial.setRange(-16, 16)
-            dial.setNotchesVisible(True)
-            dial.setPageStep(1)
-            dial.setWrapping(False)
-            dial.setValue(0)
+            label.setAlignment(Qt.AlignHCenter)
+            if use_dials:
+                control = QDial()
+                control.setNotchesVisible(True)
+                control.setWrapping(False)
+            else:
+                control = QSlider(Qt.Vertical)
+                control.setTickPosition(QSlider.TicksBothSides)
+                control.setTickInterval(4)
+            control.setRange(-16, 16)
+            control.setPageStep(1)
+            control.setValue(0)
+            control.setToolTip(name)
             value_label = QLabel("0 dB")
             value_label.setAlignment(Qt.AlignHCenter)
 
-            def make_on_change(nm=name, d=dial, vl=value_label):
+            def make_on_change(nm=name, vl=value_label):
                 def _on_change(val):
-                    print(f"Knob {name} changed value to {val}")
+                    # Lazy formatting: nothing is built unless debug logging is on
+                    log.debug("Knob %s changed value to %s", nm, val)
                     vl.setText(f"{val} dB")
+                    self.edit_sequence += 1
+                    self.update_curve()
                     self.schedule_apply()
                 return _on_change
 
-            dial.valueChanged.connect(make_on_change())
+            control.valueChanged.connect(make_on_change())
 
-            grid.addWidget(label, 0, idx)
-            grid.addWidget(dial, 1, idx)
-            grid.addWidget(value_label, 2, idx)
-            self.knobs[name] = dial
+            # Wide layouts wrap into blocks of label, control and value rows
+            row, column = divmod(idx, MAX_COLUMNS)
+            self.knobs_grid.addWidget(label, 3 * row, column, Qt.AlignHCenter)
+            self.knobs_grid.addWidget(control, 3 * row + 1, column, Qt.AlignHCenter)
+            self.knobs_grid.addWidget(value_label, 3 * row + 2, column, Qt.AlignHCenter)
+            self.knobs[name] = control
             self.value_labels[name] = value_label
-        knobs_group.setLayout(grid)
-        return knobs_group
+        if self.layout() is not None:
+            self.setFixedSize(self.sizeHint())
 
     def prepare_settings_group(self):
         settings_grid = QGridLayout()
@@ -96,24 +166,31 @@ class TrayWindow(QWidget):
         settings_group.setLayout(settings_grid)
         # Output device selection
         self.device_combo = QComboBox()
+        self.combo_state = None
         self.fill_in_devices_into_combobox()
 
         settings_grid.addWidget(self.device_combo, 0, 0)
         settings_btn = QPushButton("Settings")
         settings_btn.clicked.connect(self.open_settings)
         settings_grid.addWidget(settings_btn, 0, 1)
-        self.load_initial_values_from_camilla_dsp_yaml()
+        self.load_initial_values()
         return settings_group
 
-    def fill_in_devices_into_combobox(self):
+    def fill_in_devices_into_combobox(self, allow_stale: bool = False):
+        with startup_profile.phase("device enumeration"):
+            devices = device_registry.devices(allow_stale=allow_stale)
+        # Rebuilding the combobox is only needed when the devices or the selection changed
+        combo_state = (device_registry.generation, self.settings.playback_device)
+        if combo_state == self.combo_state:
+            return
+        self.combo_state = combo_state
         self.device_combo.currentTextChanged.disconnect(self.select_device)
-        devices = list_system_playback_devices()
         self.device_combo.clear()
         if not devices:
             self.device_combo.addItem("(No devices found)")
             self.device_combo.setEnabled(False)
         else:
-            print(f"Selected device: {self.settings.playback_device}")
+            log.info("Selected device: %s", self.settings.playback_device)
             self.device_combo.addItems(devices)
             # Preselect saved setting if present
             selected_device = self.settings.playback_device
@@ -128,18 +205,12 @@ class TrayWindow(QWidget):
 
     def select_device(self):
         selected_device = self.device_combo.currentText()
-        if selected_device in self.settings.devices:
-            save_camilla_dsp_yaml(self.settings.config_path, self.settings.devices[selected_device])
-        self.apply_changes_to_camilla_dsp()
-        self.settings.playback_device = selected_device
-        self.settings.save()
-        self.load_initial_values_from_camilla_dsp_yaml()
-        port = int(self.settings.port)
-        try_reload_camilla_dsp(port)
-        print(f"Device changed to {selected_device}")
+        # The switch stores the dial gains in the outgoing device's profile itself
+        self.persist_timer.stop()
+        self.executor.submit("device", "playback", (selected_device, self.dial_gains()))
 
     def open_settings(self):
-        self.settings_win = SettingsWindow(self.settings, self.load_initial_values_from_camilla_dsp_yaml)
+        self.settings_win = SettingsWindow(self.settings, self.on_settings_saved)
         # Make settings a tool and always on top too, and center over the tray window
         self.settings_win.setWindowFlags(self.settings_win.windowFlags() | Qt.Tool | Qt.WindowStaysOnTopHint)
         try:
@@ -160,105 +231,131 @@ class TrayWindow(QWidget):
         self.settings_win.raise_()
         self.settings_win.activateWindow()
 
+    def showEvent(self, event):
+        # CamillaDSP may have been reloaded from elsewhere since the window was last shown
+        self.request_state("live")
+        if self.sparkline is not None:
+            self.update_sparkline()
+            self.metrics_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.metrics_timer.stop()
+        super().hideEvent(event)
+
+    def update_sparkline(self):
+        latest = self.metrics.ring.latest()
+        if latest is None:
+            return
+        _, values, state = latest
+        if state == "Running":
+            text = f"load {values['processing_load']:.1f}%  buffer {values['buffer_level']:.0f}"
+        else:
+            text = f"CamillaDSP: {state}"
+        self.sparkline.set_values(self.metrics.ring.series("processing_load"), text)
+
+    def on_settings_saved(self):
+        if self.metrics is not None:
+            self.metrics.set_port(int(self.settings.port))
+        self.config_watcher.set_path(self.settings.config_path)
+        # Write pending live changes before CamillaDSP gets reloaded from the file
+        self.flush_pending_persist()
+        self.executor.submit("config", "path", self.settings.config_path)
+
     def schedule_apply(self):
         self.apply_timer.start()
 
-    def load_initial_values_from_camilla_dsp_yaml(self):
-        camilla_dsp_cfg = load_camilla_dsp_yaml(self.settings.config_path)
-        selected_device = self.settings.playback_device
-        all_saved_devices = self.settings.devices
+    def dial_gains(self) -> dict:
+        return {name: float(int(dial.value())) for name, dial in self.knobs.items()}
 
-        if not camilla_dsp_cfg:
-            return
-        # Ensure required structures; save if changed
-        changed = False
-        if camilla_dsp_cfg.get("title") != "CameliaEQ":
-            changed = True
-            camilla_dsp_cfg["title"] = "CameliaEQ"
-        if ensure_devices_section(camilla_dsp_cfg, selected_device):
-            changed = True
-            if selected_device in all_saved_devices:
-                camilla_dsp_cfg = all_saved_devices[selected_device]
-        if ensure_filters_and_pipelines(camilla_dsp_cfg):
-            changed = True
-        if ensure_mixers_and_processors(camilla_dsp_cfg):
-            changed = True
-        if changed and self.settings.config_path:
-            save_camilla_dsp_yaml(self.settings.config_path, camilla_dsp_cfg)
-        for name in ["Bass", "Middle", "Treble"]:
-            gain = read_gain(camilla_dsp_cfg, name)
-            if gain is None and name in DEFAULT_FILTERS:
-                gain = DEFAULT_FILTERS[name]["parameters"]["gain"]
-            if gain is not None and name in self.knobs:
+    def set_dials(self, gains: dict):
+        if gains:
+            self.ensure_knobs(list(gains))
+        self.update_dials(gains)
+
+    def update_dials(self, gains: dict):
+        """Set only the given dials, leaving the others (and the layout) as they are."""
+        for name, gain in gains.items():
+            if name in self.knobs:
                 self.knobs[name].blockSignals(True)
                 self.knobs[name].setValue(int(round(gain)))
                 self.knobs[name].blockSignals(False)
                 if name in self.value_labels:
                     self.value_labels[name].setText(f"{int(round(gain))} dB")
+        self.update_curve()
+
+    def update_curve(self):
+        chain = []
+        for name, parameters in self.curve_filters.items():
+            if name in self.knobs:
+                parameters = dict(parameters, gain=self.knobs[name].value())
+            params = biquad_parameters(parameters)
+            if params is not None:
+                chain.append(params)
+        frequencies, db = magnitude_response(tuple(chain), float(self.curve_samplerate))
+        self.curve.set_curve(frequencies, db)
 
     def apply_knobs_to_camilla_dsp(self):
-        cfg_path = self.settings.config_path
+        for name, gain in self.dial_gains().items():
+            self.executor.submit("gains", name, gain)
 
-        if not cfg_path or not os.path.exists(cfg_path):
-            QMessageBox.warning(self, APP_NAME, "Please set a valid CamillaDSP config file in Settings.")
-            return
-        camilla_dsp_cfg = load_camilla_dsp_yaml(cfg_path)
-        if camilla_dsp_cfg is None:
-            QMessageBox.critical(self, APP_NAME, "Failed to load YAML config.")
-            return
+    def request_persist(self):
+        for name, gain in self.dial_gains().items():
+            self.executor.submit("persist", name, gain)
+
+    def flush_pending_persist(self):
+        if self.persist_timer.isActive():
+            self.persist_timer.stop()
+            self.request_persist()
 
-        changed = False
-        if ensure_filters_and_pipelines(camilla_dsp_cfg):
-            changed = True
-        if ensure_mixers_and_processors(camilla_dsp_cfg):
-            changed = True
-        for name, dial in self.knobs.items():
-            val = int(dial.value())
-            ok = write_gain(camilla_dsp_cfg, name, float(val))
-            changed = changed or ok
-        if changed:
-            if not save_camilla_dsp_yaml(cfg_path, camilla_dsp_cfg):
-                QMessageBox.critical(self, APP_NAME, "Failed to save YAML config.")
+    def on_command_completed(self, kind: str, result):
+        if kind == "gains":
+            result, self.curve_filters, self.curve_samplerate = result
+            if result == "live":
+                self.persist_timer.start()
+            self.update_curve()
+        elif kind in ("device", "config") and result is not None:
+            # Frequencies and Q of the bands come from the config; the dials only set gains
+            gains, self.curve_filters, self.curve_samplerate = result
+            self.set_dials(gains)
+            if kind == "device":
+                log.info("Device changed to %s", self.settings.playback_device)
+        elif kind == "state":
+            sequence, state = result
+            self.knobs_group.setEnabled(True)
+            # The first state read is the startup one; later reports are ignored
+            startup_profile.mark("initial values read")
+            startup_profile.report()
+            # Dials moved since the request: the state read predates them
+            if state is None or sequence != self.edit_sequence:
                 return
+            gains, self.curve_filters, self.curve_samplerate = state
+            self.set_dials(gains)
+        elif kind == "external" and result is not None:
+            (gains, reshaped), self.curve_filters, self.curve_samplerate = result
+            if reshaped:
+                self.set_dials(gains)
             else:
-                self.settings.devices[self.settings.playback_device] = camilla_dsp_cfg
-                self.settings.save()
-        port = int(self.settings.port)
-        try_reload_camilla_dsp(port)
+                self.update_dials(gains)
 
+    def on_remote_gains_applied(self, gains: dict, filters: dict, samplerate):
+        self.curve_filters, self.curve_samplerate = filters, samplerate
+        self.set_dials(gains)
+        if self.isVisible():
+            self.fill_in_devices_into_combobox(allow_stale=True)
 
-    def apply_changes_to_camilla_dsp(self):
-        cfg_path = self.settings.config_path
-        selected_device = self.settings.playback_device
-        all_devices = self.settings.devices
+    def on_command_failed(self, kind: str, message: str):
+        if kind == "state":
+            self.knobs_group.setEnabled(True)
+            startup_profile.report()
+        QMessageBox.warning(self, APP_NAME, message)
 
-        if not cfg_path or not os.path.exists(cfg_path):
-            QMessageBox.warning(self, APP_NAME, "Please set a valid CamillaDSP config file in Settings.")
-            return
-        camilla_dsp_cfg = load_camilla_dsp_yaml(cfg_path)
-        if camilla_dsp_cfg is None:
-            QMessageBox.critical(self, APP_NAME, "Failed to load YAML config.")
-            return
+    def request_state(self, key: str):
+        self.executor.submit("state", key, self.edit_sequence)
 
-        changed = False
-        if camilla_dsp_cfg.get("title") != "CameliaEQ":
-            changed = True
-            camilla_dsp_cfg["title"] = "CameliaEQ"
-        if ensure_devices_section(camilla_dsp_cfg, selected_device):
-            if selected_device in all_devices:
-                camilla_dsp_cfg = all_devices[selected_device]
-            changed = True
-        for name, dial in self.knobs.items():
-            val = int(dial.value())
-            ok = write_gain(camilla_dsp_cfg, name, float(val))
-            changed = changed or ok
-        if changed:
-            if not save_camilla_dsp_yaml(cfg_path, camilla_dsp_cfg):
-                QMessageBox.critical(self, APP_NAME, "Failed to save YAML config.")
-                return
-            else:
-                all_devices[selected_device] = camilla_dsp_cfg
-                self.settings.save()
-        # trigger reload regardless; harmless if unchanged
-        port = int(self.settings.port)
-        try_reload_camilla_dsp(port)
+    def load_initial_values(self):
+        # Read on the executor; the dials are filled in when the result comes back. Until
+        # then they show 0 dB, and moving one would apply that to every other band.
+        self.knobs_group.setEnabled(False)
+        self.update_curve()
+        self.request_state("startup")
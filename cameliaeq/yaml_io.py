@@ -0,0 +1,27 @@
+import yaml
+
+# Prefer the libyaml bindings; PyYAML built without them falls back to the pure-Python classes
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+
+def load_yaml(stream):
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def dump_yaml(data, stream=None):
+    return yaml.dump(data, stream, Dumper=SafeDumper, sort_keys=False)
+
+
+def copy_config(value):
+    """Structural deep copy of YAML-shaped data (dicts, lists and immutable scalars).
+
+    Much cheaper than copy.deepcopy or a dump/load round trip, as no memo or parsing is involved.
+    """
+    if isinstance(value, dict):
+        return {k: copy_config(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_config(v) for v in value]
+    return value
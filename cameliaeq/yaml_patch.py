@@ -0,0 +1,213 @@
+"""In-place edits of a YAML file's scalars, keeping comments and layout.
+
+A gain change touches one number in a config that may run to thousands of lines and
+carry the user's own comments. Rather than dumping the whole config again, the file's
+text is kept together with where each scalar sits in it, and saving only splices new
+text over the scalars whose values changed. Top-level keys added after the existing
+ones are dumped and appended to the file. Anything else (other keys added, removed or
+reordered, a scalar becoming a mapping, anchors and aliases, block scalars) returns
+None, and the caller dumps the config as before.
+"""
+import re
+from typing import Optional
+
+import yaml
+
+from .yaml_io import SafeDumper, SafeLoader, copy_config, dump_yaml
+
+STR_TAG = "tag:yaml.org,2002:str"
+# Strings written without quotes; anything else is double-quoted, which reads back
+# the same in block and flow context alike
+PLAIN_STRING = re.compile(r"[A-Za-z_/.][A-Za-z0-9_/.:@+ -]*\Z")
+# Key of the edit holding top-level keys appended at the end of the file
+_APPEND = object()
+
+
+class YamlDocument:
+    """Text of a YAML file plus the position of each of its scalars, by path.
+
+    Immutable: patch() returns a new document, so a failed write leaves the old one valid.
+    """
+
+    def __init__(self, text: str, root=None):
+        self.source = text
+        # Composed lazily: a document from a fresh dump is only indexed if it gets patched
+        self._root = root
+        self._spans = None
+        # path -> (start, end, replacement), positions in source
+        self._edits = {}
+        # (path, value) of the scalars the last patch() changed
+        self.changes = []
+
+    @classmethod
+    def parse(cls, text: str) -> tuple:
+        """(data, document) from a single parse of text."""
+        loader = SafeLoader(text)
+        try:
+            root = loader.get_single_node()
+            data = loader.construct_document(root) if root is not None else None
+        finally:
+            loader.dispose()
+        return data, cls(text, root)
+
+    def text(self) -> str:
+        if not self._edits:
+            return self.source
+        parts = []
+        position = 0
+        for start, end, replacement in sorted(self._edits.values()):
+            parts.append(self.source[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(self.source[position:])
+        return "".join(parts)
+
+    def patch(self, old, new) -> Optional["YamlDocument"]:
+        """Document for new, given that this one holds old; None when only a full dump will do."""
+        changes = []
+        added = {}
+        if isinstance(old, dict) and isinstance(new, dict) and len(new) > len(old):
+            keys = list(new)
+            if keys[:len(old)] == list(old):
+                added = {key: new[key] for key in keys[len(old):]}
+                new = {key: new[key] for key in keys[:len(old)]}
+        if not _diff(old, new, (), changes):
+            return None
+        spans = self._index()
+        if spans is None:
+            return None
+        edits = dict(self._edits)
+        for path, value in changes:
+            node = spans.get(path)
+            if node is None:
+                return None
+            replacement = _format_scalar(value, node.style)
+            if replacement is None:
+                return None
+            edits[path] = (node.start_mark.index, node.end_mark.index, replacement)
+        if added:
+            appended = self._append_text(added)
+            if appended is None:
+                return None
+            edits[_APPEND] = appended
+            changes.extend(((key,), value) for key, value in added.items())
+        patched = YamlDocument(self.source, self._root)
+        patched._spans = spans
+        patched._edits = edits
+        patched.changes = changes
+        return patched
+
+    def _append_text(self, mapping: dict) -> Optional[tuple]:
+        # Only a block mapping at column 0, followed by nothing but comments, can be extended
+        root = self._root
+        if not isinstance(root, yaml.MappingNode) or root.flow_style or not root.value:
+            return None
+        if root.value[0][0].start_mark.column != 0:
+            return None
+        for line in self.source[root.end_mark.index:].splitlines():
+            if line.strip() and not line.lstrip().startswith("#"):
+                return None
+        end = len(self.source)
+        previous = self._edits.get(_APPEND)
+        if previous is not None:
+            text = previous[2]
+        else:
+            text = "" if self.source.endswith("\n") else "\n"
+        return end, end, text + dump_yaml(mapping)
+
+    def _index(self) -> Optional[dict]:
+        if self._spans is None:
+            if self._root is None:
+                try:
+                    self._root = yaml.compose(self.source, Loader=SafeLoader)
+                except yaml.YAMLError:
+                    return None
+            spans = {}
+            if self._root is not None and _index_node(self._root, (), spans, set(), self.source):
+                self._spans = spans
+            else:
+                self._spans = False
+        return self._spans or None
+
+
+def apply_changes(data, changes: list) -> None:
+    """Set the scalars (and appended keys) a patch changed in data, which held the patch's old state."""
+    for path, value in changes:
+        target = data
+        for key in path[:-1]:
+            target = target[key]
+        # Appended sections are containers the caller goes on mutating; data keeps its own copy
+        target[path[-1]] = copy_config(value)
+
+
+def _index_node(node, path: tuple, spans: dict, seen: set, source: str) -> bool:
+    # An alias would make one scalar stand for several paths
+    if id(node) in seen:
+        return False
+    seen.add(id(node))
+    if isinstance(node, yaml.ScalarNode):
+        # Block scalars, and scalars with a tag or anchor written out, are left to a full dump
+        if node.style not in (None, "", "'", '"') or source[node.start_mark.index] in "!&":
+            return True
+        spans[path] = node
+        return True
+    if isinstance(node, yaml.SequenceNode):
+        return all(_index_node(item, path + (i,), spans, seen, source) for i, item in enumerate(node.value))
+    for key_node, value_node in node.value:
+        if not isinstance(key_node, yaml.ScalarNode) or key_node.tag != STR_TAG:
+            # Merge keys and non-string keys: the data no longer mirrors the nodes
+            return False
+        if not _index_node(value_node, path + (key_node.value,), spans, seen, source):
+            return False
+    return True
+
+
+def _diff(old, new, path: tuple, changes: list) -> bool:
+    """Collect (path, value) of changed scalars; False if the structure differs."""
+    if isinstance(old, dict):
+        # Key order counts: a reordered mapping would be written back in its old order
+        if not isinstance(new, dict) or list(old) != list(new):
+            return False
+        for key, value in new.items():
+            before = old[key]
+            if before == value:
+                # Equal subtrees are skipped at C speed, but dict equality ignores order: check
+                # the next level's keys too. Reordering further down in an unchanged subtree
+                # goes unnoticed, and the file keeps its old (equal) order there.
+                if isinstance(value, dict) and list(before) != list(value):
+                    return False
+                continue
+            if not _diff(before, value, path + (key,), changes):
+                return False
+        return True
+    if isinstance(old, list):
+        if not isinstance(new, list) or len(old) != len(new):
+            return False
+        for i, (before, after) in enumerate(zip(old, new)):
+            if before != after and not _diff(before, after, path + (i,), changes):
+                return False
+        return True
+    if isinstance(new, (dict, list)):
+        return False
+    if old != new:
+        changes.append((path, new))
+    return True
+
+
+def _format_scalar(value, style) -> Optional[str]:
+    if isinstance(value, str):
+        if style in ("'", '"') or not PLAIN_STRING.match(value):
+            style = '"'
+        else:
+            style = None
+    elif value is not None and not isinstance(value, (bool, int, float)):
+        return None
+    else:
+        style = None
+    text = yaml.dump(value, Dumper=SafeDumper, default_style=style, width=1 << 30)
+    if text.endswith("\n...\n"):
+        text = text[:-5]
+    text = text.rstrip("\n")
+    if "\n" in text:
+        return None
+    return text
@@ -0,0 +1,193 @@
+import copy
+
+import pytest
+import yaml
+
+from cameliaeq.camilla_config import CamillaConfig
+from cameliaeq.camilla_dsp import (
+    DEFAULT_FILTERS,
+    EQ_STEP_DESCRIPTION,
+    ensure_filters_and_pipelines,
+    eq_step_names,
+    make_pipeline_entry,
+    optimize_pipeline,
+    pipeline_biquads,
+    write_gain,
+)
+
+
+def biquad(gain=0, kind="Peaking"):
+    return {"type": "Biquad", "parameters": {"type": kind, "freq": 1000, "gain": gain, "q": 1}}
+
+
+def step(*names, channels=None, description=None, bypassed=None):
+    entry = {"type": "Filter", "names": list(names), "description": description, "bypassed": bypassed}
+    if channels is not None:
+        entry["channels"] = channels
+    return entry
+
+
+def eq_config(**gains):
+    filters = {name: biquad(gain) for name, gain in gains.items()}
+    return {"filters": filters, "pipeline": [make_pipeline_entry(name) for name in gains]}
+
+
+def test_missing_filters_and_empty_steps_are_dropped():
+    cfg = {
+        "filters": {"A": biquad(1)},
+        "mixers": {"Stereo": {}},
+        "pipeline": [
+            step("A", "Gone", channels=[0]),
+            step("Gone", channels=[1]),
+            {"type": "Mixer", "name": "Missing"},
+            {"type": "Mixer", "name": "Stereo"},
+            {"type": "Processor", "name": "Compressor"},
+            step(channels=[0]),
+            "not a step",
+        ],
+    }
+    assert optimize_pipeline(cfg)
+    assert cfg["pipeline"] == [step("A", channels=[0]), {"type": "Mixer", "name": "Stereo"}]
+
+
+def test_adjacent_steps_on_the_same_channels_are_merged():
+    cfg = {
+        "filters": {name: biquad(1) for name in "ABCD"},
+        "pipeline": [
+            step("A", channels=[0]), step("B", channels=[0]),
+            step("C", channels=[1]), step("D", channels=[1]),
+        ],
+    }
+    original = copy.deepcopy(cfg["pipeline"])
+    merged = copy.deepcopy(cfg)
+    assert optimize_pipeline(merged)
+    assert merged["pipeline"] == [step("A", "B", channels=[0]), step("C", "D", channels=[1])]
+    # Merging copies the steps it extends
+    assert cfg["pipeline"] == original
+
+
+@pytest.mark.parametrize("first, second", [
+    (step("A", channels=[0], bypassed=True), step("B", channels=[0])),
+    (step("A", channels=[0], description="mine"), step("B", channels=[0])),
+    (step("A", channels=[0]), {"type": "Mixer", "name": "Stereo"}),
+])
+def test_steps_that_differ_are_not_merged(first, second):
+    cfg = {"filters": {"A": biquad(1), "B": biquad(1)}, "mixers": {"Stereo": {}}}
+    cfg["pipeline"] = [first, second]
+    assert not optimize_pipeline(cfg)
+
+
+def test_band_steps_are_never_merged():
+    cfg = eq_config(Bass=3, Middle=-2, Treble=1)
+    expected = copy.deepcopy(cfg["pipeline"])
+    assert not optimize_pipeline(cfg)
+    assert cfg["pipeline"] == expected
+
+
+def test_flat_bands_toggle_their_bypass_flag_only():
+    cfg = eq_config(Bass=3, Middle=0, Treble=1)
+    assert optimize_pipeline(cfg)
+    assert [entry["bypassed"] for entry in cfg["pipeline"]] == [None, True, None]
+    assert [entry["names"] for entry in cfg["pipeline"]] == [["Bass"], ["Middle"], ["Treble"]]
+    assert not optimize_pipeline(cfg)
+    write_gain(cfg, "Middle", 2)
+    write_gain(cfg, "Bass", 0.0)
+    assert optimize_pipeline(cfg)
+    assert [entry["bypassed"] for entry in cfg["pipeline"]] == [True, None, None]
+    # Bypassed bands still shape the curve
+    assert list(pipeline_biquads(cfg)) == ["Bass", "Middle", "Treble"]
+
+
+def test_only_flat_biquad_types_are_bypassed():
+    cfg = eq_config(Bass=0)
+    cfg["filters"]["Bass"]["parameters"]["type"] = "Lowpass"
+    assert not optimize_pipeline(cfg)
+    assert cfg["pipeline"][0]["bypassed"] is None
+
+
+def test_user_bypassed_steps_stay_bypassed():
+    cfg = {"filters": {"A": biquad(2)}, "pipeline": [step("A", channels=[0], bypassed=True)]}
+    assert not optimize_pipeline(cfg)
+    assert list(pipeline_biquads(cfg)) == ["A"]
+
+
+def test_band_steps_are_created_once_in_band_order():
+    cfg = {"filters": {}, "pipeline": [{"type": "Mixer", "name": "Stereo"}]}
+    assert ensure_filters_and_pipelines(cfg)
+    assert cfg["pipeline"][1:] == [make_pipeline_entry(name) for name in DEFAULT_FILTERS]
+    cfg["pipeline"][2]["bypassed"] = True
+    assert not ensure_filters_and_pipelines(cfg)
+    assert cfg["pipeline"][2]["bypassed"] is True
+
+
+@pytest.mark.parametrize("pipeline", [
+    # One undescribed step per band, as the first versions wrote
+    [step("Bass", channels=[0, 1]), step("Middle", channels=[0, 1]), step("Treble", channels=[0, 1])],
+    # One step for all bands, with the flat ones split off
+    [step("Bass", "Treble", channels=[0, 1], description=EQ_STEP_DESCRIPTION),
+     step("Middle", channels=[0, 1], description="CameliaEQ flat bands", bypassed=True)],
+    # Duplicated band steps
+    [make_pipeline_entry("Bass"), make_pipeline_entry("Middle"), make_pipeline_entry("Bass"),
+     make_pipeline_entry("Treble")],
+])
+def test_older_pipelines_become_band_steps(pipeline):
+    cfg = {"filters": {}, "pipeline": [{"type": "Mixer", "name": "Stereo"}] + pipeline + [step("Mine")]}
+    assert ensure_filters_and_pipelines(cfg)
+    assert cfg["pipeline"] == (
+        [{"type": "Mixer", "name": "Stereo"}]
+        + [make_pipeline_entry(name) for name in DEFAULT_FILTERS]
+        + [step("Mine")]
+    )
+    assert eq_step_names(cfg) == list(DEFAULT_FILTERS)
+    assert not ensure_filters_and_pipelines(cfg)
+
+
+CONFIG = """\
+# My config
+devices:
+  samplerate: 48000
+  chunksize: 256
+filters:
+  Bass: {type: Biquad, description: null, parameters: {type: Lowshelf, freq: 95, gain: 3, q: 1}}
+  Middle: {type: Biquad, description: null, parameters: {type: Peaking, freq: 750, gain: 1, q: 1}}
+  Treble: {type: Biquad, description: null, parameters: {type: Highshelf, freq: 7500, gain: 2, q: 1}}
+mixers: {}
+processors: {}
+pipeline:
+  - {type: Filter, channels: [0, 1], names: [Bass], description: CameliaEQ, bypassed: null}  # bass
+  - {type: Filter, channels: [0, 1], names: [Middle], description: CameliaEQ, bypassed: null}
+  - {type: Filter, channels: [0, 1], names: [Treble], description: CameliaEQ, bypassed: null}
+"""
+
+
+def test_crossing_zero_db_is_saved_in_place(tmp_path):
+    path = tmp_path / "camilladsp.yml"
+    path.write_text(CONFIG)
+    config = CamillaConfig(str(path))
+    for gain in (0, -4, 0):
+        cfg = config.load()
+        write_gain(cfg, "Middle", gain)
+        assert not ensure_filters_and_pipelines(cfg)
+        optimize_pipeline(cfg)
+        assert config.save(cfg)
+    text = path.read_text()
+    middle = "names: [Middle], description: CameliaEQ, bypassed: "
+    expected = CONFIG.replace(middle + "null", middle + "true").replace("gain: 1, q: 1", "gain: 0, q: 1")
+    assert text == expected
+    assert yaml.safe_load(text) == config.load()
+
+
+def test_profile_delta_of_a_bypassed_band_holds_only_the_flag():
+    from cameliaeq.profiles import apply_delta, make_delta
+
+    base = eq_config(Bass=3, Middle=1, Treble=2)
+    optimize_pipeline(base)
+    profile = copy.deepcopy(base)
+    write_gain(profile, "Middle", 0)
+    optimize_pipeline(profile)
+    delta = make_delta(base, profile)
+    assert delta == {
+        "filters": {"Middle": {"parameters": {"gain": 0}}},
+        "pipeline": {"__items__": {1: {"bypassed": True}}},
+    }
+    assert apply_delta(copy.deepcopy(base), delta) == profile
@@ -0,0 +1,156 @@
+import copy
+import os
+
+import pytest
+import yaml
+
+from cameliaeq import profiles
+from cameliaeq.profiles import BASE_FILE, DELETED_KEY, DELTA_KEY, ProfileStore, apply_delta, make_delta
+
+CONFIG = {
+    "devices": {
+        "samplerate": 48000,
+        "chunksize": 256,
+        "playback": {"type": "CoreAudio", "channels": 2, "device": "Speakers"},
+    },
+    "filters": {
+        "Bass": {"type": "Biquad", "parameters": {"type": "Lowshelf", "freq": 95, "gain": 3, "q": 1}},
+        "Treble": {"type": "Biquad", "parameters": {"type": "Highshelf", "freq": 7500, "gain": 2.5, "q": 1}},
+    },
+    "pipeline": [{"type": "Filter", "channels": [0, 1], "names": ["Bass", "Treble"]}],
+}
+
+
+def device_config(device="Headphones", **gains):
+    cfg = copy.deepcopy(CONFIG)
+    cfg["devices"]["playback"]["device"] = device
+    for name, gain in gains.items():
+        cfg["filters"][name]["parameters"]["gain"] = gain
+    return cfg
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProfileStore(str(tmp_path))
+
+
+def test_saved_delta_loads_back(store, tmp_path):
+    store["Speakers"] = CONFIG
+    headphones = device_config(Bass=-4, Treble=0)
+    store["Headphones"] = headphones
+    assert read(tmp_path / "Headphones.yml") == {DELTA_KEY: {
+        "devices": {"playback": {"device": "Headphones"}},
+        "filters": {"Bass": {"parameters": {"gain": -4}}, "Treble": {"parameters": {"gain": 0}}},
+    }}
+    # A fresh store reads the files; ints and floats keep their type
+    reloaded = ProfileStore(str(tmp_path))
+    assert sorted(reloaded) == ["Headphones", "Speakers"]
+    assert reloaded["Headphones"] == headphones
+    assert type(reloaded["Speakers"]["filters"]["Treble"]["parameters"]["gain"]) is float
+    assert reloaded["Speakers"] == CONFIG
+
+
+def test_loaded_profiles_are_fresh_copies(store):
+    store["Speakers"] = CONFIG
+    loaded = store["Speakers"]
+    loaded["filters"]["Bass"]["parameters"]["gain"] = 12
+    assert store["Speakers"] == CONFIG
+
+
+def test_unchanged_profile_is_not_written_again(store, monkeypatch):
+    store["Speakers"] = CONFIG
+    store["Headphones"] = device_config(Bass=1)
+    writes = []
+    monkeypatch.setattr(profiles, "write_yaml_atomically", lambda path, data: writes.append(path))
+    store["Headphones"] = device_config(Bass=1)
+    assert writes == []
+    store["Headphones"] = device_config(Bass=2)
+    assert len(writes) == 1
+
+
+def test_removed_keys_and_lists(store, tmp_path):
+    store["Speakers"] = CONFIG
+    cfg = device_config()
+    del cfg["devices"]["chunksize"]
+    cfg["pipeline"][0]["channels"] = [0]
+    store["Headphones"] = cfg
+    delta = read(tmp_path / "Headphones.yml")[DELTA_KEY]
+    assert delta["devices"][DELETED_KEY] == ["chunksize"]
+    assert ProfileStore(str(tmp_path))["Headphones"] == cfg
+
+
+def test_base_change_reaches_profiles_that_do_not_override_it(store, tmp_path):
+    store["Speakers"] = CONFIG
+    store["Headphones"] = device_config(Bass=-4)
+    base = read(tmp_path / BASE_FILE)
+    base["devices"]["samplerate"] = 44100
+    base["filters"]["Bass"]["parameters"]["freq"] = 120
+    base["filters"]["Bass"]["parameters"]["gain"] = 6
+    with open(tmp_path / BASE_FILE, "w", encoding="utf-8") as f:
+        yaml.safe_dump(base, f)
+    reloaded = ProfileStore(str(tmp_path))
+    headphones = reloaded["Headphones"]
+    assert headphones["devices"]["samplerate"] == 44100
+    bass = headphones["filters"]["Bass"]["parameters"]
+    assert bass == {"type": "Lowshelf", "freq": 120, "gain": -4, "q": 1}
+    assert headphones["devices"]["playback"]["device"] == "Headphones"
+    # Speakers has no delta of its own and follows the base entirely
+    assert reloaded["Speakers"] == base
+
+
+def test_legacy_full_config_is_migrated_to_a_delta(store, tmp_path):
+    store["Speakers"] = CONFIG
+    legacy = device_config(Treble=-1.5)
+    with open(tmp_path / "Headphones.yml", "w", encoding="utf-8") as f:
+        yaml.safe_dump(legacy, f)
+    reloaded = ProfileStore(str(tmp_path))
+    assert reloaded["Headphones"] == legacy
+    # Rewritten in delta form on the next save, even though nothing changed
+    reloaded["Headphones"] = legacy
+    assert read(tmp_path / "Headphones.yml") == {DELTA_KEY: {
+        "devices": {"playback": {"device": "Headphones"}},
+        "filters": {"Treble": {"parameters": {"gain": -1.5}}},
+    }}
+    assert ProfileStore(str(tmp_path))["Headphones"] == legacy
+
+
+def test_patch_turns_a_config_into_the_profile_in_place(store):
+    store["Speakers"] = CONFIG
+    store["Headphones"] = device_config(Bass=-2)
+    cfg = copy.deepcopy(CONFIG)
+    filters = cfg["filters"]
+    delta = store.patch("Headphones", cfg)
+    assert cfg == device_config(Bass=-2)
+    assert cfg["filters"] is filters
+    assert delta == {
+        "devices": {"playback": {"device": "Headphones"}},
+        "filters": {"Bass": {"parameters": {"gain": -2}}},
+    }
+    assert store.patch("Headphones", cfg) == {}
+
+
+@pytest.mark.parametrize("name", ["USB Audio: hw/0,0", ".hidden", "Ünïcödé DAC"])
+def test_device_names_round_trip_through_file_names(store, tmp_path, name):
+    store["Speakers"] = CONFIG
+    store[name] = device_config(name)
+    assert not os.path.exists(tmp_path / (name + ".yml"))
+    reloaded = ProfileStore(str(tmp_path))
+    assert name in reloaded
+    assert reloaded[name] == device_config(name)
+    del reloaded[name]
+    assert name not in ProfileStore(str(tmp_path))
+
+
+def test_make_and_apply_delta_are_inverse():
+    target = device_config(Bass=3.0, Treble=7)
+    target["mixers"] = {}
+    del target["pipeline"]
+    delta = make_delta(CONFIG, target)
+    assert apply_delta(copy.deepcopy(CONFIG), delta) == target
+    # 3 and 3.0 are equal, but not the same in the file
+    assert type(delta["filters"]["Bass"]["parameters"]["gain"]) is float
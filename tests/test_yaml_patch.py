@@ -0,0 +1,213 @@
+import copy
+
+import pytest
+import yaml
+
+from cameliaeq.yaml_patch import YamlDocument, apply_changes
+
+CONFIG = """\
+# Hand-tuned config, keep the comments
+devices:
+  samplerate: 48000   # DAC maximum
+  chunksize: 256
+  playback:
+    type: Alsa
+    device: "hw:0,0"   # USB DAC
+filters:
+  Bass:
+    type: Biquad
+    parameters: {type: Lowshelf, freq: 100, gain: 0, q: 0.7}  # flow style
+  Treble:
+    type: Biquad
+    parameters:
+      type: Highshelf
+      freq: 8000
+      gain: -2.5
+      q: 0.7
+pipeline:
+  - type: Filter
+    channel: 0
+    names: [Bass, Treble]   # both
+"""
+
+
+def patched(text: str, edit) -> tuple:
+    """(new data, patched text) after edit(data); fails when the patch is refused."""
+    old, document = YamlDocument.parse(text)
+    new = copy.deepcopy(old)
+    edit(new)
+    result = document.patch(old, new)
+    assert result is not None
+    return new, result.text()
+
+
+def set_gain(name, gain):
+    def edit(cfg):
+        cfg["filters"][name]["parameters"]["gain"] = gain
+    return edit
+
+
+@pytest.mark.parametrize("value", [
+    "a, b", "x: y", "#not a comment", "", "123", "1e3", "null", "true", "~", "it's", 'say "hi"',
+    "ünïcödé", " padded ", "- item", "[flow]", "{flow}", "*alias", "&anchor", "!tag", "back\\slash",
+])
+def test_special_strings_round_trip(value):
+    def edit(cfg):
+        cfg["devices"]["playback"]["device"] = value
+    new, text = patched(CONFIG, edit)
+    assert yaml.safe_load(text) == new
+    assert "# USB DAC" in text
+
+
+@pytest.mark.parametrize("value", ["a, b", "x: y", "", "true", "[flow]"])
+def test_special_strings_in_flow_sequence(value):
+    def edit(cfg):
+        cfg["pipeline"][0]["names"][1] = value
+    new, text = patched(CONFIG, edit)
+    assert yaml.safe_load(text) == new
+    assert "# both" in text
+
+
+def test_plain_string_stays_plain():
+    def edit(cfg):
+        cfg["devices"]["playback"]["type"] = "CoreAudio"
+    _, text = patched(CONFIG, edit)
+    assert "    type: CoreAudio\n" in text
+
+
+@pytest.mark.parametrize("name, gain", [
+    ("Bass", 3.5), ("Bass", -12), ("Bass", 2.0), ("Treble", 4), ("Treble", -1e-05), ("Treble", 1e20),
+])
+def test_int_and_float_gains_keep_their_type(name, gain):
+    new, text = patched(CONFIG, set_gain(name, gain))
+    loaded = yaml.safe_load(text)
+    assert loaded == new
+    read_back = loaded["filters"][name]["parameters"]["gain"]
+    assert type(read_back) is type(gain)
+
+
+def test_equal_int_and_float_leave_the_file_alone():
+    _, text = patched(CONFIG, set_gain("Bass", 0.0))
+    assert text == CONFIG
+
+
+def test_comments_and_layout_survive():
+    def edit(cfg):
+        set_gain("Bass", 6)(cfg)
+        set_gain("Treble", -3.25)(cfg)
+        cfg["devices"]["samplerate"] = 44100
+    new, text = patched(CONFIG, edit)
+    assert yaml.safe_load(text) == new
+    expected = (CONFIG.replace("gain: 0,", "gain: 6,")
+                .replace("gain: -2.5", "gain: -3.25")
+                .replace("samplerate: 48000", "samplerate: 44100"))
+    assert text == expected
+
+
+def test_flow_mapping_stays_flow():
+    new, text = patched(CONFIG, set_gain("Bass", -4.5))
+    assert "parameters: {type: Lowshelf, freq: 100, gain: -4.5, q: 0.7}  # flow style" in text
+    assert yaml.safe_load(text) == new
+
+
+def test_quoted_scalar_keeps_quotes():
+    def edit(cfg):
+        cfg["devices"]["playback"]["device"] = "hw:1,0"
+    _, text = patched(CONFIG, edit)
+    assert 'device: "hw:1,0"   # USB DAC' in text
+
+
+def test_patches_stack():
+    old, document = YamlDocument.parse(CONFIG)
+    new = copy.deepcopy(old)
+    for gain in (1, -2.5, 7.25):
+        set_gain("Bass", gain)(new)
+        document = document.patch(old, new)
+        assert document is not None
+        apply_changes(old, document.changes)
+        assert old == new
+    assert yaml.safe_load(document.text()) == new
+
+
+@pytest.mark.parametrize("edit", [
+    lambda cfg: cfg["filters"].update(Mid={"type": "Biquad"}),
+    lambda cfg: cfg["devices"].pop("chunksize"),
+    lambda cfg: cfg["pipeline"].append({"type": "Filter"}),
+    lambda cfg: cfg["devices"].update(samplerate={"rate": 48000}),
+    lambda cfg: cfg["devices"].update(playback=cfg["devices"]["playback"]["type"]),
+    lambda cfg: cfg["devices"].update(chunksize=[256]),
+])
+def test_structural_changes_need_a_full_dump(edit):
+    old, document = YamlDocument.parse(CONFIG)
+    new = copy.deepcopy(old)
+    edit(new)
+    assert document.patch(old, new) is None
+
+
+@pytest.mark.parametrize("edit", [
+    lambda cfg: cfg.update({key: cfg.pop(key) for key in ("devices", "filters")}),
+    lambda cfg: cfg.update(filters={"Treble": cfg["filters"]["Treble"], "Bass": cfg["filters"]["Bass"]}),
+])
+def test_reordered_keys_need_a_full_dump(edit):
+    old, document = YamlDocument.parse(CONFIG)
+    new = copy.deepcopy(old)
+    edit(new)
+    assert new == old
+    assert document.patch(old, new) is None
+
+
+def test_aliases_need_a_full_dump():
+    text = "a: &shared\n  gain: 1\nb: *shared\n"
+    old, document = YamlDocument.parse(text)
+    new = copy.deepcopy(old)
+    new["a"]["gain"] = 2
+    assert document.patch(old, new) is None
+
+
+def test_block_scalars_need_a_full_dump():
+    text = "description: |\n  first\n  second\ngain: 1\n"
+    old, document = YamlDocument.parse(text)
+    new = copy.deepcopy(old)
+    new["description"] = "other"
+    assert document.patch(old, new) is None
+
+
+def test_new_top_level_keys_are_appended():
+    def edit(cfg):
+        set_gain("Bass", 2)(cfg)
+        cfg["mixers"] = {}
+        cfg["processors"] = {}
+    new, text = patched(CONFIG, edit)
+    assert yaml.safe_load(text) == new
+    assert text == CONFIG.replace("gain: 0,", "gain: 2,") + "mixers: {}\nprocessors: {}\n"
+
+
+def test_appended_keys_stack_and_are_copied():
+    old, document = YamlDocument.parse(CONFIG.rstrip("\n") + "\n# trailing comment")
+    new = copy.deepcopy(old)
+    new["mixers"] = {}
+    document = document.patch(old, new)
+    apply_changes(old, document.changes)
+    new["mixers"]["Stereo"] = {"channels": {"in": 2, "out": 2}}
+    assert old["mixers"] == {}
+    new["title"] = "EQ"
+    assert document.patch(old, new) is None
+    del new["mixers"]["Stereo"]
+    document = document.patch(old, new)
+    apply_changes(old, document.changes)
+    assert old == new
+    text = document.text()
+    assert text.endswith("# trailing comment\nmixers: {}\ntitle: EQ\n")
+    assert yaml.safe_load(text) == new
+
+
+@pytest.mark.parametrize("text", [
+    "{devices: {chunksize: 256}}\n",
+    "devices:\n  chunksize: 256\n...\n",
+    "  devices:\n    chunksize: 256\n",
+])
+def test_appending_needs_a_plain_block_mapping(text):
+    old, document = YamlDocument.parse(text)
+    new = copy.deepcopy(old)
+    new["mixers"] = {}
+    assert document.patch(old, new) is None